@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures coursera_autograder commands end to end against the local API
+simulator (see simulator.py), reporting the latency percentiles and throughput
+of each command, and of the requests it made to each endpoint.
+
+    PYTHONPATH=. python benchmarks/end_to_end.py [--runs N] \
+        [--upload-mb MB] [--latency MS] [--bandwidth KBPS] \
+        [--error-rate RATE] ... [SCENARIO ...]
+
+The commands run in this process (as `coursera_autograder` would run them),
+so the times exclude the interpreter's start-up (see startup.py). The OAuth2
+token is refreshed once, through the simulated token endpoint, and then
+reused from its cache, as it would be on an instructor's machine.
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+from coursera_autograder.commands import output
+from coursera_autograder.commands import timings
+from simulator import add_simulator_arguments
+from simulator import simulator_from_args
+
+COURSE = 'COURSE_ID'
+ITEM = 'ITEM_ID'
+PART = 'PART_ID'
+
+# The arguments of each scenario (after the endpoint options), given the
+# path of the file to upload and the id of an existing grader.
+SCENARIOS = {
+    'upload': lambda image, grader: [
+        'upload', image, COURSE, ITEM, PART, '--force'],
+    'upload_resumable': lambda image, grader: [
+        'upload', image, COURSE, ITEM, PART, '--force', '--resumable',
+        '--chunk-size', '4'],
+    'list_graders': lambda image, grader: ['list_graders', COURSE],
+    'get_status': lambda image, grader: ['get_status', COURSE, grader],
+    'get_resource_limits': lambda image, grader: [
+        'get_resource_limits', COURSE, ITEM, PART],
+    'update_resource_limits': lambda image, grader: [
+        'update_resource_limits', COURSE, ITEM, PART,
+        '--grader-memory-limit', '8192'],
+}
+
+
+def summary(seconds):
+    "The 50th, 90th and 99th percentile of durations, in milliseconds."
+    return ['%.1f' % (timings.percentile(seconds, p) * 1000)
+            for p in (50, 90, 99)]
+
+
+def run_command(argv):
+    "Runs a coursera_autograder command in process, returning its status."
+    from coursera_autograder import main as cli
+
+    args = cli.build_parser(cli.requested_subcommands(argv)).parse_args(argv)
+    args.setup_logging(args)
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        try:
+            return args.func(args) or 0
+        except Exception:
+            logging.debug('%s failed.', argv[0], exc_info=True)
+            return 1
+
+
+def seed_token_cache(config_file):
+    "Caches an expired token, so that it is refreshed by the simulator."
+    from coursera_autograder.commands import oauth2
+
+    args = argparse.Namespace(config=config_file)
+    oauth2.build_oauth2(args).token_cache = {
+        'token': 'expired', 'expires': 0.0, 'refresh': 'refresh-token'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scenarios', nargs='*', default=sorted(SCENARIOS),
+                        metavar='SCENARIO',
+                        help='The commands to measure: %s. (Default: all)' %
+                             ', '.join(sorted(SCENARIOS)))
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--upload-mb', type=float, default=16,
+                        help='Size of the file uploaded.')
+    parser.add_argument('--graders', type=int, default=50,
+                        help='Number of graders in the course.')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Show what the commands log.')
+    add_simulator_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: %s' % ', '.join(sorted(unknown)))
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    tmp_dir = tempfile.mkdtemp(prefix='coursera-benchmark-')
+    try:
+        with simulator_from_args(args) as simulator:
+            config_file = os.path.join(tmp_dir, 'coursera_autograder.cfg')
+            with open(config_file, 'w') as f:
+                f.write(simulator.configuration(
+                    os.path.join(tmp_dir, 'oauth2_cache.json'),
+                    os.path.join(tmp_dir, 'token_agent.sock')))
+            seed_token_cache(config_file)
+
+            image = os.path.join(tmp_dir, 'grader.zip')
+            upload_size = int(args.upload_mb * 1024 * 1024)
+            with open(image, 'wb') as f:
+                f.write(os.urandom(upload_size))
+            grader = simulator.add_grader(COURSE, 'grader.zip')
+            for i in range(args.graders - 1):
+                simulator.add_grader(COURSE, 'grader-%d.zip' % i)
+            state_options = [
+                '--upload-ledger', os.path.join(tmp_dir, 'ledger.jsonl'),
+                '--upload-session-dir', os.path.join(tmp_dir, 'uploads'),
+                '--poll-interval', '0.05', '--progress-interval', '0.1']
+
+            rows = []
+            for scenario in args.scenarios:
+                command = SCENARIOS[scenario](image, grader)
+                argv = (['-c', config_file, '-qq'] + command +
+                        simulator.endpoint_arguments()[command[0]])
+                if command[0] == 'upload':
+                    argv += state_options
+                seconds = []
+                failures = 0
+                start = time.time()
+                for _ in range(args.runs):
+                    run_start = time.perf_counter()
+                    if run_command(argv) != 0:
+                        failures += 1
+                    seconds.append(time.perf_counter() - run_start)
+                elapsed = time.time() - start
+                throughput = '%.1f/s' % (args.runs / elapsed)
+                if command[0] == 'upload':
+                    throughput += ', %.1f MB/s' % (
+                        upload_size * args.runs / elapsed / 1048576.0)
+                rows.append([scenario, str(args.runs), str(failures)] +
+                            summary(seconds) + [throughput])
+
+            endpoints = {}
+            for (endpoint, status, seconds) in simulator.requests:
+                endpoints.setdefault(endpoint, []).append((status, seconds))
+            endpoint_rows = [
+                [endpoint, str(len(handled)),
+                 str(sum(1 for (status, _) in handled
+                         if status is None or status >= 400))] +
+                summary([seconds for (_, seconds) in handled])
+                for (endpoint, handled) in sorted(endpoints.items())]
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    sys.stdout.write(output.format_table(
+        ['COMMAND', 'RUNS', 'FAILED', 'P50 MS', 'P90 MS', 'P99 MS',
+         'THROUGHPUT'], rows))
+    sys.stdout.write('\n')
+    sys.stdout.write(output.format_table(
+        ['ENDPOINT', 'REQUESTS', 'ERRORS', 'P50 MS', 'P90 MS', 'P99 MS'],
+        endpoint_rows))
+    return 1 if any(row[2] != '0' for row in rows) and \
+        not args.error_rate else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
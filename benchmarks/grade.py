@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the local grading pipeline (`grade local`), phase by phase: creating
+and starting the container, running the grader, copying its output out with
+get_archive, retrieving its logs and validating its feedback.
+
+    PYTHONPATH=. python benchmarks/grade.py [--runs N] [--submissions N] \
+        [--warm] [--json] [--max-p50 PHASE=SECONDS ...] [IMAGE ...]
+
+Small test images (see IMAGES) are built from --base-image, and each grades
+a set of synthetic submissions --runs times, with the result cache disabled.
+The percentiles of each phase are reported per image. With --max-p50, exits
+with a non-zero status if the median of a phase exceeds its limit, so that it
+can guard against regressions. Requires a docker daemon.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import os.path
+import shutil
+import sys
+import tarfile
+import tempfile
+
+from coursera_autograder.commands import grade
+from coursera_autograder.commands import timings
+from coursera_autograder import utils
+
+# The grader scripts of the test images. Each writes its feedback to
+# /shared/feedback.json, scoring the submission by its number of files.
+IMAGES = {
+    # Does as little as possible.
+    'minimal': '''
+        n=$(ls /shared/submission | wc -l)
+        echo "{\\"fractionalScore\\": 1, \\"feedback\\": \\"$n files\\"}" \\
+            > /shared/feedback.json
+        ''',
+    # Writes a lot to standard output and error.
+    'chatty': '''
+        i=0
+        while [ $i -lt 2000 ]; do
+            echo "test $i passed: $(cat /shared/submission/* | wc -c) bytes"
+            echo "warning $i" >&2
+            i=$((i + 1))
+        done
+        echo '{"fractionalScore": 0.5, "feedback": "Chatty"}' \\
+            > /shared/feedback.json
+        ''',
+    # Leaves many artifacts in /shared, copied out with --extract.
+    'artifacts': '''
+        mkdir -p /shared/artifacts
+        for f in /shared/submission/*; do
+            i=0
+            while [ $i -lt 20 ]; do
+                cp "$f" "/shared/artifacts/$(basename $f).$i"
+                i=$((i + 1))
+            done
+        done
+        echo '{"isCorrect": true, "feedback": "Artifacts"}' \\
+            > /shared/feedback.json
+        ''',
+}
+
+EXTRACT = {
+    'artifacts': ['artifacts/*'],
+}
+
+
+def build_image(docker, name, base_image):
+    "Builds the test image, returning its tag."
+    tag = 'coursera-autograder-benchmark:%s' % name
+    dockerfile = (
+        'FROM %s\n'
+        'COPY grader.sh /grader/grader.sh\n'
+        'ENTRYPOINT ["/bin/sh", "/grader/grader.sh"]\n' % base_image)
+    context = io.BytesIO()
+    with tarfile.open(fileobj=context, mode='w') as tar:
+        for (file_name, content) in (('Dockerfile', dockerfile),
+                                     ('grader.sh', IMAGES[name])):
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(file_name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    context.seek(0)
+    for line in docker.build(fileobj=context, custom_context=True, tag=tag,
+                             rm=True, decode=True):
+        if 'error' in line:
+            raise Exception('Could not build %s: %s' % (tag, line['error']))
+    return tag
+
+
+def write_submissions(src_dir, count):
+    '''
+    Writes synthetic submissions of growing size to src_dir, returning their
+    directories.
+    '''
+    submissions = []
+    for i in range(count):
+        submission_dir = os.path.join(src_dir, 'submission-%d' % i)
+        os.makedirs(submission_dir)
+        for j in range(i + 1):
+            with open(os.path.join(submission_dir, 'part%d.py' % j), 'w') as f:
+                f.write('# Part %d of submission %d\n' % (j, i) +
+                        'print("hello")\n' * (100 * (i + 1)))
+        submissions.append(submission_dir)
+    return submissions
+
+
+def grade_once(args, tag, submission_dir, dst_dir):
+    "Grades the submission, returning the timings of the run."
+    from coursera_autograder import main as cli
+
+    argv = ['-qq', 'grade', 'local', '--no-cache', '--dst-dir', dst_dir]
+    if args.docker_url:
+        argv[:0] = ['--docker-url', args.docker_url]
+    if args.warm:
+        argv.append('--warm')
+    for pattern in EXTRACT.get(tag.split(':')[-1], []):
+        argv += ['--extract', pattern]
+    argv += [tag, submission_dir, '{}']
+    grade_args = cli.build_parser(
+        cli.requested_subcommands(argv)).parse_args(argv)
+    timer = timings.PhaseTimings()
+    try:
+        grade.command_grade_local(grade_args, timer)
+    except SystemExit:
+        logging.warning('Grading %s with %s failed.', submission_dir, tag)
+    return timer.as_dict()
+
+
+def check_limits(summaries, limits):
+    "Returns the (image, phase, median, limit) of phases over their limit."
+    slow = []
+    for image, summary in summaries.items():
+        for (phase, limit) in limits:
+            if phase in summary and summary[phase]['p50'] > limit:
+                slow.append((image, phase, summary[phase]['p50'], limit))
+    return slow
+
+
+def phase_limit(value):
+    try:
+        phase, seconds = value.split('=')
+        return (phase, float(seconds))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            '%s is not of the form PHASE=SECONDS' % value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('images', nargs='*', default=sorted(IMAGES),
+                        metavar='IMAGE',
+                        help='The test images to grade with: %s. '
+                             '(Default: all)' % ', '.join(sorted(IMAGES)))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--submissions', type=int, default=5,
+                        help='Number of synthetic submissions.')
+    parser.add_argument('--warm', action='store_true',
+                        help='Grade in warm containers (see grade --warm).')
+    parser.add_argument('--base-image', default='busybox:latest')
+    parser.add_argument('--json', action='store_true',
+                        help='Write the summary as a JSON document.')
+    parser.add_argument('--max-p50', type=phase_limit, action='append',
+                        default=[], metavar='PHASE=SECONDS')
+    parser.add_argument('--docker-url', default=None)
+    args = parser.parse_args()
+    unknown = set(args.images) - set(IMAGES)
+    if unknown:
+        parser.error('unknown images: %s' % ', '.join(sorted(unknown)))
+    logging.basicConfig(level=logging.WARNING)
+
+    docker = utils.docker_client(argparse.Namespace(
+        docker_url=args.docker_url, strict_docker_tls=False, timeout=60))
+    tmp_dir = tempfile.mkdtemp(prefix='coursera-grade-benchmark-')
+    summaries = {}
+    try:
+        submissions = write_submissions(os.path.join(tmp_dir, 'src'),
+                                        args.submissions)
+        for image in args.images:
+            tag = build_image(docker, image, args.base_image)
+            runs = []
+            for run in range(args.runs):
+                for submission_dir in submissions:
+                    dst_dir = os.path.join(tmp_dir, 'dst', image, str(run),
+                                           os.path.basename(submission_dir))
+                    os.makedirs(dst_dir)
+                    runs.append(grade_once(args, tag, submission_dir,
+                                           dst_dir))
+            summaries[image] = timings.summarize(runs)
+            if not args.json:
+                print('%s (%d gradings%s):' % (
+                    image, len(runs), ', warm' if args.warm else ''))
+                timings.write_summary(runs, 'text', sys.stdout)
+                print()
+        if args.warm:
+            grade.warm_pool.clear_pool(docker)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    slow = check_limits(summaries, args.max_p50)
+    for (image, phase, median, limit) in slow:
+        print('%s: the median %s phase took %.3f s (limit: %.3f s)' % (
+            image, phase, median, limit))
+    return 1 if slow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
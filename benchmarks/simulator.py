@@ -0,0 +1,588 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A local stand-in for the Coursera, Transloadit and OAuth2 APIs used by
+coursera_autograder, for measuring its performance reproducibly, offline.
+
+    python benchmarks/simulator.py [--port PORT] [--latency MS] \
+        [--jitter MS] [--bandwidth KBPS] [--error-rate RATE] \
+        [--error-path PREFIX ...] [--processing-time SECONDS]
+
+Every request waits --latency (plus up to --jitter) milliseconds before it is
+handled, and request and response bodies are sent at no more than --bandwidth
+KB/s per request. A fraction --error-rate of the requests (to paths
+starting with one of the --error-path prefixes, if given) are answered with
+--error-status instead. The random choices are seeded with --seed.
+
+The endpoints served (see Simulator.endpoint_arguments for the matching
+command line options) are:
+
+ - /oauth2/v1/auth: authorizes the app at once, redirecting the browser.
+ - /oauth2/v1/token: the OAuth2 token endpoint, for any grant.
+ - /instances/bored: Transloadit's bored instances API, returning itself.
+ - /assemblies/ID: Transloadit assemblies, uploaded to as multipart forms or
+   created for a tus upload to /resumable/files/. Assemblies complete
+   --processing-time seconds after their file has been received, reporting
+   the file's MD5 and size.
+ - /api/gridExecutorBuildAttempts.v1: registers graders.
+ - /api/gridExecutors.v1/: lists graders, and gets their status.
+ - /api/authoringProgrammingAssignments.v3: updates assignment parts, and
+   gets and updates their resource limits.
+"""
+
+import argparse
+import base64
+import collections
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+DEFAULT_LIMITS = {
+    'reservedCpu': 1024,
+    'reservedMemory': 4096,
+    'wallClockTimeout': 1200,
+}
+
+READ_SIZE = 64 * 1024
+
+
+class Throttle(object):
+    "Paces the bytes of a request or response to at most `rate` per second."
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.start = time.time()
+        self.sent = 0
+
+    def __call__(self, size):
+        if not self.rate:
+            return
+        self.sent += size
+        delay = self.start + float(self.sent) / self.rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Assembly(object):
+    "A Transloadit assembly, holding the checksum of its uploaded file."
+
+    def __init__(self, processing_time):
+        self.processing_time = processing_time
+        self.md5 = hashlib.md5()
+        self.received = 0
+        self.expected = None
+        self.completed = None
+        self.key = '%s/%s' % (uuid.uuid4().hex, 'grader.zip')
+
+    def receive(self, data):
+        self.md5.update(data)
+        self.received += len(data)
+
+    def complete(self, file_name=None):
+        if file_name:
+            self.key = '%s/%s' % (self.key.split('/')[0], file_name)
+        self.completed = time.time()
+
+    def status(self, url):
+        body = {'assembly_ssl_url': url, 'bytes_received': self.received,
+                'bytes_expected': self.expected or self.received}
+        if self.completed is None:
+            body['ok'] = 'ASSEMBLY_UPLOADING'
+        elif time.time() < self.completed + self.processing_time:
+            body['ok'] = 'ASSEMBLY_EXECUTING'
+        else:
+            body['ok'] = 'ASSEMBLY_COMPLETED'
+            body['results'] = {':original': [{
+                'ssl_url': 'https://simulator.s3.amazonaws.com/' + self.key,
+                'md5hash': self.md5.hexdigest(),
+                'size': self.received,
+            }]}
+        return body
+
+
+class Simulator(object):
+    '''
+    The simulated APIs, served on localhost from a thread. Requests handled
+    are recorded in `requests`, as (endpoint, status, seconds) tuples, where
+    seconds includes the simulated latency.
+    '''
+
+    def __init__(self, port=0, latency=0, jitter=0, bandwidth=None,
+                 error_rate=0, error_status=503, error_paths=None,
+                 processing_time=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_paths = error_paths or []
+        self.processing_time = processing_time
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.assemblies = {}
+        self.tus_uploads = {}
+        self.graders = collections.defaultdict(list)
+        self.statuses = {}
+        self.limits = {}
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port),
+                                         _make_handler(self))
+        self.httpd.daemon_threads = True
+        self.host = '127.0.0.1:%d' % self.httpd.server_port
+        self.url = 'http://' + self.host
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def endpoint_arguments(self):
+        "The command line options of each subcommand pointing it here."
+        api = self.url + '/api/'
+        assignments = api + 'authoringProgrammingAssignments.v3'
+        return {
+            'upload': [
+                '--transloadit-bored-api', self.url + '/instances/bored',
+                '--register-endpoint', api + 'gridExecutorBuildAttempts.v1',
+                '--update-part-endpoint', assignments],
+            'list_graders': [
+                '--listGrader-endpoint',
+                api + 'gridExecutors.v1/?q=listByBranch&branchId='],
+            'get_status': [
+                '--getGraderStatus-endpoint', api + 'gridExecutors.v1/'],
+            'get_resource_limits': [
+                '--getGraderResourceLimits-endpoint',
+                assignments + '/?action=getGraderResourceLimits'],
+            'update_resource_limits': [
+                '--updateGraderResourceLimits-endpoint',
+                assignments + '/?action=updateGraderResourceLimits',
+                '--getGraderResourceLimits-endpoint',
+                assignments + '/?action=getGraderResourceLimits'],
+        }
+
+    def configuration(self, token_cache, token_agent_socket):
+        "A configuration file (see --config) using the simulated OAuth2 API."
+        return (
+            '[oauth2]\n'
+            'auth_endpoint = %(url)s/oauth2/v1/auth\n'
+            'token_endpoint = %(url)s/oauth2/v1/token\n'
+            'token_cache = %(token_cache)s\n'
+            'token_agent_socket = %(token_agent_socket)s\n' % {
+                'url': self.url,
+                'token_cache': token_cache,
+                'token_agent_socket': token_agent_socket,
+            })
+
+    def add_grader(self, course, filename, status='COMPLETED'):
+        "Adds a grader to the course, returning its id."
+        grader_id = uuid.uuid4().hex[:22]
+        with self.lock:
+            self.graders[course].append({
+                'id': '%s~%s' % (course, grader_id),
+                'filename': filename,
+            })
+            self.statuses['%s~%s' % (course, grader_id)] = status
+        return grader_id
+
+    def record(self, endpoint, status, seconds):
+        with self.lock:
+            self.requests.append((endpoint, status, seconds))
+
+    def delay(self):
+        "The latency to add to a request."
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter)
+        return self.latency + jitter
+
+    def inject_error(self, path):
+        if not self.error_rate:
+            return False
+        if self.error_paths and not any(path.startswith(prefix)
+                                        for prefix in self.error_paths):
+            return False
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+def _make_handler(simulator):
+    "Builds the request handler class serving the simulator's endpoints."
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        # Bodies.
+
+        def body_chunks(self):
+            "Yields the request body, throttled, however it is encoded."
+            throttle = self.throttle
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    if size == 0:
+                        while self.rfile.readline() not in (b'\r\n', b''):
+                            pass
+                        return
+                    remaining = size
+                    while remaining:
+                        data = self.rfile.read(min(remaining, READ_SIZE))
+                        if not data:
+                            return
+                        throttle(len(data))
+                        remaining -= len(data)
+                        yield data
+                    self.rfile.readline()
+            else:
+                remaining = int(self.headers.get('Content-Length') or 0)
+                while remaining:
+                    data = self.rfile.read(min(remaining, READ_SIZE))
+                    if not data:
+                        return
+                    throttle(len(data))
+                    remaining -= len(data)
+                    yield data
+
+        def body(self):
+            if self.body_read:
+                return b''
+            self.body_read = True
+            return b''.join(self.body_chunks())
+
+        def json_body(self):
+            try:
+                return json.loads(self.body().decode('utf-8'))
+            except ValueError:
+                return {}
+
+        def reply(self, status, body=None, headers=None):
+            if not self.body_read:
+                self.body()
+            data = (json.dumps(body).encode('utf-8')
+                    if body is not None else b'')
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if body is not None:
+                self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            for start in range(0, len(data), READ_SIZE):
+                chunk = data[start:start + READ_SIZE]
+                self.throttle(len(chunk))
+                self.wfile.write(chunk)
+            self.status = status
+
+        # Dispatch.
+
+        def handle_method(self):
+            start = time.time()
+            self.throttle = Throttle(simulator.bandwidth)
+            self.body_read = False
+            self.status = None
+            url = urllib.parse.urlsplit(self.path)
+            self.query = dict(urllib.parse.parse_qsl(url.query))
+            path = url.path
+            endpoint = 'unknown'
+            time.sleep(simulator.delay())
+            try:
+                for (method, prefix, name, handler) in ROUTES:
+                    if method == self.command and path.startswith(prefix):
+                        endpoint = name
+                        if simulator.inject_error(path):
+                            self.reply(simulator.error_status,
+                                       {'errorCode': 'Simulated'})
+                        else:
+                            handler(self, path[len(prefix):])
+                        break
+                else:
+                    self.reply(404, {'errorCode': 'NotFound'})
+            finally:
+                simulator.record('%s %s' % (self.command, endpoint),
+                                 self.status, time.time() - start)
+
+        do_GET = do_POST = do_HEAD = do_PATCH = handle_method
+
+        # OAuth2.
+
+        def authorize(self, _):
+            "Authorizes the app straight away, redirecting with a code."
+            location = '%s?%s' % (self.query.get('redirect_uri', ''),
+                                  urllib.parse.urlencode({
+                                      'code': uuid.uuid4().hex,
+                                      'state': self.query.get('state', ''),
+                                  }))
+            self.reply(302, headers={'Location': location})
+
+        def token(self, _):
+            self.body()
+            self.reply(200, {'access_token': uuid.uuid4().hex,
+                             'token_type': 'bearer',
+                             'expires_in': 3600,
+                             'refresh_token': uuid.uuid4().hex})
+
+        # Transloadit.
+
+        def bored(self, _):
+            self.reply(200, {'ok': 'BORED_INSTANCE_FOUND',
+                             'host': simulator.host})
+
+        def assembly_url(self, assembly_id):
+            return '%s/assemblies/%s' % (simulator.url, assembly_id)
+
+        def create_assembly(self, assembly_id):
+            with simulator.lock:
+                assembly = simulator.assemblies.setdefault(
+                    assembly_id, Assembly(simulator.processing_time))
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('multipart/form-data'):
+                boundary = content_type.split('boundary=')[1].strip('"')
+                self.receive_multipart(assembly, boundary.encode('ascii'))
+                assembly.complete()
+                self.reply(200, assembly.status(
+                    self.assembly_url(assembly_id)))
+            else:
+                self.body()
+                body = assembly.status(self.assembly_url(assembly_id))
+                body['tus_url'] = simulator.url + '/resumable/files/'
+                self.reply(200, body)
+
+        def receive_multipart(self, assembly, boundary):
+            '''
+            Streams the file field (the last field of the form) of a
+            multipart request body into the assembly.
+            '''
+            closing = b'\r\n--' + boundary
+            buffered = b''
+            in_file = False
+            for data in self.body_chunks():
+                buffered += data
+                if not in_file:
+                    field = buffered.find(b'name="file"')
+                    if field < 0:
+                        continue
+                    start = buffered.find(b'\r\n\r\n', field)
+                    if start < 0:
+                        continue
+                    buffered = buffered[start + 4:]
+                    in_file = True
+                # Hold back what may be the closing boundary.
+                keep = len(closing) + 8
+                if len(buffered) > keep:
+                    assembly.receive(buffered[:-keep])
+                    buffered = buffered[-keep:]
+            self.body_read = True
+            end = buffered.rfind(closing)
+            assembly.receive(buffered[:end] if end >= 0 else buffered)
+
+        def get_assembly(self, assembly_id):
+            assembly = simulator.assemblies.get(assembly_id)
+            if assembly is None:
+                self.reply(404, {'error': 'ASSEMBLY_NOT_FOUND'})
+            else:
+                self.reply(200, assembly.status(
+                    self.assembly_url(assembly_id)))
+
+        # tus.
+
+        def create_tus_upload(self, _):
+            metadata = {}
+            for pair in self.headers.get('Upload-Metadata', '').split(','):
+                if ' ' in pair:
+                    key, value = pair.split(' ', 1)
+                    metadata[key] = base64.b64decode(value).decode('utf-8')
+            assembly_id = metadata.get('assembly_url', '').rsplit('/', 1)[-1]
+            assembly = simulator.assemblies.get(assembly_id)
+            if assembly is None:
+                self.reply(400, {'error': 'ASSEMBLY_NOT_FOUND'})
+                return
+            if self.headers.get('Upload-Length') is not None:
+                assembly.expected = int(self.headers['Upload-Length'])
+            upload_id = uuid.uuid4().hex
+            with simulator.lock:
+                simulator.tus_uploads[upload_id] = (
+                    assembly, metadata.get('filename'))
+            self.reply(201, headers={'Location': upload_id,
+                                     'Tus-Resumable': '1.0.0'})
+
+        def tus_offset(self, upload_id):
+            upload = simulator.tus_uploads.get(upload_id)
+            if upload is None:
+                self.reply(404)
+            else:
+                self.reply(200, headers={
+                    'Upload-Offset': str(upload[0].received),
+                    'Tus-Resumable': '1.0.0'})
+
+        def tus_patch(self, upload_id):
+            upload = simulator.tus_uploads.get(upload_id)
+            if upload is None:
+                self.reply(404)
+                return
+            assembly, file_name = upload
+            if int(self.headers['Upload-Offset']) != assembly.received:
+                self.reply(409)
+                return
+            for data in self.body_chunks():
+                assembly.receive(data)
+            self.body_read = True
+            if self.headers.get('Upload-Length') is not None:
+                assembly.expected = int(self.headers['Upload-Length'])
+            if assembly.received == assembly.expected:
+                assembly.complete(file_name)
+            self.reply(204, headers={'Upload-Offset': str(assembly.received),
+                                     'Tus-Resumable': '1.0.0'})
+
+        # Coursera.
+
+        def register(self, _):
+            request = self.json_body()
+            try:
+                course = request['context']['definition']['branchId']
+                key = request['key']
+            except (KeyError, TypeError):
+                self.reply(400, {'errorCode': 'InvalidRequest'})
+                return
+            grader_id = simulator.add_grader(course, key.split('/')[-1])
+            self.reply(201, {'elements': [
+                {'id': '%s~%s' % (course, grader_id)}]})
+
+        def graders(self, course_grader_id):
+            if not course_grader_id:
+                course = self.query.get('branchId')
+                self.reply(200, {'elements': list(simulator.graders[course])})
+            elif course_grader_id in simulator.statuses:
+                self.reply(200, {'elements': [{
+                    'id': course_grader_id,
+                    'status': simulator.statuses[course_grader_id]}]})
+            else:
+                self.reply(404, {'errorCode': 'NotFound'})
+
+        def assignments(self, _):
+            action = self.query.get('action')
+            part = (self.query.get('id'), self.query.get('partId'))
+            if action == 'setGridExecutorId':
+                self.reply(200, {})
+            elif action == 'getGraderResourceLimits':
+                self.reply(200, simulator.limits.get(part, DEFAULT_LIMITS))
+            elif action == 'updateGraderResourceLimits':
+                changes = self.json_body()
+                with simulator.lock:
+                    limits = dict(simulator.limits.get(part, DEFAULT_LIMITS))
+                    limits.update((field, value)
+                                  for (field, value) in changes.items()
+                                  if value is not None)
+                    simulator.limits[part] = limits
+                self.reply(200, limits)
+            else:
+                self.reply(400, {'errorCode': 'UnknownAction'})
+
+    H = Handler
+    ROUTES = [
+        ('GET', '/oauth2/v1/auth', 'oauth2 authorize', H.authorize),
+        ('POST', '/oauth2/v1/token', 'oauth2 token', H.token),
+        ('GET', '/instances/bored', 'transloadit bored', H.bored),
+        ('POST', '/assemblies/', 'transloadit assembly', H.create_assembly),
+        ('GET', '/assemblies/', 'transloadit status', H.get_assembly),
+        ('POST', '/resumable/files/', 'tus create', H.create_tus_upload),
+        ('HEAD', '/resumable/files/', 'tus offset', H.tus_offset),
+        ('PATCH', '/resumable/files/', 'tus patch', H.tus_patch),
+        ('POST', '/api/gridExecutorBuildAttempts.v1', 'register grader',
+         H.register),
+        ('GET', '/api/gridExecutors.v1/', 'graders', H.graders),
+        ('POST', '/api/authoringProgrammingAssignments.v3', 'assignments',
+         H.assignments),
+    ]
+    return Handler
+
+
+def add_simulator_arguments(parser):
+    "Adds the options configuring the simulated network to the parser."
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Milliseconds added to every request.')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='Up to this many more milliseconds, at random.')
+    parser.add_argument('--bandwidth', type=float,
+                        help='KB/s per request. (Default: unlimited)')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Fraction of requests answered with an error.')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--error-path', action='append',
+                        help='Only inject errors on paths starting with this '
+                             'prefix. Can be given several times.')
+    parser.add_argument('--processing-time', type=float, default=0,
+                        help='Seconds an assembly takes to process its file.')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def simulator_from_args(args, port=0):
+    return Simulator(
+        port=port,
+        latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0,
+        bandwidth=args.bandwidth * 1024 if args.bandwidth else None,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        error_paths=args.error_path,
+        processing_time=args.processing_time,
+        seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8080)
+    add_simulator_arguments(parser)
+    args = parser.parse_args()
+
+    simulator = simulator_from_args(args, args.port).start()
+    print('Serving on %s. Configuration file (pass it with --config):\n' %
+          simulator.url)
+    print(simulator.configuration('/tmp/simulator_oauth2_cache.json',
+                                  '/tmp/simulator_token_agent.sock'))
+    print('Command line options:')
+    options = simulator.endpoint_arguments()
+    for subcommand in sorted(options):
+        print('  %s %s' % (subcommand, ' '.join(options[subcommand])))
+    try:
+        simulator.thread.join()
+    except KeyboardInterrupt:
+        simulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
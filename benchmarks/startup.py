@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how long coursera_autograder takes to start up, i.e. to import and
+build the argument parser for a subcommand, in a fresh interpreter each time.
+
+    PYTHONPATH=. python benchmarks/startup.py [--runs N] [--max-ms MS] \
+        [SUBCOMMAND ...]
+
+With --max-ms, exits with a non-zero status if the median start-up time of any
+subcommand exceeds the limit, so that it can guard against regressions.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STARTUP = ('from coursera_autograder import main; '
+           'main.build_parser(main.requested_subcommands(%r))')
+
+
+def time_process(code, runs):
+    "Returns the median time, in milliseconds, to run code in a new process."
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code])
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    from coursera_autograder import main as cli
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('subcommands', nargs='*',
+                        default=[name for (name, _) in cli.SUBCOMMANDS])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float)
+    args = parser.parse_args()
+
+    print('%-24s %8.1f ms' % ('(bare interpreter)',
+                              time_process('pass', args.runs)))
+
+    slow = []
+    for subcommand in args.subcommands + ['--help']:
+        median = time_process(STARTUP % ([subcommand], ), args.runs)
+        print('%-24s %8.1f ms' % (subcommand, median))
+        if args.max_ms is not None and median > args.max_ms:
+            slow.append(subcommand)
+
+    if slow:
+        print('Slower than %s ms: %s' % (args.max_ms, ', '.join(slow)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,12 +2,26 @@
 
 __all__ = [
     "upload",
+    "package",
     "grade",
     "get_resource_limits",
     "update_resource_limits",
     "config",
     "get_status",
-    "list_graders"
+    "list_graders",
+    "recommend_limits",
+    "validate_feedback"
 ]
 
-from . import *  # noqa
+# The command modules are not imported here: main imports only the module of
+# the subcommand being run, so that its dependencies alone are loaded. They
+# are still available as attributes of the package (e.g. commands.upload),
+# imported on first access.
+
+
+def __getattr__(name):
+    if name in __all__:
+        import importlib
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(
+        "module %r has no attribute %r" % (__name__, name))
@@ -21,6 +21,9 @@ You may install it from source, or via pip.
 """
 
 from coursera_autograder.commands import oauth2
+from coursera_autograder.commands import token_agent
+import argparse
+import logging
 import time
 import sys
 
@@ -51,6 +54,33 @@ def display_auth_cache(args):
             print("No refresh token found.")
 
 
+def run_token_agent(args):
+    '''
+    Runs a token agent, which keeps the OAuth2 access token in memory and
+    refreshes it in the background. While it runs, other commands get their
+    token from it instead of the token cache file. Stop it with Ctrl-C.
+    '''
+    oauth2_instance = oauth2.build_oauth2(args)
+    socket_path = oauth2_instance.token_agent_socket
+    if socket_path is None:
+        logging.error('No token agent socket is configured.')
+        return 1
+    # Make sure there is a token to serve, authorizing interactively if need
+    # be, before going into the background.
+    oauth2_instance.token_agent_socket = None
+    oauth2_instance.build_authorizer()
+
+    agent = token_agent.TokenAgent(oauth2_instance, socket_path)
+    if not args.quiet or args.quiet == 0:
+        print('Token agent listening on %s. Press Ctrl-C to stop.' %
+              agent.socket_path)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
 def parser(subparsers):
     "Build an argparse argument parser to parse the command line."
     # create the parser for the configure subcommand. (authentication / etc.)
@@ -68,6 +98,17 @@ def parser(subparsers):
         action='store_true',
         help='Do not truncate the keys [DANGER!!]')
 
+    parser_token_agent = config_subparsers.add_parser(
+        'token-agent',
+        help=run_token_agent.__doc__)
+    parser_token_agent.set_defaults(func=run_token_agent)
+    parser_token_agent.add_argument(
+        '--token-agent-socket',
+        default=argparse.SUPPRESS,
+        help='The Unix socket to listen on. (Default: the token_agent_socket '
+             'configured in the [oauth2] section, normally '
+             '~/.coursera/token_agent.sock)')
+
     if len(sys.argv) == 2 and sys.argv[1] == 'configure':
         parser_config.print_help(sys.stderr)
         sys.exit(1)
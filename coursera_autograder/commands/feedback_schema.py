@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+The feedback graders write to feedback.json, described as a schema, and a
+validator compiled from it.
+
+A schema maps each field of the feedback to its rules:
+
+ - type: 'decimal' (an int or a float, not a boolean), 'boolean', 'string'
+   or 'any'.
+ - required: whether the field must be present. `missing` is the error to
+   report when it is not.
+ - ignoredWith: another field, in whose presence this one is not checked.
+ - minimum, maximum: the bounds of a decimal, and finite whether it must be
+   a finite number.
+ - maxBytes: the maximum size of a string, once encoded in UTF-8.
+ - choices: the values a string may take.
+
+`oneOf` lists fields of which at least one must be present, and unless
+`additionalFields` is False, fields the schema does not list are allowed.
+compile_schema turns a schema into a function that checks a document against
+every rule and returns all the errors found, in the order of the schema.
+'''
+
+import json
+import math
+import os
+
+# The feedback format Coursera expects, as checked by `grade`.
+FEEDBACK_SCHEMA = {
+    'fields': [
+        ('fractionalScore', {'type': 'decimal', 'minimum': 0, 'maximum': 1}),
+        ('isCorrect', {'type': 'boolean', 'ignoredWith': 'fractionalScore'}),
+        ('feedback', {
+            'type': 'any',
+            'required': True,
+            'missing': "Field 'feedback' not present in parsed output.",
+        }),
+    ],
+    'oneOf': {
+        'fields': ['fractionalScore', 'isCorrect'],
+        'missing': "Required field 'fractionalScore' is missing.",
+    },
+}
+
+# The feedback types of the strict schema. Coursera renders the feedback as
+# plain text unless its type says otherwise.
+FEEDBACK_TYPES = ['HTML', 'MARKDOWN']
+
+# Stricter checks, for `validate_feedback --strict`: scores must be finite,
+# both score fields are checked, the feedback must be a string of one of the
+# FEEDBACK_TYPES, and no other fields may be present.
+STRICT_FEEDBACK_SCHEMA = {
+    'fields': [
+        ('fractionalScore', {'type': 'decimal', 'minimum': 0, 'maximum': 1,
+                             'finite': True}),
+        ('isCorrect', {'type': 'boolean'}),
+        ('feedback', {
+            'type': 'string',
+            'required': True,
+            'missing': "Field 'feedback' not present in parsed output.",
+        }),
+        ('feedbackType', {'type': 'string', 'choices': FEEDBACK_TYPES}),
+    ],
+    'oneOf': FEEDBACK_SCHEMA['oneOf'],
+    'additionalFields': False,
+}
+
+TYPE_ERRORS = {
+    'decimal': "Field '%s' must be a decimal.",
+    'boolean': "Field '%s' is not a boolean value.",
+    'string': "Field '%s' must be a string.",
+    'any': None,
+}
+
+
+def _is_decimal(value):
+    return type(value) in (int, float)
+
+
+def _is_boolean(value):
+    return type(value) is bool
+
+
+def _is_string(value):
+    return isinstance(value, str)
+
+
+def _is_any(value):
+    return True
+
+
+TYPE_CHECKS = {
+    'decimal': _is_decimal,
+    'boolean': _is_boolean,
+    'string': _is_string,
+    'any': _is_any,
+}
+
+
+def _compile_field(name, rules):
+    '''
+    Compiles the rules of a field into a function of its value that returns
+    the first error found, or None. Checks that do not apply to the field are
+    left out, so that validating does no more work than the rules call for.
+    '''
+    if rules['type'] not in TYPE_CHECKS:
+        raise ValueError("Unknown type of field '%s': %s" % (
+            name, rules['type']))
+    is_type = TYPE_CHECKS[rules['type']]
+    type_error = TYPE_ERRORS[rules['type']] and \
+        TYPE_ERRORS[rules['type']] % name
+    checks = []
+    if rules.get('finite'):
+        checks.append(lambda value: (
+            None if math.isfinite(value) else type_error))
+    if 'maximum' in rules:
+        maximum = rules['maximum']
+        checks.append(lambda value: (
+            "Field '%s' must be <= %s." % (name, maximum)
+            if value > maximum else None))
+    if 'minimum' in rules:
+        minimum = rules['minimum']
+        checks.append(lambda value: (
+            "Field '%s' must be >= %s." % (name, minimum)
+            if value < minimum else None))
+    if 'maxBytes' in rules:
+        max_bytes = rules['maxBytes']
+
+        def check_size(value):
+            # A character takes at most 4 bytes: skip encoding short strings.
+            if not isinstance(value, str) or len(value) * 4 <= max_bytes:
+                return None
+            size = len(value.encode('utf-8', 'surrogatepass'))
+            if size > max_bytes:
+                return "Field '%s' is %s bytes long, more than the limit " \
+                    "of %s." % (name, size, max_bytes)
+        checks.append(check_size)
+    if 'choices' in rules:
+        choices = frozenset(rules['choices'])
+        choices_error = "Field '%s' must be one of %s." % (
+            name, ', '.join(rules['choices']))
+        checks.append(lambda value: (
+            None if value in choices else choices_error))
+
+    def check_field(value):
+        if not is_type(value):
+            return type_error
+        for check in checks:
+            error = check(value)
+            if error is not None:
+                return error
+        return None
+    return check_field
+
+
+def compile_schema(schema):
+    '''
+    Compiles a schema (see FEEDBACK_SCHEMA) into a function that validates a
+    parsed document against it, and returns the list of errors found (empty
+    if the document is valid).
+    '''
+    fields = [(name, rules.get('required', False),
+               rules.get('missing',
+                         "Required field '%s' is missing." % name),
+               rules.get('ignoredWith'),
+               _compile_field(name, rules))
+              for (name, rules) in schema['fields']]
+    known = frozenset(name for (name, _) in schema['fields'])
+    one_of = schema.get('oneOf')
+    additional_fields = schema.get('additionalFields', True)
+
+    def validate(document):
+        if not isinstance(document, dict):
+            return ["The output must be a JSON object."]
+        errors = []
+        if one_of is not None and not any(
+                name in document for name in one_of['fields']):
+            errors.append(one_of['missing'])
+        for (name, required, missing, ignored_with, check_field) in fields:
+            if name in document:
+                if ignored_with is not None and ignored_with in document:
+                    continue
+                error = check_field(document[name])
+                if error is not None:
+                    errors.append(error)
+            elif required:
+                errors.append(missing)
+        if not additional_fields:
+            for name in sorted(set(document) - known):
+                errors.append("Unknown field '%s'." % name)
+        return errors
+    return validate
+
+
+validate_feedback = compile_schema(FEEDBACK_SCHEMA)
+
+
+def validate_feedback_file(file_name, validate=validate_feedback):
+    '''
+    Loads a feedback file and validates it. Returns the list of errors found
+    (empty if the feedback is valid).
+    '''
+    try:
+        with open(file_name, 'r') as json_file:
+            document = json.load(json_file)
+    except ValueError:
+        return ["The output was not a valid JSON document."]
+    return validate(document)
+
+
+def find_feedback_files(paths, file_name='feedback.json'):
+    '''
+    Lists the feedback files among the given paths: files are listed as is,
+    and directories are searched for files named `file_name`, recursively
+    (e.g. the destination directory of `grade batch`).
+    '''
+    found = []
+    for top in paths:
+        if not os.path.isdir(top):
+            found.append(top)
+            continue
+        for (directory, subdirectories, files) in os.walk(top):
+            subdirectories.sort()
+            if file_name in files:
+                found.append(os.path.join(directory, file_name))
+    return found
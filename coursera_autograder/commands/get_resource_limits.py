@@ -22,26 +22,27 @@ You may install it from source, or via pip.
 
 from coursera_autograder.commands import common
 from coursera_autograder.commands import oauth2
+from coursera_autograder.commands import output
 import logging
 import requests
 import urllib.parse
 
+RESOURCE_LIMIT_FIELDS = ['course', 'item', 'part', 'reservedCpu',
+                         'reservedMemory', 'wallClockTimeout']
 
-def command_get_resource_limits(args):
-    "Implements the get_resource_limits subcommand"
-
-    oauth2_instance = oauth2.build_oauth2(args)
-    auth = oauth2_instance.build_authorizer()
-
-    s = requests.Session()
-    s.auth = auth
 
-    course_branch_id = (args.course.replace("~", "!~")
-                        if "authoringBranch~" in args.course else args.course)
-    course_branch_item = '%s~%s' % (course_branch_id, args.item)
+def fetch_resource_limits(session, endpoint, course, item, part):
+    """
+    Retrieves the resource limits of an assignment part's grader. Returns the
+    response body, or None (after logging the reason) if the server did not
+    return it.
+    """
+    course_branch_id = (course.replace("~", "!~")
+                        if "authoringBranch~" in course else course)
+    course_branch_item = '%s~%s' % (course_branch_id, item)
 
-    params = 'id=%s&partId=%s' % (course_branch_item, args.part)
-    result = s.post(args.getGraderResourceLimits_endpoint, params=params)
+    params = 'id=%s&partId=%s' % (course_branch_item, part)
+    result = session.post(endpoint, params=params)
     if result.status_code == 404:
         logging.error(
             '\nUnable to find the part or grader with ' +
@@ -49,12 +50,12 @@ def command_get_resource_limits(args):
             'Status Code: 404 \n'
             'URL: %s \n'
             'Response: %s\n',
-            args.part,
-            args.item,
-            args.course,
+            part,
+            item,
+            course,
             result.url,
             result.text)
-        return 1
+        return None
     elif result.status_code != 200:
         logging.error(
             '\nUnable to get grader resources.\n'
@@ -64,15 +65,42 @@ def command_get_resource_limits(args):
             'Status Code: %d \n'
             'URL: %s \n'
             'Response: %s\n',
-            args.course,
-            args.item,
-            args.part,
+            course,
+            item,
+            part,
             result.status_code,
             result.url,
             result.text
         )
+        return None
+
+    return result.json()
+
+
+def command_get_resource_limits(args):
+    "Implements the get_resource_limits subcommand"
+
+    oauth2_instance = oauth2.build_oauth2(args)
+    auth = oauth2_instance.build_authorizer()
+
+    s = requests.Session()
+    s.auth = auth
+
+    limits = fetch_resource_limits(s, args.getGraderResourceLimits_endpoint,
+                                   args.course, args.item, args.part)
+    if limits is None:
         return 1
-    print(
+
+    row = {
+        'course': args.course,
+        'item': args.item,
+        'part': args.part,
+        'reservedCpu': (int(limits['reservedCpu'])/1024
+                        if 'reservedCpu' in limits else None),
+        'reservedMemory': limits.get('reservedMemory'),
+        'wallClockTimeout': limits.get('wallClockTimeout'),
+    }
+    text = (
         '\nResource Limits for grader with ' +
         'part id %s in item %s in course %s:\n'
         'Reserved CPU (vCPUs): %s\n'
@@ -81,15 +109,17 @@ def command_get_resource_limits(args):
         (args.part,
          args.item,
          args.course,
-         (int(result.json()['reservedCpu'])/1024
-          if 'reservedCpu' in result.json()
+         (row['reservedCpu']
+          if row['reservedCpu'] is not None
           else 'Cpu limit not set - default is 1 vCPU'),
-         (result.json()['reservedMemory']
-          if 'reservedMemory' in result.json()
+         (row['reservedMemory']
+          if row['reservedMemory'] is not None
           else 'Memory limit not set - default is 4096 MiB'),
-         (result.json()['wallClockTimeout']
-          if 'wallClockTimeout' in result.json()
+         (row['wallClockTimeout']
+          if row['wallClockTimeout'] is not None
           else 'Timeout not set - default is 1200 seconds')))
+    with output.row_writer(args, RESOURCE_LIMIT_FIELDS) as writer:
+        writer.write(row, text=text)
     return 0
 
 
@@ -115,6 +145,8 @@ def setup_registration_parser(parser):
         'part',
         help='The id of the part associated with the grader.')
 
+    output.add_output_parser(parser)
+
     parser.add_argument(
         '--getGraderResourceLimits-endpoint',
         default='https://api.coursera.org/api/authoringProgramming' +
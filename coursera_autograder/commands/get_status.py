@@ -22,37 +22,61 @@ You may install it from source, or via pip.
 
 from coursera_autograder.commands import common
 from coursera_autograder.commands import oauth2
+from coursera_autograder.commands import output
+from coursera_autograder import utils
 import logging
+import random
 import requests
+import time
 import urllib.parse
 
+STATUS_FIELDS = ['course', 'graderId', 'status']
 
-def command_get_status(args):
-    "Implements the get_status subcommand"
+PENDING_STATUSES = ['PENDING', 'IN_PROGRESS']
+
+# The number of polls in a row watch mode retries for a grader whose status
+# could not be retrieved, before giving up on it.
+DEFAULT_STATUS_RETRIES = 5
 
-    oauth2_instance = oauth2.build_oauth2(args)
-    auth = oauth2_instance.build_authorizer()
 
-    s = requests.Session()
-    s.auth = auth
+class StatusUnavailable(Exception):
+    "The server did not return the status of a grader, for now."
 
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def fetch_status(session, args, grader_id, raise_unavailable=False):
+    """
+    Retrieves the status of a grader. Returns None (after logging the reason)
+    if the server did not return it. With raise_unavailable, only a grader
+    that does not exist (404) returns None: other failures, which may be
+    transient, raise StatusUnavailable instead.
+    """
     course_branch_id = (args.course.replace("~", "!~")
                         if "authoringBranch~" in args.course else args.course)
-    course_grader_id = '%s~%s' % (course_branch_id, args.graderId)
+    course_grader_id = '%s~%s' % (course_branch_id, grader_id)
 
-    result = s.get('%s%s' % (args.getGraderStatus_endpoint, course_grader_id))
+    result = session.get(
+        '%s%s' % (args.getGraderStatus_endpoint, course_grader_id))
     if result.status_code == 404:
         logging.error(
             '\nUnable to find grader with id %s in course %s.\n'
             'Status Code: 404 \n'
             'URL: %s \n'
             'Response: %s\n',
-            args.graderId,
+            grader_id,
             args.course,
             result.url,
             result.text)
-        return 1
+        return None
     elif result.status_code != 200:
+        if raise_unavailable:
+            raise StatusUnavailable('status code %s: %s' % (
+                result.status_code, result.text))
         logging.error(
             '\nUnable to get grader status.\n'
             'CourseId: %s\n'
@@ -61,16 +85,115 @@ def command_get_status(args):
             'URL: %s \n'
             'Response: %s\n',
             args.course,
-            args.graderId,
+            grader_id,
             result.status_code,
             result.url,
             result.text
         )
-        return 1
+        return None
+
+    try:
+        return result.json()['elements'][0]['status']
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        if raise_unavailable:
+            raise StatusUnavailable('malformed response (%r): %s' % (
+                e, result.text))
+        logging.error('Unexpected response when getting the status of '
+                      'grader %s: %s', grader_id, result.text)
+        return None
+
+
+def watch_statuses(session, args, grader_ids, writer):
+    """
+    Polls the graders until none of them is in a pending status (see
+    args.pending_status), writing out a row whenever the status of a grader
+    changes. The wait between polls starts at args.poll_interval seconds and
+    doubles (with random jitter) up to args.poll_max_interval. A grader whose
+    status cannot be retrieved is polled again, and only given up on after
+    args.status_retries failed polls in a row, or if it does not exist.
+
+    Returns 0 if every grader ended in args.success_status, 2 if some were
+    still pending after args.deadline seconds, and 1 otherwise.
+    """
+    pending_statuses = args.pending_status or PENDING_STATUSES
+    deadline = time.time() + args.deadline
+    interval = args.poll_interval
+    retries = getattr(args, 'status_retries', DEFAULT_STATUS_RETRIES)
+    statuses = {}
+    failures = dict((grader_id, 0) for grader_id in grader_ids)
+    watching = list(grader_ids)
+    while True:
+        for grader_id in list(watching):
+            try:
+                status = fetch_status(session, args, grader_id,
+                                      raise_unavailable=True)
+            except (requests.exceptions.RequestException,
+                    StatusUnavailable) as e:
+                failures[grader_id] += 1
+                if failures[grader_id] <= retries:
+                    logging.warn('Could not get the status of grader %s: %s',
+                                 grader_id, e)
+                    continue
+                logging.error('Giving up on grader %s after %s failed '
+                              'attempts: %s', grader_id, failures[grader_id],
+                              e)
+                status = None
+            if status is None:
+                statuses[grader_id] = None
+                watching.remove(grader_id)
+                continue
+            failures[grader_id] = 0
+            if status != statuses.get(grader_id):
+                statuses[grader_id] = status
+                writer.write(
+                    {'course': args.course, 'graderId': grader_id,
+                     'status': status},
+                    text='Grader %s status: %s' % (grader_id, status))
+            if status not in pending_statuses:
+                watching.remove(grader_id)
+        if not watching:
+            break
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            logging.error(
+                'Graders still pending after %s seconds: %s',
+                args.deadline, ', '.join(watching))
+            return 2
+        time.sleep(min(random.uniform(interval / 2, interval), remaining))
+        interval = min(interval * 2, args.poll_max_interval)
+
+    return 0 if all(statuses[grader_id] == args.success_status
+                    for grader_id in grader_ids) else 1
+
+
+def command_get_status(args):
+    "Implements the get_status subcommand"
+
+    oauth2_instance = oauth2.build_oauth2(args)
+    auth = oauth2_instance.build_authorizer()
 
-    status = result.json()['elements'][0]['status']
-    print('\nGrader status: %s\n' % (status))
-    return 0
+    s = utils.api_session(auth)
+
+    grader_ids = [args.graderId] + (
+        getattr(args, 'additional_grader_ids', None) or [])
+
+    with output.row_writer(args, STATUS_FIELDS) as writer:
+        if getattr(args, 'watch', False):
+            return watch_statuses(s, args, grader_ids, writer)
+
+        exit_code = 0
+        for grader_id in grader_ids:
+            status = fetch_status(s, args, grader_id)
+            if status is None:
+                exit_code = 1
+                continue
+            writer.write(
+                {'course': args.course, 'graderId': grader_id,
+                 'status': status},
+                text=('\nGrader status: %s\n' % (status)
+                      if len(grader_ids) == 1
+                      else 'Grader %s status: %s' % (grader_id, status)))
+    return exit_code
 
 
 def setup_registration_parser(parser):
@@ -91,6 +214,63 @@ def setup_registration_parser(parser):
         'command, a grader id should have been printed out.'
     )
 
+    parser.add_argument(
+        'additional_grader_ids',
+        nargs='*',
+        metavar='graderId',
+        help='Further grader ids to get the status of.')
+
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep polling until no grader is pending, printing a line '
+        'whenever the status of a grader changes. Exits with 0 if all graders '
+        'ended in the success status, 2 if the deadline was reached and 1 '
+        'otherwise.')
+
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=2,
+        help='Seconds to wait before polling again in watch mode. The wait '
+        'doubles (with random jitter) after each poll. (Default: %(default)s)')
+
+    parser.add_argument(
+        '--poll-max-interval',
+        type=float,
+        default=60,
+        help='Maximum number of seconds between polls in watch mode. '
+        '(Default: %(default)s)')
+
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        default=3600,
+        help='Number of seconds after which watch mode gives up. '
+        '(Default: %(default)s)')
+
+    parser.add_argument(
+        '--status-retries',
+        type=int,
+        default=DEFAULT_STATUS_RETRIES,
+        help='Number of polls in a row after which watch mode gives up on a '
+        'grader whose status could not be retrieved. (Default: %(default)s)')
+
+    parser.add_argument(
+        '--pending-status',
+        action='append',
+        default=None,
+        help='A status meaning the grader is still being built. May be given '
+        'several times. (Default: PENDING and IN_PROGRESS)')
+
+    parser.add_argument(
+        '--success-status',
+        default='COMPLETED',
+        help='The status of a successfully built grader. '
+        '(Default: %(default)s)')
+
+    output.add_output_parser(parser)
+
     parser.add_argument(
         '--getGraderStatus-endpoint',
         default='https://www.coursera.org/api/gridExecutors.v1/',
@@ -21,16 +21,33 @@ way it would run within Coursera's production environment.
 
 import argparse
 from coursera_autograder.commands import common
+from coursera_autograder.commands import feedback_schema
+from coursera_autograder.commands import log_stream
+from coursera_autograder.commands import resource_usage
+from coursera_autograder.commands import result_cache
+from coursera_autograder.commands import timings
+from coursera_autograder.commands import warm_pool
 from coursera_autograder import utils
 import docker.utils
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from requests.exceptions import ReadTimeout
+import fnmatch
+import functools
 import sys
 import io
+import os
+import re
+import shutil
 import tarfile
 from os import listdir, path
 
+# The CFS scheduler period, in microseconds, against which CPU quotas are set.
+CPU_PERIOD = 100000
+# The smallest CPU quota docker accepts, in microseconds.
+MIN_CPU_QUOTA = 1000
+
 EXTRA_DOC = """
 Beware: the Coursera Grid system uses a defense-in-depth strategy to protect
 against security vulnerabilities. Some of these layers are not reproducible
@@ -38,39 +55,158 @@ outside of Coursera's environment.
 """
 
 
-def get_feedback(docker, container, file_name, dst_dir):
+class OutputTooLarge(Exception):
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+    def __str__(self):
+        return ('The grader output copied out of the container exceeds the '
+                'limit of %s bytes.' % self.max_size)
+
+
+class _ChunkStream(io.RawIOBase):
+    "Adapts an iterable of byte strings into a readable file-like object."
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def _as_file(raw_stream):
+    if hasattr(raw_stream, 'read'):
+        return raw_stream
+    return io.BufferedReader(_ChunkStream(raw_stream))
+
+
+def extract_archive(raw_stream, dst_dir, select, max_size=None):
+    """
+    Streams the regular files of a tar archive (as returned by
+    docker.get_archive) straight into dst_dir, without holding the archive or
+    its members in memory.
+
+    `select` maps each member name to the path (relative to dst_dir) it
+    should be written to, or None to skip the member. Raises OutputTooLarge
+    if the files written would exceed max_size bytes in total.
+
+    Returns the list of paths written.
+    """
+    written = []
+    total_size = 0
+    with tarfile.open(mode='r|', fileobj=_as_file(raw_stream)) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            relative_path = select(member.name)
+            if relative_path is None:
+                continue
+            relative_path = path.normpath(relative_path)
+            if path.isabs(relative_path) or \
+                    path.pardir in relative_path.split(path.sep):
+                logging.warn('Skipping unsafe path in grader output: %s',
+                             member.name)
+                continue
+            total_size += member.size
+            if max_size is not None and total_size > max_size:
+                raise OutputTooLarge(max_size)
+            destination = path.join(dst_dir, relative_path)
+            if not path.isdir(path.dirname(destination)):
+                os.makedirs(path.dirname(destination))
+            with open(destination, 'wb') as f:
+                shutil.copyfileobj(archive.extractfile(member), f)
+            written.append(destination)
+    return written
+
+
+def get_feedback(docker, container, file_name, dst_dir, max_size=None):
+    """
+    Copies a file the grader wrote to /shared into dst_dir, returning the path
+    it was written to.
+    """
     raw_stream, status = docker.get_archive(container, "/shared/" + file_name)
-    tar_archive = io.BytesIO(b"".join((i for i in raw_stream)))
-    t = tarfile.open(mode="r", fileobj=tar_archive)
-    with open(path.join(dst_dir, file_name), "wb") as f:
-        f.write(t.extractfile(file_name).read())
+    member_name = path.basename(file_name)
+    written = extract_archive(
+        raw_stream, dst_dir,
+        lambda name: file_name if name == member_name else None,
+        max_size=max_size)
+    if not written:
+        raise IOError('%s was not found in the container.' % file_name)
+    return written[0]
 
 
-def run_container(docker, container, args):
-    "Runs the prepared container (and therefore grader), checking the output"
-    docker.start(container)
-    try:
-        exit_code = docker.wait(container, timeout=args.timeout)
-        get_feedback(docker, container, "feedback.json", args.dst_dir)
-    except ReadTimeout:
-        logging.error("The grader did not complete within the required "
-                      "timeout of %s seconds.", args.timeout)
-        logging.debug("About to terminate the container: %s" % container)
-        docker.kill(container)
-        logging.debug("Successfully killed the container.")
-        if not args.no_rm:
-            logging.debug("Removing container...")
-            docker.remove_container(container)
-            logging.debug("Successfully cleaned up the container.")
-        sys.exit(1)
+def get_outputs(docker, container, patterns, dst_dir, max_size=None):
+    """
+    Copies the files in /shared matching any of the glob patterns (relative
+    to /shared) into dst_dir, keeping their paths relative to /shared. Returns
+    the list of paths written.
+    """
+    raw_stream, status = docker.get_archive(container, "/shared")
+
+    def select(name):
+        # Members of the archive are named shared/<path relative to /shared>
+        relative_path = name.split('/', 1)[-1]
+        if any(fnmatch.fnmatch(relative_path, p) for p in patterns):
+            return relative_path
+        return None
+    return extract_archive(raw_stream, dst_dir, select, max_size=max_size)
+
+
+def max_output_size(args):
+    "The limit, in bytes, on output copied out of the grader container."
+    limit = getattr(args, 'max_output_size', None)
+    return limit * 1024 * 1024 if limit is not None else None
+
+
+def copy_outputs(docker, container, args, dst_dir):
+    """
+    Copies the feedback (and any other requested output) into dst_dir.
+    Returns the list of paths written.
+    """
+    written = [get_feedback(docker, container, "feedback.json", dst_dir,
+                            max_size=max_output_size(args))]
+    extra_outputs = getattr(args, 'extract', None)
+    if extra_outputs:
+        written.extend(get_outputs(docker, container, extra_outputs, dst_dir,
+                                   max_size=max_output_size(args)))
+        logging.debug('Copied grader outputs: %s', written)
+    return written
+
+
+def _decode(output):
+    if type(output) is bytes:
+        output = output.decode("utf-8")
+    return output
+
+
+def report_grader_output(dst_dir, exit_code, stdout_output, stderr_output,
+                         timer=None):
+    """
+    Writes the grader's standard error and standard output (unless None, e.g.
+    when they were shown as they were written) to the screen and checks the
+    feedback the grader wrote to dst_dir (timed as the validate phase, if
+    given a timer).
+
+    Returns True if the grader did not exit cleanly or its feedback is bad.
+    """
+    timer = timer or timings.PhaseTimings()
     if exit_code != 0:
         logging.warn("The grade command did not exit cleanly within the "
                      "container. Exit code: %s", exit_code)
 
-    if logging.getLogger().isEnabledFor(logging.INFO):
-        stderr_output = docker.logs(container, stdout=False, stderr=True)
-        if type(stderr_output) is bytes:
-            stderr_output = stderr_output.decode("utf-8")
+    if stderr_output is not None:
         logging.info('Start of standard error:')
         sys.stdout.write('-' * 80)
         sys.stdout.write('\n')
@@ -79,56 +215,296 @@ def run_container(docker, container, args):
         sys.stdout.write('\n')
         logging.info('End of standard error')
 
-    stdout_output = docker.logs(container, stdout=True, stderr=False)
-    if type(stdout_output) is bytes:
-        stdout_output = stdout_output.decode("utf-8")
     error_in_grader_output = False
     try:
-        json_file = open(path.join(args.dst_dir, 'feedback.json'), 'r')
-        parsed_output = json.load(json_file)
-        json_file.close()
-    except ValueError:
-        logging.error("The output was not a valid JSON document.")
-        error_in_grader_output = True
-    else:
-        if "fractionalScore" in parsed_output:
-            if isinstance(parsed_output['fractionalScore'], bool):
-                logging.error("Field 'fractionalScore' must be a decimal.")
-                error_in_grader_output = True
-            elif not (isinstance(parsed_output['fractionalScore'], float) or
-                      isinstance(parsed_output['fractionalScore'], int)):
-                logging.error("Field 'fractionalScore' must be a decimal.")
-                error_in_grader_output = True
-            elif parsed_output['fractionalScore'] > 1:
-                logging.error("Field 'fractionalScore' must be <= 1.")
-                error_in_grader_output = True
-            elif parsed_output['fractionalScore'] < 0:
-                logging.error("Field 'fractionalScore' must be >= 0.")
-                error_in_grader_output = True
-        elif "isCorrect" in parsed_output:
-            if not isinstance(parsed_output['isCorrect'], bool):
-                logging.error("Field 'isCorrect' is not a boolean value.")
-                error_in_grader_output = True
-        else:
-            logging.error("Required field 'fractionalScore' is missing.")
-            error_in_grader_output = True
-        if "feedback" not in parsed_output:
-            logging.error("Field 'feedback' not present in parsed output.")
-            error_in_grader_output = True
+        with timer.phase('validate'):
+            errors = feedback_schema.validate_feedback_file(
+                path.join(dst_dir, 'feedback.json'))
+        for error in errors:
+            logging.error(error)
+        error_in_grader_output = len(errors) > 0
     finally:
-        if logging.getLogger().isEnabledFor(logging.WARNING):
+        if (stdout_output is not None and
+                logging.getLogger().isEnabledFor(logging.WARNING)):
             sys.stdout.write('Grader output:\n')
             sys.stdout.write('=' * 80)
             sys.stdout.write('\n')
             sys.stdout.write(stdout_output)
             sys.stdout.write('=' * 80)
             sys.stdout.write('\n')
+    return exit_code != 0 or error_in_grader_output
+
+
+def start_log_streamer(docker, container, args, dst_dir, echo=False):
+    """
+    Starts following the grader's standard output and error into log files in
+    dst_dir (and, if echo is set, to the screen), unless disabled with
+    --no-stream-logs. Returns the streamer, or None.
+    """
+    # Only stream when the option was parsed from the command line.
+    if getattr(args, 'no_stream_logs', True):
+        return None
+    echo_streams = {}
+    if echo and logging.getLogger().isEnabledFor(logging.WARNING):
+        echo_streams['stdout'] = sys.stdout
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            echo_streams['stderr'] = sys.stdout
+        sys.stdout.write('Grader output:\n')
+        sys.stdout.write('=' * 80)
+        sys.stdout.write('\n')
+    streamer = log_stream.LogStreamer(
+        docker, container, dst_dir, args.max_log_size * 1024 * 1024,
+        echo_streams)
+    streamer.start()
+    return streamer
+
+
+def finish_log_streamer(streamer, docker, container, dst_dir):
+    """
+    Waits for the grader's logs to end and returns its (stdout, stderr), as
+    bytes. Streams that could not be followed to their end are fetched again
+    once the grader has exited.
+    """
+    outputs = list(streamer.finish())
+    if streamer.echo:
+        sys.stdout.write('=' * 80)
+        sys.stdout.write('\n')
+    for (i, name) in enumerate(log_stream.STREAMS):
+        if outputs[i] is None:
+            logging.debug('Fetching the %s of container %s.', name, container)
+            outputs[i] = docker.logs(container, stdout=name == 'stdout',
+                                     stderr=name == 'stderr')
+            with open(path.join(dst_dir, name + '.log'), 'wb') as f:
+                f.write(outputs[i])
+    return tuple(outputs)
+
+
+def start_resource_monitor(docker, container, args, timer, cumulative=True):
+    """
+    Starts sampling the resource usage of the container, unless disabled with
+    --no-resource-stats. Returns the monitor, or None.
+    """
+    # Only monitor when the option was parsed from the command line.
+    if getattr(args, 'no_resource_stats', True):
+        return None
+    monitor = resource_usage.ResourceMonitor(docker, container, cumulative)
+    try:
+        with timer.phase('resources'):
+            monitor.start()
+    except Exception:
+        logging.debug('Could not monitor the resource usage of container %s.',
+                      container, exc_info=True)
+        return None
+    return monitor
+
+
+def finish_resource_monitor(monitor, docker, container, args, dst_dir,
+                            timer, check_oom=True):
+    """
+    Stops the monitor (if any) and writes its report next to the feedback, in
+    dst_dir. Returns the report, or None.
+    """
+    if monitor is None:
+        return None
+    mem_limit = getattr(args, 'mem_limit', None)
+    with timer.phase('resources'):
+        report = monitor.stop(mem_limit * 1024 * 1024 if mem_limit else None)
+        report['cpuLimit'] = getattr(args, 'cpus', None)
+        if check_oom:
+            try:
+                state = docker.inspect_container(container).get('State') or {}
+                report['oomKilled'] = bool(state.get('OOMKilled'))
+            except Exception:
+                logging.debug('Could not inspect container %s.', container,
+                              exc_info=True)
+        resource_usage.write_report(report, dst_dir)
+    return report
+
+
+def report_resource_usage(report):
+    "Writes a summary of the resources the grader used to the screen."
+    if report is None:
+        return
+    for warning in resource_usage.check_headroom(report):
+        logging.warn(warning)
+    if logging.getLogger().isEnabledFor(logging.WARNING):
+        sys.stdout.write('Resource usage:\n')
+        sys.stdout.write(resource_usage.format_summary(report))
+
+
+def run_container(docker, container, args, on_result=None, timer=None):
+    """
+    Runs the prepared container (and therefore grader), checking the output.
+
+    If given, on_result is called with the files written, the exit code and
+    the grader's standard output and error once the grader has completed,
+    and the time spent in each phase is added to the timer (a PhaseTimings).
+    The resources the grader used are recorded in resources.json, and its
+    output is shown as it is written (see start_log_streamer).
+    """
+    timer = timer or timings.PhaseTimings()
+    with timer.phase('start'):
+        docker.start(container)
+    streamer = start_log_streamer(docker, container, args, args.dst_dir,
+                                  echo=True)
+    monitor = start_resource_monitor(docker, container, args, timer)
+    try:
+        try:
+            with timer.phase('grader'):
+                exit_code = docker.wait(container, timeout=args.timeout)
+        finally:
+            usage = finish_resource_monitor(
+                monitor, docker, container, args, args.dst_dir, timer)
+        with timer.phase('get_archive'):
+            outputs = copy_outputs(docker, container, args, args.dst_dir)
+        if usage is not None:
+            outputs.append(path.join(args.dst_dir, resource_usage.REPORT_FILE))
+    except ReadTimeout:
+        logging.error("The grader did not complete within the required "
+                      "timeout of %s seconds.", args.timeout)
+        logging.debug("About to terminate the container: %s" % container)
+        docker.kill(container)
+        logging.debug("Successfully killed the container.")
+        if streamer is not None:
+            streamer.finish()
+        if not args.no_rm:
+            logging.debug("Removing container...")
+            docker.remove_container(container)
+            logging.debug("Successfully cleaned up the container.")
+        sys.exit(1)
+    except OutputTooLarge as e:
+        logging.error("%s", e)
         if not args.no_rm:
             logging.debug("About to remove container: %s", container)
             docker.remove_container(container)
-    if exit_code != 0 or error_in_grader_output:
         sys.exit(1)
 
+    stderr_output = None
+    with timer.phase('logs'):
+        if streamer is not None:
+            stdout_output, stderr_output = finish_log_streamer(
+                streamer, docker, container, args.dst_dir)
+        else:
+            if (logging.getLogger().isEnabledFor(logging.INFO) or
+                    on_result is not None):
+                stderr_output = _decode(
+                    docker.logs(container, stdout=False, stderr=True))
+            stdout_output = _decode(
+                docker.logs(container, stdout=True, stderr=False))
+    if on_result is not None:
+        with timer.phase('cache_store'):
+            on_result(outputs, exit_code, stdout_output, stderr_output)
+    if streamer is not None:
+        # Already shown as the grader wrote them.
+        stdout_output = stderr_output = None
+    elif not logging.getLogger().isEnabledFor(logging.INFO):
+        stderr_output = None
+    try:
+        failed = report_grader_output(
+            args.dst_dir, exit_code, stdout_output, stderr_output, timer)
+        report_resource_usage(usage)
+    finally:
+        if not args.no_rm:
+            logging.debug("About to remove container: %s", container)
+            with timer.phase('remove'):
+                docker.remove_container(container)
+    if failed:
+        sys.exit(1)
+
+
+def run_warm_container(pool, container, args, environment, on_result=None,
+                       timer=None):
+    """
+    Runs the grader within a warm container from the pool, checking the
+    output. The container is returned to the pool afterwards. on_result and
+    timer are as for run_container.
+    """
+    timer = timer or timings.PhaseTimings()
+    monitor = start_resource_monitor(pool.docker, container, args, timer,
+                                     cumulative=False)
+    try:
+        try:
+            with timer.phase('grader'):
+                exit_code = pool.run(container, args.dir, environment,
+                                     args.timeout)
+        finally:
+            usage = finish_resource_monitor(
+                monitor, pool.docker, container, args, args.dst_dir, timer,
+                check_oom=False)
+        with timer.phase('get_archive'):
+            outputs = copy_outputs(pool.docker, container, args, args.dst_dir)
+        if usage is not None:
+            outputs.append(path.join(args.dst_dir, resource_usage.REPORT_FILE))
+        with timer.phase('logs'):
+            stdout_output, stderr_output = pool.logs(container)
+    except ReadTimeout:
+        logging.error("The grader did not complete within the required "
+                      "timeout of %s seconds.", args.timeout)
+        pool.discard(container)
+        sys.exit(1)
+    except OutputTooLarge as e:
+        logging.error("%s", e)
+        pool.release(container)
+        sys.exit(1)
+    except:
+        pool.discard(container)
+        raise
+
+    if on_result is not None:
+        with timer.phase('cache_store'):
+            on_result(outputs, exit_code, stdout_output, stderr_output)
+    if not logging.getLogger().isEnabledFor(logging.INFO):
+        stderr_output = None
+    try:
+        failed = report_grader_output(
+            args.dst_dir, exit_code, _decode(stdout_output),
+            _decode(stderr_output), timer)
+        report_resource_usage(usage)
+    finally:
+        with timer.phase('release'):
+            pool.release(container)
+    if failed:
+        sys.exit(1)
+
+
+def open_result_cache(args):
+    "Returns the cache of grading results to use, or None if disabled."
+    if (getattr(args, 'no_cache', False) or
+            getattr(args, 'cache_dir', None) is None):
+        return None
+    return result_cache.ResultCache(
+        args.cache_dir, args.cache_max_size * 1024 * 1024)
+
+
+def result_cache_key(cache, args, image_id, submission_dir, environment):
+    "Computes the cache key of grading a submission with these settings."
+    return cache.key(
+        image_id, submission_dir, environment,
+        mem_limit=args.mem_limit,
+        cpus=getattr(args, 'cpus', None),
+        cpuset=getattr(args, 'cpuset', None),
+        timeout=getattr(args, 'timeout', None),
+        extract=sorted(getattr(args, 'extract', None) or []),
+        max_output_size=getattr(args, 'max_output_size', None))
+
+
+def report_cached_result(cache, key, entry, dst_dir, timer=None):
+    """
+    Restores a cached grading result into dst_dir and reports it like a fresh
+    run. Returns True if the cached run failed.
+    """
+    timer = timer or timings.PhaseTimings()
+    logging.info('Using the cached result of a previous identical run. Pass '
+                 '--no-cache to run the grader again.')
+    with timer.phase('cache_restore'):
+        cache.restore(key, entry, dst_dir)
+    stderr_output = None
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        stderr_output = _decode(entry['stderr'])
+    return report_grader_output(
+        dst_dir, entry['exitCode'], _decode(entry['stdout']), stderr_output,
+        timer)
+
 
 class MemoryFormatError(BaseException):
     def __repr__(self):
@@ -146,40 +522,447 @@ def compute_memory_limit(args):
         raise MemoryFormatError()
 
 
-def command_grade_local(args):
+def arg_cpus(value):
+    "Parses --cpus: a positive number of CPUs."
+    try:
+        cpus = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a number' % value)
+    if cpus * CPU_PERIOD < MIN_CPU_QUOTA:
+        raise argparse.ArgumentTypeError(
+            '%s is below the minimum of %s CPUs' % (
+                value, MIN_CPU_QUOTA / float(CPU_PERIOD)))
+    return cpus
+
+
+def arg_cpuset(value):
+    "Parses --cpuset: a list of CPUs and ranges of CPUs, e.g. 0-1,4."
+    if not re.match(r'^\d+(-\d+)?(,\d+(-\d+)?)*$', value):
+        raise argparse.ArgumentTypeError(
+            '%s is not a list of CPUs (e.g. 0-1,4)' % value)
+    return value
+
+
+def cpuset_size(cpuset):
+    "The number of CPUs in a --cpuset list."
+    size = 0
+    for cpu_range in cpuset.split(','):
+        first, _, last = cpu_range.partition('-')
+        size += int(last or first) - int(first) + 1
+    return size
+
+
+def check_cpu_limits(args):
+    """
+    Warns about CPU limits this machine cannot honour, which would make the
+    grader run faster locally than in production.
+    """
+    cpus = getattr(args, 'cpus', None)
+    cpuset = getattr(args, 'cpuset', None)
+    host_cpus = os.cpu_count() or 1
+    if cpus and cpus > host_cpus:
+        logging.warn('--cpus %s is more than the %s CPUs of this machine.',
+                     cpus, host_cpus)
+    if cpus and cpuset and cpus > cpuset_size(cpuset):
+        logging.warn('--cpus %s is more than the %s CPUs of --cpuset %s.',
+                     cpus, cpuset_size(cpuset), cpuset)
+
+
+def create_grader_host_config(d, args, binds=None):
+    "Builds the host config constraining grader containers."
+    memory_limit = compute_memory_limit(args)
+    host_config_args = dict(
+        network_mode='none',
+        mem_limit=memory_limit,
+        memswap_limit=memory_limit,
+    )
+    cpus = getattr(args, 'cpus', None)
+    if cpus:
+        # A CFS quota of `cpus` periods of CPU time per period.
+        host_config_args['cpu_period'] = CPU_PERIOD
+        host_config_args['cpu_quota'] = int(cpus * CPU_PERIOD)
+    cpuset = getattr(args, 'cpuset', None)
+    if cpuset:
+        host_config_args['cpuset_cpus'] = cpuset
+    if binds is not None:
+        host_config_args['binds'] = binds
+    return d.create_host_config(**host_config_args)
+
+
+def create_warm_pool(d, args):
+    "Sets up the pool of warm containers used by the --warm option."
+    return warm_pool.WarmContainerPool(
+        d, args.containerTag, create_grader_host_config(d, args),
+        scratch_paths=getattr(args, 'warm_scratch_path', None))
+
+
+def create_grader_container(d, args, submission_dir, environment):
+    "Creates (but does not start) a grader container for a submission."
+    volume_str = common.mk_submission_volume_str(submission_dir)
+    logging.debug("Volume string: %s", volume_str)
+    host_config = create_grader_host_config(d, args, binds=[volume_str, ])
+
+    return d.create_container(
+        image=args.containerTag,
+        host_config=host_config,
+        environment=environment
+    )
+
+
+def command_grade_local(args, timer=None):
     """
     The 'local' sub-sub-command of the 'grade' sub-command simulates running a
     grader on a sample submission from the local file system.
     """
+    timer = timer or timings.PhaseTimings()
+    try:
+        grade_local(args, timer)
+    finally:
+        if getattr(args, 'timings', None):
+            timings.write_timings(timer.as_dict(), args.timings)
+
+
+def grade_local(args, timer):
+    "Implements command_grade_local, timing each phase with the timer."
     d = utils.docker_client(args)
-    memory_limit = compute_memory_limit(args)
+    compute_memory_limit(args)  # Fail fast on an invalid --mem-limit.
+    check_cpu_limits(args)
     try:
         environment_variable = json.loads(args.envVar)
     except ValueError:
         logging.error("envVar was not a valid JSON document.")
         sys.exit(1)
+    on_result = None
+    cache = open_result_cache(args)
+    if cache is not None:
+        with timer.phase('cache_lookup'):
+            cache_key = result_cache_key(
+                cache, args, d.inspect_image(args.containerTag)['Id'],
+                args.dir, environment_variable)
+            cached = cache.lookup(cache_key)
+        if cached is not None:
+            if report_cached_result(cache, cache_key, cached, args.dst_dir,
+                                    timer):
+                sys.exit(1)
+            return
+        on_result = functools.partial(cache.store, cache_key, args.dst_dir)
+
     try:
-        volume_str = common.mk_submission_volume_str(args.dir)
-        logging.debug("Volume string: %s", volume_str)
-        host_config = d.create_host_config(
-                binds=[volume_str, ],
-                network_mode='none',
-                mem_limit=memory_limit,
-                memswap_limit=memory_limit,
-            )
-
-        container = d.create_container(
-            image=args.containerTag,
-            host_config=host_config,
-            environment=environment_variable
-        )
+        if getattr(args, 'warm', False):
+            with timer.phase('acquire'):
+                pool = create_warm_pool(d, args)
+                container = pool.acquire()
+        else:
+            with timer.phase('create'):
+                container = create_grader_container(
+                    d, args, args.dir, environment_variable)
     except:
         logging.error(
             "Could not set up the container to run the grade command in. Most "
             "likely, this means that you specified an inappropriate container "
             "id.")
         raise
-    run_container(d, container, args)
+    if getattr(args, 'warm', False):
+        try:
+            run_warm_container(pool, container, args, environment_variable,
+                               on_result=on_result, timer=timer)
+        finally:
+            logging.debug('Warm containers: %s', pool.summary())
+    else:
+        run_container(d, container, args, on_result=on_result, timer=timer)
+
+
+def find_submissions(source, environment):
+    """
+    Lists the submissions to grade in a batch. `source` is either a directory
+    whose subdirectories are each a submission, or a manifest file listing one
+    submission directory per line, optionally followed by an envVar JSON
+    document overriding `environment` for that submission.
+
+    Returns a list of (name, directory, environment) tuples.
+    """
+    entries = []
+    if path.isdir(source):
+        for name in sorted(listdir(source)):
+            if path.isdir(path.join(source, name)):
+                entries.append((path.join(source, name), environment))
+    else:
+        base_dir = path.dirname(source)
+        with open(source, 'r') as manifest:
+            for line_number, line in enumerate(manifest, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                fields = line.split(None, 1)
+                submission_env = environment
+                if len(fields) > 1:
+                    try:
+                        submission_env = json.loads(fields[1])
+                    except ValueError:
+                        raise ValueError(
+                            'Line %s of the manifest has an invalid envVar '
+                            'JSON document.' % line_number)
+                submission_dir = path.abspath(path.join(
+                    base_dir, path.expanduser(fields[0])))
+                if not path.isdir(submission_dir):
+                    raise ValueError(
+                        'Line %s of the manifest: %s is not a directory.' %
+                        (line_number, submission_dir))
+                entries.append((submission_dir, submission_env))
+
+    submissions = []
+    seen = set()
+    for submission_dir, submission_env in entries:
+        name = path.basename(path.normpath(submission_dir))
+        unique_name = name
+        suffix = 1
+        while unique_name in seen:
+            suffix += 1
+            unique_name = '%s-%s' % (name, suffix)
+        seen.add(unique_name)
+        submissions.append((unique_name, submission_dir, submission_env))
+    return submissions
+
+
+def _write_logs(dst_dir, stdout_output, stderr_output):
+    for stream_name, output in (('stdout', stdout_output),
+                                ('stderr', stderr_output)):
+        if type(output) is not bytes:
+            output = output.encode('utf-8')
+        with open(path.join(dst_dir, stream_name + '.log'), 'wb') as f:
+            f.write(output)
+
+
+def grade_submission(docker, args, name, submission_dir, environment,
+                     pool=None, cache=None, image_id=None):
+    """
+    Grades a single submission of a batch, in its own container or in a warm
+    container from `pool` if given. The feedback and grader logs are written
+    to a directory named after the submission within args.dst_dir. If a result
+    cache is given (along with the grader's image id), results are looked up
+    in and saved to it.
+
+    Unlike run_container, this never exits. Returns a dictionary describing
+    the outcome, including the time spent in each phase of grading.
+    """
+    timer = timings.PhaseTimings()
+    result = grade_submission_phases(docker, args, name, submission_dir,
+                                     environment, pool, cache, image_id,
+                                     timer)
+    result['timings'] = timer.as_dict()
+    return result
+
+
+def grade_submission_phases(docker, args, name, submission_dir, environment,
+                            pool, cache, image_id, timer):
+    "Implements grade_submission, timing each phase with the timer."
+    dst_dir = path.join(args.dst_dir, name)
+    if not path.isdir(dst_dir):
+        os.makedirs(dst_dir)
+    result = {
+        'submission': name,
+        'directory': submission_dir,
+        'exitCode': None,
+        'timedOut': False,
+        'cached': False,
+        'errors': [],
+        'resources': None,
+    }
+    if cache is not None:
+        with timer.phase('cache_lookup'):
+            cache_key = result_cache_key(
+                cache, args, image_id, submission_dir, environment)
+            cached = cache.lookup(cache_key)
+        if cached is not None:
+            with timer.phase('cache_restore'):
+                cache.restore(cache_key, cached, dst_dir)
+                _write_logs(dst_dir, cached['stdout'], cached['stderr'])
+            result['cached'] = True
+            result['exitCode'] = cached['exitCode']
+            with timer.phase('validate'):
+                result['errors'].extend(
+                    feedback_schema.validate_feedback_file(
+                        path.join(dst_dir, 'feedback.json')))
+            return result
+
+    try:
+        if pool is not None:
+            with timer.phase('acquire'):
+                container = pool.acquire()
+        else:
+            with timer.phase('create'):
+                container = create_grader_container(
+                    docker, args, submission_dir, environment)
+    except Exception as e:
+        result['errors'].append('Could not create the container: %s' % e)
+        return result
+
+    reusable = pool is not None
+    try:
+        monitor = streamer = None
+        try:
+            if pool is not None:
+                monitor = start_resource_monitor(
+                    docker, container, args, timer, cumulative=False)
+                with timer.phase('grader'):
+                    result['exitCode'] = pool.run(
+                        container, submission_dir, environment, args.timeout)
+            else:
+                with timer.phase('start'):
+                    docker.start(container)
+                streamer = start_log_streamer(docker, container, args,
+                                              dst_dir)
+                monitor = start_resource_monitor(
+                    docker, container, args, timer)
+                with timer.phase('grader'):
+                    result['exitCode'] = docker.wait(
+                        container, timeout=args.timeout)
+        except ReadTimeout:
+            result['timedOut'] = True
+            result['errors'].append(
+                'The grader did not complete within the required timeout of '
+                '%s seconds.' % args.timeout)
+            reusable = False
+            docker.kill(container)
+            if streamer is not None:
+                streamer.finish()
+            return result
+        finally:
+            result['resources'] = finish_resource_monitor(
+                monitor, docker, container, args, dst_dir, timer,
+                check_oom=pool is None)
+
+        with timer.phase('logs'):
+            if streamer is not None:
+                stdout_output, stderr_output = finish_log_streamer(
+                    streamer, docker, container, dst_dir)
+            else:
+                if pool is not None:
+                    stdout_output, stderr_output = pool.logs(container)
+                else:
+                    stdout_output = docker.logs(
+                        container, stdout=True, stderr=False)
+                    stderr_output = docker.logs(
+                        container, stdout=False, stderr=True)
+                _write_logs(dst_dir, stdout_output, stderr_output)
+
+        try:
+            with timer.phase('get_archive'):
+                outputs = copy_outputs(docker, container, args, dst_dir)
+            if result['resources'] is not None:
+                outputs.append(path.join(dst_dir, resource_usage.REPORT_FILE))
+        except OutputTooLarge as e:
+            result['errors'].append(str(e))
+        except Exception as e:
+            result['errors'].append(
+                'Could not retrieve feedback.json from the container: %s' % e)
+        else:
+            if cache is not None:
+                with timer.phase('cache_store'):
+                    cache.store(cache_key, dst_dir, outputs,
+                                result['exitCode'], stdout_output,
+                                stderr_output)
+            with timer.phase('validate'):
+                result['errors'].extend(
+                    feedback_schema.validate_feedback_file(
+                        path.join(dst_dir, 'feedback.json')))
+    except Exception as e:
+        logging.debug('Error grading submission %s', name, exc_info=True)
+        result['errors'].append('Error while grading: %s' % e)
+        reusable = False
+    finally:
+        if pool is not None:
+            with timer.phase('release'):
+                if reusable:
+                    pool.release(container)
+                else:
+                    pool.discard(container)
+        elif not args.no_rm:
+            try:
+                with timer.phase('remove'):
+                    docker.remove_container(container, force=True)
+            except Exception:
+                logging.warn('Could not remove container %s for submission '
+                             '%s.', container, name)
+    return result
+
+
+def command_grade_batch(args):
+    """
+    The 'batch' sub-sub-command of the 'grade' sub-command grades a directory
+    (or manifest) of sample submissions concurrently, writing each
+    submission's feedback into its own directory within --dst-dir.
+    """
+    compute_memory_limit(args)  # Fail fast on an invalid --mem-limit.
+    check_cpu_limits(args)
+    try:
+        environment_variable = json.loads(args.envVar)
+    except ValueError:
+        logging.error("envVar was not a valid JSON document.")
+        return 1
+    try:
+        submissions = find_submissions(args.submissions, environment_variable)
+    except (IOError, ValueError) as e:
+        logging.error("Could not read the submissions to grade: %s", e)
+        return 1
+    if len(submissions) == 0:
+        logging.error("No submissions found in %s.", args.submissions)
+        return 1
+
+    d = utils.docker_client(args)
+    pool = create_warm_pool(d, args) if getattr(args, 'warm', False) else None
+    cache = open_result_cache(args)
+    image_id = None
+    if cache is not None:
+        image_id = d.inspect_image(args.containerTag)['Id']
+    logging.info('Grading %s submissions with %s workers.',
+                 len(submissions), args.workers)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(grade_submission, d, args, name, directory, env,
+                            pool, cache, image_id)
+            for (name, directory, env) in submissions
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            ok = result['exitCode'] == 0 and not result['errors']
+            if not args.quiet:
+                sys.stdout.write('[%s/%s] %s: %s%s\n' % (
+                    len(results), len(submissions), result['submission'],
+                    'OK' if ok else 'FAILED',
+                    ' (cached)' if result['cached'] else ''))
+                sys.stdout.flush()
+            for error in result['errors']:
+                logging.warn('%s: %s', result['submission'], error)
+
+    results.sort(key=lambda r: r['submission'])
+    with open(path.join(args.dst_dir, 'results.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+
+    failed = [r for r in results
+              if r['exitCode'] != 0 or r['errors']]
+    sys.stdout.write('Graded %s submissions: %s succeeded, %s failed.\n' % (
+        len(results), len(results) - len(failed), len(failed)))
+    if pool is not None:
+        logging.info('Warm containers: %s', pool.summary())
+    if getattr(args, 'timings', None):
+        timings.write_summary([r['timings'] for r in results], args.timings)
+    return 1 if failed else 0
+
+
+def command_clear_warm_pool(args):
+    """
+    The 'clear-warm-pool' sub-sub-command of the 'grade' sub-command removes
+    all warm containers left behind by `grade local --warm` and
+    `grade batch --warm`.
+    """
+    d = utils.docker_client(args)
+    removed = warm_pool.clear_pool(d)
+    logging.info('Removed %s warm containers.', removed)
+    return 0
 
 
 def parser(subparsers):
@@ -202,6 +985,90 @@ def parser(subparsers):
         type=int,
         default=1024,
         help='The amount of memory allocated to the grader')
+    common_flags.add_argument(
+        '--cpus',
+        type=arg_cpus,
+        help='Limit the grader to this many CPUs (e.g. 1.5), with a CFS '
+             'quota, to time it as it will run in production, where it gets '
+             'the number of CPUs given to upload --grader-cpu (1, 2 or 4). '
+             '(Default: no limit)')
+    common_flags.add_argument(
+        '--cpuset',
+        type=arg_cpuset,
+        help='Only run the grader on these CPUs of this machine, e.g. 0-1 or '
+             '0,2. Pinning the grader to as many CPUs as --cpus makes timings '
+             'steadier.')
+    common_flags.add_argument(
+        '--extract',
+        action='append',
+        metavar='PATTERN',
+        help='Also copy the files in /shared matching this glob pattern '
+             '(relative to /shared, e.g. "*.html" or "artifacts/*") into the '
+             'destination directory. May be given several times.')
+    common_flags.add_argument(
+        '--max-output-size',
+        type=int,
+        default=100,
+        help='The maximum size, in MB, of the files copied out of the '
+             'container. Grading fails if the grader output is larger.')
+    common_flags.add_argument(
+        '--no-stream-logs',
+        action='store_true',
+        help='Fetch the grader\'s standard output and error once it has '
+             'exited, instead of following them as they are written into '
+             'stdout.log and stderr.log in the destination directory (and, '
+             'for grade local, onto the screen).')
+    common_flags.add_argument(
+        '--max-log-size',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=10,
+        help='The size, in MB, at which the log file of each of the '
+             'grader\'s followed streams is rotated: the previous '
+             'MAX_LOG_SIZE MB are kept in stdout.log.1 and stderr.log.1, and '
+             'older output is dropped. (Default: %(default)s)')
+    common_flags.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always run the grader, rather than reusing the cached result of '
+             'a previous run of the same image on an identical submission '
+             'with the same settings.')
+    common_flags.add_argument(
+        '--cache-dir',
+        default='~/.coursera/grade_cache',
+        help='Where cached grading results are stored.')
+    common_flags.add_argument(
+        '--cache-max-size',
+        type=int,
+        default=1024,
+        help='The size, in MB, beyond which the least recently used cached '
+             'results are evicted.')
+    common_flags.add_argument(
+        '--warm',
+        action='store_true',
+        help='Reuse idle containers of the same image from previous runs '
+             'instead of creating a fresh container for every submission. '
+             'The submission is copied into the container rather than bind '
+             'mounted, and /shared is emptied between runs. Warm containers '
+             'are paused and kept around for later runs; remove them with '
+             '`grade clear-warm-pool`. Requires /bin/sh in the image.')
+    common_flags.add_argument(
+        '--warm-scratch-path',
+        action='append',
+        metavar='PATH',
+        help='With --warm, a directory the grader only uses as scratch space '
+             'or a cache (e.g. /root/.cache), emptied between runs like '
+             '/shared rather than causing the container to be replaced when '
+             'the grader writes to it. May be given several times, and '
+             'added to by the %s label of the image.' %
+             warm_pool.SCRATCH_LABEL)
+    common_flags.add_argument(
+        '--no-resource-stats',
+        action='store_true',
+        help='Do not sample the peak memory, CPU time and block I/O of the '
+             'grader while it runs. By default, they are written to '
+             'resources.json in the destination directory and summarized '
+             'against --mem-limit.')
+    timings.add_timings_parser(common_flags)
     grade_subparsers = parser_grade.add_subparsers()
 
     # Local subsubcommand of the grade subcommand
@@ -227,4 +1094,43 @@ def parser(subparsers):
     parser_grade_local.add_argument(
         'envVar',
         help='Environment variable that passed into the container')
+
+    # Batch subsubcommand of the grade subcommand
+    parser_grade_batch = grade_subparsers.add_parser(
+        'batch',
+        help=command_grade_batch.__doc__,
+        parents=[common_flags, common.container_parser()])
+
+    parser_grade_batch.set_defaults(func=command_grade_batch)
+    parser_grade_batch.add_argument(
+        '--no-rm',
+        action='store_true',
+        help='Do not clean up the containers after grading completes.')
+    parser_grade_batch.add_argument(
+        '--dst-dir',
+        help='Destination directory for the container output. Each '
+             'submission gets its own subdirectory.',
+        default='.',
+        type=common.arg_fq_dir)
+    parser_grade_batch.add_argument(
+        '--workers',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=os.cpu_count() or 1,
+        help='The number of containers to run concurrently. Defaults to the '
+             'number of CPUs on this machine.')
+    parser_grade_batch.add_argument(
+        'submissions',
+        help='Directory whose subdirectories each contain a submission, or a '
+             'manifest file listing one submission directory per line '
+             '(optionally followed by an envVar JSON document for that '
+             'submission).')
+    parser_grade_batch.add_argument(
+        'envVar',
+        help='Environment variable that passed into the containers')
+
+    # Subsubcommand of the grade subcommand that cleans up warm containers
+    parser_clear_warm_pool = grade_subparsers.add_parser(
+        'clear-warm-pool',
+        help=command_clear_warm_pool.__doc__)
+    parser_clear_warm_pool.set_defaults(func=command_clear_warm_pool)
     return parser_grade
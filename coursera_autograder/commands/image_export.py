@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Exports a container image from the docker daemon (like `docker save`) as a zip
+archive holding the image's tarball, compressing it on the fly (on several
+threads, see parallel_zip).
+
+The archive can be streamed straight into an upload as it is produced, so it
+is never written to disk, and only a bounded amount of it is held in memory.
+'''
+
+from coursera_autograder.commands import parallel_zip
+import io
+import logging
+import queue
+import threading
+
+
+class ExportError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'Exporting the image failed: %(msg)s' % {
+            'msg': self.msg,
+        }
+
+
+def image_file_name(tag):
+    "The name of the zip archive of the image with the given tag."
+    return image_tar_name(tag)[:-len('.tar')] + '.zip'
+
+
+def image_tar_name(tag):
+    "The name of the image's tarball within its zip archive."
+    return tag.replace('/', '_').replace(':', '_') + '.tar'
+
+
+def write_image_zip(docker, tag, out, **compression):
+    '''
+    Writes a zip archive holding the tarball of the image to out, which need
+    not be seekable. compression holds options of parallel_zip.write_zip
+    (e.g. the codec and number of workers).
+    '''
+    return parallel_zip.write_zip(out, image_tar_name(tag),
+                                  docker.get_image(tag), **compression)
+
+
+class _QueueWriter(object):
+    "A write-only file object handing what is written to a queue."
+
+    def __init__(self, chunks, aborted):
+        self.chunks = chunks
+        self.aborted = aborted
+
+    def write(self, data):
+        data = bytes(data)
+        while data:
+            if self.aborted.is_set():
+                raise ExportError('the archive is no longer being read.')
+            try:
+                self.chunks.put(data, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class ImageZipStream(io.RawIOBase):
+    '''
+    A readable stream of the zip archive of an image, produced by a thread as
+    it is read. The thread waits while max_pending chunks of the archive are
+    waiting to be read, so memory use stays bounded whatever the image size.
+
+    Errors exporting the image are raised (as ExportError) from `read`.
+    '''
+
+    def __init__(self, docker, tag, max_pending=16):
+        self._chunks = queue.Queue(max_pending)
+        self._aborted = threading.Event()
+        self._pending = b''
+        self._done = False
+        self._thread = threading.Thread(target=self._produce,
+                                        args=(docker, tag))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _produce(self, docker, tag):
+        try:
+            write_image_zip(docker, tag,
+                            _QueueWriter(self._chunks, self._aborted))
+        except Exception as e:
+            if self._aborted.is_set():
+                return
+            logging.debug('Exporting %s failed.', tag, exc_info=True)
+            self._chunks.put(e)
+        else:
+            self._chunks.put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            if self._done:
+                return 0
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._done = True
+                return 0
+            if isinstance(chunk, Exception):
+                self._done = True
+                if isinstance(chunk, ExportError):
+                    raise chunk
+                raise ExportError(chunk)
+            self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        "Stops exporting the image, if it is still being exported."
+        self._aborted.set()
+        super(ImageZipStream, self).close()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+A local index of the image layers uploaded to Coursera, keyed by their digest
+(the sha256 of the layer's tarball, as listed in the image's rootfs.diff_ids),
+and recorded with the grader each was uploaded with.
+
+Successive versions of a grader usually share all but their top layers. The
+index records which layers a course already has, for when Coursera can
+rebuild an image from the new layers alone; until then, `upload` always sends
+the full image.
+'''
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import os.path
+import tarfile
+import tempfile
+import time
+import zipfile
+
+INDEX_VERSION = 1
+
+# The number of uploads of each layer that are remembered.
+MAX_UPLOADS_PER_LAYER = 10
+
+
+class LayerError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'Could not read the image layers: %(msg)s' % {
+            'msg': self.msg,
+        }
+
+
+def _tar_member_name(archive):
+    "The name of the image tarball within an image zip file."
+    names = [name for name in archive.namelist() if name.endswith('.tar')]
+    if len(names) != 1:
+        raise LayerError('expected a single .tar file in the zip file, '
+                         'found %s.' % len(names))
+    return names[0]
+
+
+def read_image_layers(zip_path):
+    '''
+    Lists the layers of the image in an image zip file, bottom first, as
+    dictionaries holding the layer's digest, path within the image tarball
+    and size.
+    '''
+    try:
+        with zipfile.ZipFile(zip_path) as archive, \
+                archive.open(_tar_member_name(archive)) as tar_file, \
+                tarfile.open(fileobj=tar_file, mode='r:') as image:
+            manifest = json.load(image.extractfile('manifest.json'))
+            config = json.load(image.extractfile(manifest[0]['Config']))
+            paths = manifest[0]['Layers']
+            digests = config['rootfs']['diff_ids']
+            sizes = [image.getmember(path).size for path in paths]
+    except (zipfile.BadZipFile, tarfile.TarError, KeyError, IndexError,
+            TypeError, ValueError) as e:
+        raise LayerError('not an image saved by docker (%s).' % e)
+    if len(paths) != len(digests):
+        raise LayerError('the manifest lists %s layers, but the image '
+                         'configuration %s.' % (len(paths), len(digests)))
+    return [{'digest': digest, 'path': path, 'size': size}
+            for (digest, path, size) in zip(digests, paths, sizes)]
+
+
+class LayerIndex(object):
+    "The index of uploaded layers, stored as a JSON document at path."
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                document = json.load(f)
+        except (IOError, ValueError):
+            return {'version': INDEX_VERSION, 'layers': {}}
+        if document.get('version') != INDEX_VERSION:
+            logging.warn('Ignoring the layer index %s of unknown version %s.',
+                         self.path, document.get('version'))
+            return {'version': INDEX_VERSION, 'layers': {}}
+        return document
+
+    def _save(self, document):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                        prefix='.layer_index-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(document, f)
+            os.replace(tmp_path, self.path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    @contextlib.contextmanager
+    def _update(self):
+        "Yields the index for updating, then saves it, under a file lock."
+        dir_name = os.path.dirname(self.path)
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name, mode=0o700)
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                document = self.load()
+                yield document
+                self._save(document)
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def record(self, layers, course, grader_id):
+        "Records the layers as uploaded to the course with the grader."
+        with self._update() as document:
+            for layer in layers:
+                entry = document['layers'].setdefault(
+                    layer['digest'], {'size': layer.get('size'),
+                                      'uploads': []})
+                entry['uploads'] = entry['uploads'][
+                    -(MAX_UPLOADS_PER_LAYER - 1):] + [{
+                        'course': course,
+                        'graderId': grader_id,
+                        'uploaded': time.time(),
+                    }]
@@ -22,31 +22,63 @@ You may install it from source, or via pip.
 
 from coursera_autograder.commands import common
 from coursera_autograder.commands import oauth2
+from coursera_autograder.commands import output
+from coursera_autograder import utils
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 import requests
+import sys
 import urllib.parse
 
-
-def command_list_graders(args):
-    "Implements the list subcommand"
-
-    oauth2_instance = oauth2.build_oauth2(args)
-    auth = oauth2_instance.build_authorizer()
-
-    s = requests.Session()
-    s.auth = auth
-
-    result = s.get('%s%s' % (args.listGrader_endpoint, args.course))
+GRADER_FIELDS = ['course', 'graderId', 'filename']
+
+
+def course_ids(args):
+    """
+    Collects the course ids to list graders for from the command line and
+    from args.courses_file (`-` for stdin), which has one course id per line.
+    Blank lines and lines starting with `#` are ignored, as are duplicates.
+    """
+    courses = [args.course] if args.course else []
+    courses.extend(getattr(args, 'additional_courses', None) or [])
+    courses_file = getattr(args, 'courses_file', None)
+    if courses_file is not None:
+        if courses_file == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(courses_file, 'r') as f:
+                lines = f.read().splitlines()
+        courses.extend(line.strip() for line in lines
+                       if line.strip() and not line.strip().startswith('#'))
+    unique_courses = []
+    for course in courses:
+        if course not in unique_courses:
+            unique_courses.append(course)
+    return unique_courses
+
+
+def fetch_graders(session, args, course):
+    """
+    Retrieves the graders associated with a course. Returns the list of
+    grader elements, or None (after logging the reason) if they could not be
+    retrieved.
+    """
+    try:
+        result = session.get('%s%s' % (args.listGrader_endpoint, course))
+    except requests.exceptions.RequestException as e:
+        logging.error('\nUnable to list graders.\nCourseId: %s\nError: %s\n',
+                      course, e)
+        return None
     if result.status_code == 404:
         logging.error(
             '\nUnable to locate course with id %s.\n'
             'Status Code: 404 \n'
             'URL: %s \n'
             'Response: %s\n',
-            args.course,
+            course,
             result.url,
             result.text)
-        return 1
+        return None
     elif result.status_code != 200:
         logging.error(
             '\nUnable to list graders.\n'
@@ -54,22 +86,70 @@ def command_list_graders(args):
             'Status Code: %d \n'
             'URL: %s \n'
             'Response: %s\n',
-            args.course,
+            course,
             result.status_code,
             result.url,
             result.text
         )
-        return 1
+        return None
+
+    try:
+        return result.json()['elements']
+    except (ValueError, KeyError, TypeError) as e:
+        logging.error(
+            '\nUnable to list graders.\n'
+            'CourseId: %s\n'
+            'Could not parse the response (%s): %s\n',
+            course,
+            e,
+            result.text)
+        return None
+
 
-    elements = result.json()['elements']
-    print('Graders associated with course id %s:\n' % args.course)
+def write_graders(writer, course, elements):
+    writer.text('Graders associated with course id %s:\n' % course)
     for element in elements:
         course_grader_id = element['id']
         grader = course_grader_id.split('~')[-1]
         filename = element['filename']
-        print('Filename: %s\nGraderId: %s\n' % (filename, grader))
+        writer.write(
+            {'course': course, 'graderId': grader, 'filename': filename},
+            text='Filename: %s\nGraderId: %s\n' % (filename, grader))
 
-    return 0
+
+def command_list_graders(args):
+    "Implements the list subcommand"
+
+    courses = course_ids(args)
+    if not courses:
+        logging.error('No course ids were given.')
+        return 1
+
+    oauth2_instance = oauth2.build_oauth2(args)
+    auth = oauth2_instance.build_authorizer()
+
+    workers = min(getattr(args, 'workers', 1), len(courses))
+    s = utils.api_session(auth, pool_size=workers)
+
+    # Courses are printed as soon as they have been fetched, so the output is
+    # not necessarily in the order the courses were given in.
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            output.row_writer(args, GRADER_FIELDS) as writer:
+        futures = dict(
+            (executor.submit(fetch_graders, s, args, course), course)
+            for course in courses)
+        for future in as_completed(futures):
+            elements = future.result()
+            if elements is None:
+                failures += 1
+                continue
+            write_graders(writer, futures[future], elements)
+
+    if failures and len(courses) > 1:
+        logging.error('Unable to list graders for %d of %d courses.',
+                      failures, len(courses))
+    return 1 if failures else 0
 
 
 def setup_registration_parser(parser):
@@ -78,12 +158,33 @@ def setup_registration_parser(parser):
 
     parser.add_argument(
         'course',
+        nargs='?',
         help='The course id to look up. The course id is a '
         'gibberish string UUID. Given a course slug such as `developer-iot`, '
         'you can retrieve the course id by querying the catalog API. e.g.: '
         'https://api.coursera.org/api/onDemandCourses.v1?q=slug&'
         'slug=developer-iot')
 
+    parser.add_argument(
+        'additional_courses',
+        nargs='*',
+        metavar='course',
+        help='Further course ids to look up.')
+
+    parser.add_argument(
+        '--courses-file',
+        help='A file listing further course ids to look up, one per line. '
+        'Pass `-` to read them from standard input.')
+
+    parser.add_argument(
+        '--workers',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=8,
+        help='Number of courses to look up at the same time. '
+        '(Default: %(default)s)')
+
+    output.add_output_parser(parser)
+
     parser.add_argument(
         '--listGrader-endpoint',
         default='https://www.coursera.org/api/gridExecutors.v1/' +
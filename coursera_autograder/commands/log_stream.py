@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Follows a grader container's standard output and error while the grader runs,
+writing them to the terminal as they are produced and to log files in the
+destination directory, so that they neither have to be fetched once the grader
+exits nor be held in memory.
+'''
+
+import codecs
+import logging
+import os
+import threading
+
+STREAMS = ['stdout', 'stderr']
+
+# How long to wait for the log streams to end once the container stopped.
+FINISH_TIMEOUT = 10
+
+
+class RotatingLogFile(object):
+    '''
+    Writes a log to file_name, in binary. Once the file holds max_bytes, it
+    is moved to file_name.1 (replacing the previous one) and a new file is
+    started, so that no more than twice max_bytes are kept on disk.
+    '''
+
+    def __init__(self, file_name, max_bytes):
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.total = 0
+        self.rotated = False
+        self._file = open(file_name, 'wb')
+
+    def write(self, data):
+        self.total += len(data)
+        while data:
+            room = self.max_bytes - self.size
+            if room <= 0:
+                self._rotate()
+                room = self.max_bytes
+            self._file.write(data[:room])
+            self.size += len(data[:room])
+            data = data[room:]
+
+    def _rotate(self):
+        self._file.close()
+        os.replace(self.file_name, self.file_name + '.1')
+        self._file = open(self.file_name, 'wb')
+        self.size = 0
+        self.rotated = True
+
+    def close(self):
+        self._file.close()
+
+    def tail(self):
+        "Returns the last max_bytes written, once closed."
+        with open(self.file_name, 'rb') as f:
+            data = f.read()
+        if self.rotated and len(data) < self.max_bytes:
+            with open(self.file_name + '.1', 'rb') as f:
+                f.seek(len(data), os.SEEK_SET)
+                data = f.read() + data
+        return data
+
+
+class LogStreamer(object):
+    '''
+    Follows the standard output and error of a container, in a background
+    thread each, into rotating log files (stdout.log and stderr.log) in
+    dst_dir. If given, `echo` maps stream names to the text streams (e.g.
+    sys.stdout) to copy them to as well.
+    '''
+
+    def __init__(self, docker, container, dst_dir, max_bytes, echo=None):
+        self.docker = docker
+        self.container = container
+        self.max_bytes = max_bytes
+        self.echo = echo or {}
+        self.logs = dict(
+            (name, RotatingLogFile(os.path.join(dst_dir, name + '.log'),
+                                   max_bytes))
+            for name in STREAMS)
+        self.failed = []
+        self._echo_lock = threading.Lock()
+        self._threads = {}
+
+    def start(self):
+        "Starts following the container's logs. Call once it has started."
+        for name in STREAMS:
+            thread = threading.Thread(target=self._follow, args=(name, ))
+            thread.daemon = True
+            thread.start()
+            self._threads[name] = thread
+
+    def _follow(self, name):
+        log = self.logs[name]
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            for chunk in self.docker.logs(
+                    self.container, stdout=name == 'stdout',
+                    stderr=name == 'stderr', stream=True, follow=True):
+                log.write(chunk)
+                if name in self.echo:
+                    with self._echo_lock:
+                        self.echo[name].write(decoder.decode(chunk))
+                        self.echo[name].flush()
+        except Exception:
+            logging.debug('Stopped following the %s of container %s.', name,
+                          self.container, exc_info=True)
+            self.failed.append(name)
+
+    def finish(self):
+        '''
+        Waits for the logs to end (once the container has stopped) and closes
+        the log files. Returns the tail of (stdout, stderr), at most max_bytes
+        of each, or None for a stream that could not be followed to its end.
+        '''
+        complete = {}
+        for name in STREAMS:
+            self._threads[name].join(FINISH_TIMEOUT)
+            if self._threads[name].is_alive():
+                logging.warn('The %s of container %s did not end.', name,
+                             self.container)
+        with self._echo_lock:
+            for name in STREAMS:
+                self.logs[name].close()
+                complete[name] = (name not in self.failed and
+                                  not self._threads[name].is_alive())
+        for name in STREAMS:
+            if self.logs[name].rotated:
+                logging.warn('The grader wrote %s bytes to %s, more than the '
+                             'limit of %s; the oldest were discarded.',
+                             self.logs[name].total, name, self.max_bytes)
+        return tuple(self.logs[name].tail() if complete[name] else None
+                     for name in STREAMS)
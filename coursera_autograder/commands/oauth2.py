@@ -18,16 +18,20 @@
 Helpers for working with OAuth2 / etc.
 '''
 
-import http.server
+# http.server, pickle and subprocess are only needed to authorize new tokens
+# or to convert a legacy token cache, and are imported there.
+from coursera_autograder.commands import token_agent
 import configparser
-import pickle
+import contextlib
+import fcntl
+import json
 import logging
 import requests
 import io
 import os
 import os.path
-import subprocess
 import sys
+import tempfile
 import time
 import urllib.parse
 import uuid
@@ -99,6 +103,8 @@ def _make_handler(state_token, done_function):
     done_function is a function that is called, with the code passed to it.
     '''
 
+    import http.server
+
     class LocalServerHandler(http.server.BaseHTTPRequestHandler):
 
         def error_response(self, msg):
@@ -141,6 +147,12 @@ def _make_handler(state_token, done_function):
 
 OAUTH2_URL_BASE = 'https://accounts.coursera.org/oauth2/v1/'
 
+# The version of the token cache file format.
+TOKEN_CACHE_VERSION = 1
+
+# Tokens expiring sooner than this many seconds are not used.
+MIN_TOKEN_VALIDITY = 5 * 60
+
 
 class CourseraOAuth2(object):
     '''
@@ -169,8 +181,9 @@ class CourseraOAuth2(object):
                  auth_endpoint=OAUTH2_URL_BASE+'auth',
                  token_endpoint=OAUTH2_URL_BASE+'token',
                  verify_tls=True,
-                 token_cache_file='~/.coursera/oauth2_cache.pickle',
-                 local_webserver_port=9876):
+                 token_cache_file='~/.coursera/oauth2_cache.json',
+                 local_webserver_port=9876,
+                 token_agent_socket=None):
 
         self.client_id = client_id
         self.client_secret = client_secret
@@ -194,6 +207,8 @@ class CourseraOAuth2(object):
             pass
         # If not None, run a local webserver to hear the callback.
         self.local_webserver_port = local_webserver_port
+        # If not None, ask the token agent listening there first.
+        self.token_agent_socket = token_agent_socket
         self._token_cache = None
 
     @property
@@ -221,43 +236,102 @@ class CourseraOAuth2(object):
         try:
             logging.debug('About to read from local file cache file %s',
                           self.token_cache_file)
-            with open(self.token_cache_file, 'rb') as f:
-                fs_cached = pickle.load(f)
-                if self._check_token_cache_type(fs_cached):
-                    logging.debug('Loaded from file system: %s', fs_cached)
-                    return fs_cached
-                else:
-                    logging.warn('Found unexpected value in cache. %s',
-                                 fs_cached)
-                    return None
+            with open(self.token_cache_file, 'r') as f:
+                fs_cached = json.load(f)
         except IOError:
             logging.debug(
                 'Did not find file: %s on the file system.',
                 self.token_cache_file)
+            return self._load_legacy_token_cache()
+        except ValueError:
+            logging.warn('The token cache %s is not valid JSON. Ignoring...',
+                         self.token_cache_file)
+            return self._load_legacy_token_cache()
+
+        if (not isinstance(fs_cached, dict) or
+                fs_cached.get('version') != TOKEN_CACHE_VERSION):
+            logging.warn('Found unexpected version of the token cache. %s',
+                         self.token_cache_file)
+            return None
+        fs_cached = dict(fs_cached)
+        del fs_cached['version']
+        if self._check_token_cache_type(fs_cached):
+            logging.debug('Loaded from file system: %s', fs_cached)
+            return fs_cached
+        else:
+            logging.warn('Found unexpected value in cache. %s', fs_cached)
             return None
+
+    def _load_legacy_token_cache(self):
+        '''
+        Reads the tokens from a pickled cache, as written by earlier versions,
+        and converts it to the current format.
+        '''
+        legacy_file = os.path.splitext(self.token_cache_file)[0] + '.pickle'
+        if not os.path.isfile(legacy_file):
+            return None
+        import pickle
+        try:
+            with open(legacy_file, 'rb') as f:
+                fs_cached = pickle.load(f)
         except:
             logging.info(
-                'Encountered exception loading from the file system.',
+                'Encountered exception loading the legacy token cache.',
                 exc_info=True)
             return None
+        if not self._check_token_cache_type(fs_cached):
+            return None
+        logging.info('Converting the token cache %s to %s.',
+                     legacy_file, self.token_cache_file)
+        self._save_token_cache(fs_cached)
+        return fs_cached
 
     def _save_token_cache(self, new_cache):
-        'Write out to the filesystem a cache of the OAuth2 information.'
+        '''
+        Write out to the filesystem a cache of the OAuth2 information. The
+        cache is written to a temporary file which is then renamed over the
+        cache, so readers never see a partially written cache.
+        '''
         logging.debug('Looking to write to local authentication cache...')
         if not self._check_token_cache_type(new_cache):
             logging.error('Attempt to save a bad value: %s', new_cache)
             return
+        document = dict(new_cache)
+        document['version'] = TOKEN_CACHE_VERSION
         try:
             logging.debug('About to write to fs cache file: %s',
                           self.token_cache_file)
-            with open(self.token_cache_file, 'wb') as f:
-                pickle.dump(new_cache, f, protocol=pickle.HIGHEST_PROTOCOL)
-                logging.debug('Finished dumping cache_value to fs cache file.')
+            fd, tmp_file = tempfile.mkstemp(
+                dir=os.path.dirname(self.token_cache_file),
+                prefix='.oauth2_cache-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(document, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.token_cache_file)
+            except:
+                os.remove(tmp_file)
+                raise
+            logging.debug('Finished dumping cache_value to fs cache file.')
         except:
             logging.exception(
                 'Could not successfully cache OAuth2 secrets on the file '
                 'system.')
 
+    @contextlib.contextmanager
+    def _token_cache_lock(self):
+        '''
+        Holds an exclusive lock on the token cache, shared between all
+        processes using the same cache file.
+        '''
+        with open(self.token_cache_file + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
     def _check_token_cache_type(self, cache_value):
         '''
         Checks the cache_value for appropriate type correctness.
@@ -357,6 +431,9 @@ class CourseraOAuth2(object):
         Stands up a new localhost http server and retrieves new OAuth2 access
         tokens from the Coursera OAuth2 server.
         '''
+        import http.server
+        import subprocess
+
         logging.info('About to request new OAuth2 tokens from Coursera.')
         # Attempt to request new tokens from Coursera via the browser.
         state_token = uuid.uuid4().hex
@@ -419,18 +496,42 @@ class CourseraOAuth2(object):
                     'Encountered an exception during refresh token flow.')
         return None
 
-    def _cache_has_good_token(self):
-        'The cache must have a token, and it must expire in > 5 minutes'
+    def _is_good_token(self, tokens, min_validity=MIN_TOKEN_VALIDITY):
+        'There must be a token, and it must expire in > min_validity seconds'
         return (
-            self.token_cache is not None and
-            (time.time() + 5 * 60) < self.token_cache['expires']
+            tokens is not None and
+            (time.time() + min_validity) < tokens['expires']
         )
 
-    def build_authorizer(self):
-        if not self._cache_has_good_token():
+    def _cache_has_good_token(self):
+        'The cache must have a token, and it must expire in > 5 minutes'
+        return self._is_good_token(self.token_cache)
+
+    def refresh_tokens(self, min_validity=MIN_TOKEN_VALIDITY,
+                       interactive=True):
+        '''
+        Replaces the cached tokens with new ones, unless they are still valid
+        for more than min_validity seconds. Only one process refreshes the
+        tokens at a time: the others wait for it, and then use the tokens it
+        cached. If interactive is False, never falls back to authorizing in
+        the browser.
+
+        Returns True if the cache now holds a good token.
+        '''
+        with self._token_cache_lock():
+            # Another process may have refreshed the tokens while we waited.
+            cached = self._load_token_cache()
+            if self._is_good_token(cached, min_validity):
+                logging.debug('Another process refreshed the tokens.')
+                self._token_cache = cached
+                return True
+            if cached is not None:
+                self._token_cache = cached
             logging.debug('Attempting to use a refresh token.')
             new_tokens = self._exchange_refresh_tokens()
             if new_tokens is None:
+                if not interactive:
+                    return False
                 logging.info(
                     'Attempting to retrieve new tokens from the endpoint. You '
                     'will be prompted to authorize the coursera_autograder '
@@ -438,6 +539,26 @@ class CourseraOAuth2(object):
                 new_tokens = self._authorize_new_tokens()
             logging.debug('New tokens: %s', new_tokens)
             self.token_cache = new_tokens
+            return True
+
+    def _token_from_agent(self):
+        'Asks the token agent (if any) for a token that is not about to expire'
+        if self.token_agent_socket is None:
+            return None
+        tokens = token_agent.request_token(self.token_agent_socket)
+        if tokens is None or \
+                time.time() + MIN_TOKEN_VALIDITY >= tokens['expires']:
+            return None
+        return tokens
+
+    def build_authorizer(self):
+        agent_tokens = self._token_from_agent()
+        if agent_tokens is not None:
+            logging.debug('Using the token from the token agent.')
+            return CourseraOAuth2Auth(agent_tokens['token'],
+                                      agent_tokens['expires'])
+        if not self._cache_has_good_token():
+            self.refresh_tokens()
         else:
             logging.debug('Local cache is good.')
         return CourseraOAuth2Auth(self.token_cache['token'],
@@ -446,7 +567,7 @@ class CourseraOAuth2(object):
 
 def build_oauth2(args, cfg=None):
     if cfg is None:
-        cfg = configuration()
+        cfg = configuration(getattr(args, 'config', None))
 
     try:
         client_id = args.client_id
@@ -468,16 +589,30 @@ def build_oauth2(args, cfg=None):
     except:
         cache_filename = cfg.get('oauth2', 'token_cache')
 
+    try:
+        agent_socket = args.token_agent_socket
+    except:
+        agent_socket = cfg.get('oauth2', 'token_agent_socket', fallback=None)
+
     return CourseraOAuth2(
         client_id=client_id,
         client_secret=client_secret,
         scopes=scopes,
-        token_cache_file=cache_filename
+        auth_endpoint=cfg.get('oauth2', 'auth_endpoint',
+                              fallback=OAUTH2_URL_BASE + 'auth'),
+        token_endpoint=cfg.get('oauth2', 'token_endpoint',
+                               fallback=OAUTH2_URL_BASE + 'token'),
+        verify_tls=cfg.getboolean('oauth2', 'verify_tls', fallback=True),
+        token_cache_file=cache_filename,
+        token_agent_socket=agent_socket
     )
 
 
-def configuration():
-    'Loads configuration from the file system.'
+def configuration(config_file=None):
+    '''
+    Loads configuration from the file system. config_file, if given (e.g.
+    with --config), takes precedence over the standard locations.
+    '''
     defaults = '''
 [oauth2]
 client_id = NS8qaSX18X_Eu0pyNbLsnA
@@ -489,7 +624,8 @@ auth_endpoint = https://accounts.coursera.org/oauth2/v1/auth
 token_endpoint = https://accounts.coursera.org/oauth2/v1/token
 scopes = view_profile manage_graders
 verify_tls = True
-token_cache = ~/.coursera/oauth2_cache.pickle
+token_cache = ~/.coursera/oauth2_cache.json
+token_agent_socket = ~/.coursera/token_agent.sock
 
 [upload]
 transloadit_bored_api = https://api2.transloadit.com/instances/bored
@@ -500,5 +636,5 @@ transloadit_bored_api = https://api2.transloadit.com/instances/bored
         '/etc/coursera/coursera_autograder.cfg',
         os.path.expanduser('~/.coursera/coursera_autograder.cfg'),
         'coursera_autograder.cfg',
-    ])
+    ] + ([os.path.expanduser(config_file)] if config_file else []))
     return cfg
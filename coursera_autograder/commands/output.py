@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Output of the query commands, in human readable text or in a machine readable
+format (JSON, JSON Lines or CSV).
+
+Rows are written out as soon as they are produced, so that downstream tools
+can consume them without waiting for the whole command to complete.
+"""
+
+import csv
+import json
+import sys
+
+FORMATS = ['text', 'json', 'jsonl', 'csv']
+
+
+def add_output_parser(parser):
+    "Adds the --format option to a query command's parser."
+    parser.add_argument(
+        '--format',
+        choices=FORMATS,
+        default='text',
+        help='The output format. `json` writes a JSON array of objects, '
+        '`jsonl` writes one JSON object per line and `csv` writes a header '
+        'line followed by one line per row. (Default: %(default)s)')
+
+
+class RowWriter(object):
+    '''
+    Writes rows (dictionaries with the given fields) to a stream in one of
+    FORMATS. In the text format, only the human readable text passed alongside
+    the rows (or to `text`) is written.
+    '''
+
+    def __init__(self, output_format, fields, stream=None):
+        if output_format not in FORMATS:
+            raise ValueError('Unknown output format: %s' % output_format)
+        self.format = output_format
+        self.fields = fields
+        self.stream = stream
+        self.rows = 0
+        if self.format == 'csv':
+            self.csv_writer = csv.DictWriter(
+                self._stream(), fieldnames=fields, extrasaction='ignore',
+                lineterminator='\n')
+            self.csv_writer.writeheader()
+            self._flush()
+
+    def _stream(self):
+        # Resolved on every write, so that redirecting sys.stdout works.
+        return self.stream if self.stream is not None else sys.stdout
+
+    def _flush(self):
+        self._stream().flush()
+
+    def text(self, message):
+        "Writes a line of text, in the text format only."
+        if self.format == 'text':
+            print(message, file=self._stream())
+            self._flush()
+
+    def write(self, row, text=None):
+        "Writes a row, or its human readable text in the text format."
+        if self.format == 'text':
+            if text is not None:
+                self.text(text)
+            return
+        if self.format == 'csv':
+            self.csv_writer.writerow(row)
+        else:
+            document = json.dumps(
+                dict((field, row.get(field)) for field in self.fields))
+            if self.format == 'json':
+                document = ('[\n' if self.rows == 0 else ',\n') + document
+            else:
+                document += '\n'
+            self._stream().write(document)
+        self.rows += 1
+        self._flush()
+
+    def close(self):
+        if self.format == 'json':
+            self._stream().write('\n]\n' if self.rows else '[]\n')
+            self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def format_table(headers, rows):
+    "Lays out rows of strings as a table with aligned columns."
+    widths = [max([len(headers[i])] + [len(row[i]) for row in rows])
+              for i in range(len(headers))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for (cell, width) in zip(line, widths))
+        .rstrip()
+        for line in [headers] + rows) + '\n'
+
+
+def row_writer(args, fields):
+    "Creates a RowWriter for the format chosen on the command line."
+    return RowWriter(getattr(args, 'format', 'text'), fields)
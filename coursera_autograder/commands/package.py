@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The package subcommand builds the zip file of a grader image that the upload
+subcommand expects, from an image in the docker daemon or from a tarball
+written by `docker save`, compressing it on several threads at once.
+"""
+
+from coursera_autograder.commands import image_export
+from coursera_autograder.commands import parallel_zip
+from coursera_autograder import utils
+import logging
+import os
+import os.path
+import sys
+import tempfile
+import time
+
+
+def compression_options(args, progress=None):
+    "The options of parallel_zip.write_zip chosen on the command line."
+    return {
+        'codec': args.codec,
+        'level': args.level,
+        'workers': args.workers,
+        'block_size': args.block_size * 1024,
+        'progress': progress,
+    }
+
+
+def command_package(args):
+    "Implements the package subcommand"
+    quiet = bool(getattr(args, 'quiet', None))
+    last_report = [0]
+
+    def report_progress(size):
+        now = time.time()
+        if not quiet and now - last_report[0] >= 0.5:
+            last_report[0] = now
+            sys.stdout.write('\rPackaging... %.1f MB read.' % (
+                size / 1048576.0))
+            sys.stdout.flush()
+
+    output = os.path.abspath(os.path.expanduser(args.output))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(output),
+                                    prefix='.package-')
+    start = time.time()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if args.from_image is not None:
+                result = image_export.write_image_zip(
+                    utils.docker_client(args), args.from_image, out,
+                    **compression_options(args, report_progress))
+            else:
+                with open(args.image_tar, 'rb') as image_tar:
+                    result = parallel_zip.write_zip(
+                        out, os.path.basename(args.image_tar), image_tar,
+                        **compression_options(args, report_progress))
+        os.replace(tmp_path, output)
+    except Exception as e:
+        os.remove(tmp_path)
+        if not quiet:
+            sys.stdout.write('\n')
+        logging.error('Could not package the image: %s', e)
+        return 1
+
+    if not quiet:
+        sys.stdout.write(
+            '\rPackaged %(input).1f MB into %(output)s (%(compressed).1f MB) '
+            'in %(seconds).1f seconds.\n' % {
+                'input': result['size'] / 1048576.0,
+                'output': output,
+                'compressed': os.path.getsize(output) / 1048576.0,
+                'seconds': time.time() - start,
+            })
+        sys.stdout.flush()
+    logging.debug('CRC-32 of the image tarball: %08x', result['crc'])
+    return 0
+
+
+def parser(subparsers):
+    "Build an argparse argument parser to parse the command line."
+
+    # create the parser for the package command.
+    parser_package = subparsers.add_parser(
+        'package',
+        help='Package a container image as the zip file to upload.')
+    parser_package.set_defaults(func=command_package)
+
+    parser_package.add_argument(
+        'output',
+        help='Path of the zip file to write.')
+
+    source = parser_package.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        '--from-image',
+        metavar='TAG',
+        help='Export the image with this tag (or id) from the docker daemon.')
+    source.add_argument(
+        '--image-tar',
+        help='Package a tarball of the image written by `docker save`.')
+
+    parser_package.add_argument(
+        '--codec',
+        choices=sorted(parallel_zip.CODECS),
+        default='deflate',
+        help='How to compress the image. `store` does not compress it at '
+             'all. (Default: %(default)s)')
+
+    parser_package.add_argument(
+        '--level',
+        type=lambda value: utils.check_int_range(value, lower=0, upper=9),
+        default=6,
+        help='The deflate compression level, from 0 (fastest) to 9 '
+             '(smallest). (Default: %(default)s)')
+
+    parser_package.add_argument(
+        '--workers',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=os.cpu_count() or 1,
+        help='Number of threads compressing the image. (Default: the number '
+             'of CPUs, %(default)s)')
+
+    parser_package.add_argument(
+        '--block-size',
+        type=lambda value: utils.check_int_range(value, lower=64),
+        default=parallel_zip.DEFAULT_BLOCK_SIZE // 1024,
+        help='Size of the blocks compressed independently, in KB. Larger '
+             'blocks compress slightly better. (Default: %(default)s)')
+
+    return parser_package
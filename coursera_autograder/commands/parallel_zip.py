@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Writes zip archives holding a single (large) file, compressing it in blocks on
+a pool of threads, as pigz does.
+
+Each block is deflated independently, primed with the last 32 KB of the
+previous block as a dictionary, and ends on a byte boundary (a sync flush), so
+the compressed blocks concatenate into one standard deflate stream that any
+unzip tool reads. The CRC-32 of each block is computed by the thread
+compressing it, and combined in order, so the input is read only once.
+
+The archive is always written in the zip64 format, as images may exceed 4 GB.
+If the output is not seekable, the sizes and CRC-32 follow the data in a data
+descriptor; otherwise they are written back into the local file header.
+'''
+
+import collections
+import functools
+import os
+import struct
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# The codecs that unzip tools (and so the registration pipeline) support, and
+# their zip compression methods.
+CODECS = {
+    'deflate': zipfile.ZIP_DEFLATED,
+    'store': zipfile.ZIP_STORED,
+}
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+DICTIONARY_SIZE = 32 * 1024
+
+ZIP64_VERSION = 45
+ZIP64_EXTRA_ID = 0x0001
+FLAG_DATA_DESCRIPTOR = 0x08
+UNIX_FILE_ATTRIBUTES = (0o100644 << 16)
+
+# Reflected CRC-32 polynomial, as used by zip.
+CRC32_POLYNOMIAL = 0xedb88320
+
+
+def _multiply_mod_p(a, b):
+    "Multiplies two polynomials modulo the CRC-32 polynomial. a is not zero."
+    m = 1 << 31
+    p = 0
+    while True:
+        if a & m:
+            p ^= b
+            if (a & (m - 1)) == 0:
+                return p
+        m >>= 1
+        b = (b >> 1) ^ CRC32_POLYNOMIAL if b & 1 else b >> 1
+
+
+# x^(2^n) modulo the polynomial, for n from 0 to 31.
+_X2N = [1 << 30]
+for _ in range(31):
+    _X2N.append(_multiply_mod_p(_X2N[-1], _X2N[-1]))
+
+
+@functools.lru_cache(maxsize=64)
+def _crc32_shift(length):
+    "x^(8 * length) modulo the polynomial: shifts a CRC past length bytes."
+    p = 1 << 31
+    k = 3
+    while length:
+        if length & 1:
+            p = _multiply_mod_p(_X2N[k & 31], p)
+        length >>= 1
+        k += 1
+    return p
+
+
+def crc32_combine(crc1, crc2, length2):
+    '''
+    Returns the CRC-32 of the concatenation of two byte strings, given their
+    CRC-32s and the length of the second one (like zlib's crc32_combine).
+    '''
+    return _multiply_mod_p(_crc32_shift(length2), crc1) ^ crc2
+
+
+def _deflate_block(block, dictionary, level):
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(block) + compressor.flush(
+        zlib.Z_SYNC_FLUSH)
+    return (compressed, zlib.crc32(block), len(block))
+
+
+def _store_block(block):
+    return (block, zlib.crc32(block), len(block))
+
+
+def compressed_blocks(source, codec='deflate', level=6, workers=None,
+                      block_size=DEFAULT_BLOCK_SIZE):
+    '''
+    Reads source to its end, yielding a (compressed data, CRC-32, length)
+    tuple for each block of it, in order. Up to `workers` blocks are
+    compressed at the same time, and at most twice as many are held in
+    memory.
+    '''
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        previous = b''
+        for block in iter(lambda: source.read(block_size), b''):
+            if codec == 'deflate':
+                pending.append(executor.submit(
+                    _deflate_block, block, previous[-DICTIONARY_SIZE:],
+                    level))
+                previous = block
+            else:
+                pending.append(executor.submit(_store_block, block))
+            while len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    if codec == 'deflate':
+        # An empty final block ends the deflate stream.
+        yield (zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+               .flush(), 0, 0)
+
+
+def _dos_date_time(timestamp):
+    t = time.localtime(timestamp)
+    return ((t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday,
+            t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2)
+
+
+def _seekable(out):
+    try:
+        return out.seekable()
+    except AttributeError:
+        return False
+
+
+def write_zip(out, member_name, source, codec='deflate', level=6,
+              workers=None, block_size=DEFAULT_BLOCK_SIZE, progress=None,
+              mtime=None):
+    '''
+    Writes a zip archive to out holding a single file, member_name, with the
+    contents read from source, compressed with the codec (see CODECS).
+
+    progress, if given, is called with the number of bytes read from source
+    so far after each block. Returns a dictionary with the CRC-32, size and
+    compressed size of the file.
+    '''
+    if codec not in CODECS:
+        raise ValueError('Unknown codec: %s' % codec)
+    seekable = _seekable(out)
+    start = out.tell() if seekable else 0
+    name = member_name.encode('utf-8')
+    flags = 0 if seekable else FLAG_DATA_DESCRIPTOR
+    if len(name) != len(member_name):
+        flags |= 0x800  # The name is encoded in UTF-8.
+    date, time_of_day = _dos_date_time(
+        mtime if mtime is not None else time.time())
+
+    def local_header(crc, size, compressed_size):
+        return struct.pack(
+            '<4s5HL2L2H', b'PK\x03\x04', ZIP64_VERSION, flags,
+            CODECS[codec], time_of_day, date, crc, 0xffffffff, 0xffffffff,
+            len(name), 20) + name + struct.pack(
+                '<2H2Q', ZIP64_EXTRA_ID, 16, size, compressed_size)
+
+    out.write(local_header(0, 0, 0))
+    data_offset = len(name) + 50
+
+    crc = 0
+    size = 0
+    compressed_size = 0
+    for (compressed, block_crc, length) in compressed_blocks(
+            source, codec, level, workers, block_size):
+        out.write(compressed)
+        crc = crc32_combine(crc, block_crc, length)
+        size += length
+        compressed_size += len(compressed)
+        if progress is not None and length:
+            progress(size)
+
+    if seekable:
+        end = out.tell()
+        out.seek(start)
+        out.write(local_header(crc, size, compressed_size))
+        out.seek(end)
+    else:
+        out.write(struct.pack('<4sL2Q', b'PK\x07\x08', crc, compressed_size,
+                              size))
+    central_directory_offset = (
+        start + data_offset + compressed_size + (0 if seekable else 24))
+
+    central_directory = struct.pack(
+        '<4s6HL2L5H2L', b'PK\x01\x02', (3 << 8) | ZIP64_VERSION,
+        ZIP64_VERSION, flags, CODECS[codec], time_of_day, date, crc,
+        0xffffffff, 0xffffffff, len(name), 28, 0, 0, 0, UNIX_FILE_ATTRIBUTES,
+        0xffffffff) + name + struct.pack(
+            '<2H3Q', ZIP64_EXTRA_ID, 24, size, compressed_size, start)
+    zip64_end_offset = central_directory_offset + len(central_directory)
+    out.write(central_directory)
+    out.write(struct.pack(
+        '<4sQ2H2L4Q', b'PK\x06\x06', 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+        1, 1, len(central_directory), central_directory_offset))
+    out.write(struct.pack('<4sLQL', b'PK\x06\x07', 0, zip64_end_offset, 1))
+    out.write(struct.pack(
+        '<4s4H2LH', b'PK\x05\x06', 0, 0, 1, 1, len(central_directory),
+        0xffffffff, 0))
+    return {'crc': crc, 'size': size, 'compressedSize': compressed_size}
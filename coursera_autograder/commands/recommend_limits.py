@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The recommend_limits subcommand grades a sample of submissions locally at the
+CPU and memory tiers graders can reserve in production, and recommends the
+cheapest tier that grades them within a target time.
+"""
+
+import argparse
+from coursera_autograder.commands import common
+from coursera_autograder.commands import grade
+from coursera_autograder.commands import output
+from coursera_autograder.commands import timings
+from coursera_autograder import utils
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+# The (CPUs, memory in MB) tiers graders can reserve. See the --grader-cpu and
+# --grader-memory-limit options of upload.
+TIERS = [
+    (1, 4096), (1, 8192),
+    (2, 4096), (2, 8192), (2, 16384),
+    (4, 8192), (4, 16384),
+]
+
+# To order tiers by cost, a CPU is taken to cost as much as this much memory.
+CPU_COST_MB = 4096
+
+# The time, in seconds, production may take to schedule a grading and start
+# its container, on top of the time measured locally, and the lowest wall
+# clock timeout recommended.
+STARTUP_OVERHEAD = 30
+MIN_WALL_CLOCK_TIMEOUT = 60
+
+TIER_FIELDS = ['cpus', 'memoryMb', 'gradings', 'timeouts', 'oomKills',
+               'failed', 'p50Seconds', 'p90Seconds', 'p99Seconds',
+               'maxSeconds', 'peakMemoryMb', 'wallClockTimeout', 'meetsTarget',
+               'recommended']
+
+
+def tier_cost(tier):
+    "A sort key putting the cheapest tiers first."
+    cpus, memory = tier
+    return (cpus * CPU_COST_MB + memory, cpus)
+
+
+def parse_tiers(value):
+    "Parses a comma separated list of CPUS:MEMORY tiers."
+    tiers = []
+    for item in value.split(','):
+        try:
+            cpus, memory = item.split(':')
+            tier = (int(cpus), int(memory))
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                '%s is not of the form CPUS:MEMORY (e.g. 2:8192)' % item)
+        if tier[0] < 1 or tier[1] % 1024 != 0 or tier[1] <= 0:
+            raise argparse.ArgumentTypeError(
+                'Tier %s needs at least one CPU and a multiple of 1024 MB of '
+                'memory.' % item)
+        tiers.append(tier)
+    return tiers
+
+
+def grading_seconds(result):
+    "The time a grading took, from starting its container to its exit."
+    phases = result['timings']['phases']
+    return phases.get('start', 0) + phases.get('grader', 0)
+
+
+def summarize_tier(tier, results, target, margin):
+    '''
+    Summarizes the gradings of a tier. The tier meets the target if none of
+    the gradings failed (which includes timing out, exiting with an error and
+    writing invalid feedback) or ran out of memory, and both its 99th
+    percentile grading time and its peak memory, increased by the safety
+    margin, fit within the target time and the tier's memory. The wall clock
+    timeout to set is the longest grading time, increased by the margin or by
+    STARTUP_OVERHEAD (whichever is more), and at least
+    MIN_WALL_CLOCK_TIMEOUT.
+    '''
+    cpus, memory = tier
+    timeouts = sum(1 for r in results if r['timedOut'])
+    oom_kills = sum(1 for r in results
+                    if (r.get('resources') or {}).get('oomKilled'))
+    seconds = [grading_seconds(r) for r in results if not r['timedOut']]
+    peaks = [r['resources']['peakMemoryBytes'] for r in results
+             if (r.get('resources') or {}).get('peakMemoryBytes') is not None]
+    summary = {
+        'cpus': cpus,
+        'memoryMb': memory,
+        'gradings': len(results),
+        'timeouts': timeouts,
+        'oomKills': oom_kills,
+        'failed': sum(1 for r in results
+                      if r['exitCode'] != 0 or r['errors']),
+        'p50Seconds': None,
+        'p90Seconds': None,
+        'p99Seconds': None,
+        'maxSeconds': None,
+        'peakMemoryMb': (round(max(peaks) / (1024.0 * 1024), 1)
+                         if peaks else None),
+        'wallClockTimeout': None,
+        'meetsTarget': False,
+        'recommended': False,
+    }
+    if seconds:
+        for p in (50, 90, 99):
+            summary['p%sSeconds' % p] = round(
+                timings.percentile(seconds, p), 3)
+        summary['maxSeconds'] = round(max(seconds), 3)
+        summary['wallClockTimeout'] = max(
+            int(math.ceil(summary['maxSeconds'] * (1 + margin))),
+            int(math.ceil(summary['maxSeconds'] + STARTUP_OVERHEAD)),
+            MIN_WALL_CLOCK_TIMEOUT)
+        summary['meetsTarget'] = (
+            summary['failed'] == 0 and oom_kills == 0 and
+            summary['p99Seconds'] * (1 + margin) <= target and
+            (summary['peakMemoryMb'] is None or
+             summary['peakMemoryMb'] * (1 + margin) <= memory))
+    return summary
+
+
+def tier_text(summary):
+    if summary['p50Seconds'] is None:
+        timing = 'every grading timed out'
+    else:
+        timing = 'p50 %.1f s, p99 %.1f s, max %.1f s' % (
+            summary['p50Seconds'], summary['p99Seconds'],
+            summary['maxSeconds'])
+    if summary['peakMemoryMb'] is not None:
+        timing += ', peak memory %.0f MB' % summary['peakMemoryMb']
+    problems = []
+    for (field, name) in (('timeouts', 'timed out'),
+                          ('oomKills', 'ran out of memory'),
+                          ('failed', 'failed')):
+        if summary[field]:
+            problems.append('%s %s' % (summary[field], name))
+    if problems:
+        timing += ' (%s)' % ', '.join(problems)
+    return '%s CPU, %s MB: %s: %s' % (
+        summary['cpus'], summary['memoryMb'], timing,
+        'meets the target' if summary['meetsTarget'] else
+        'does not meet the target')
+
+
+def grading_runs(submissions, runs):
+    "Repeats the submissions `runs` times, giving each run a unique name."
+    if runs == 1:
+        return submissions
+    return [('%s.%s' % (name, run), directory, environment)
+            for run in range(1, runs + 1)
+            for (name, directory, environment) in submissions]
+
+
+def measure_tier(docker, args, tier, submissions, dst_dir):
+    "Grades the submissions with the tier's limits, returning the results."
+    cpus, memory = tier
+    tier_args = argparse.Namespace(**vars(args))
+    tier_args.cpus = cpus
+    tier_args.mem_limit = memory
+    tier_args.dst_dir = os.path.join(dst_dir, '%scpu-%smb' % tier)
+    tier_args.no_rm = False
+    tier_args.no_resource_stats = False
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        return list(executor.map(
+            lambda submission: grade.grade_submission(
+                docker, tier_args, *submission),
+            grading_runs(submissions, args.runs)))
+
+
+def write_manifest(file_name, assignment_part, tier, timeout):
+    "Writes the recommendation as an update_resource_limits manifest."
+    course, item, part = assignment_part
+    with open(file_name, 'w') as f:
+        json.dump([{
+            'course': course,
+            'item': item,
+            'part': part,
+            'reservedCpu': tier[0],
+            'reservedMemory': tier[1],
+            'wallClockTimeout': timeout,
+        }], f, indent=2)
+        f.write('\n')
+
+
+def command_recommend_limits(args):
+    """
+    Implements the recommend_limits subcommand: grades the submissions at each
+    tier, cheapest first, until one meets the target.
+    """
+    try:
+        environment_variable = json.loads(args.envVar)
+    except ValueError:
+        logging.error("envVar was not a valid JSON document.")
+        return 1
+    try:
+        submissions = grade.find_submissions(
+            args.submissions, environment_variable)
+    except (IOError, ValueError) as e:
+        logging.error("Could not read the submissions to grade: %s", e)
+        return 1
+    if len(submissions) == 0:
+        logging.error("No submissions found in %s.", args.submissions)
+        return 1
+    if args.timeout is None:
+        args.timeout = int(math.ceil(args.target_p99))
+
+    d = utils.docker_client(args)
+    d.inspect_image(args.containerTag)  # Fail fast on an unknown image.
+    dst_dir = args.dst_dir or tempfile.mkdtemp(prefix='recommend-limits-')
+    host_cpus = os.cpu_count() or 1
+    recommended = None
+    try:
+        with output.row_writer(args, TIER_FIELDS) as writer:
+            for tier in sorted(args.tiers, key=tier_cost):
+                if tier[0] > host_cpus:
+                    logging.warn('Skipping the %s CPU tier: this machine only '
+                                 'has %s CPUs.', tier[0], host_cpus)
+                    continue
+                logging.info('Grading %s submissions with %s CPU and %s MB.',
+                             len(submissions) * args.runs, *tier)
+                results = measure_tier(d, args, tier, submissions, dst_dir)
+                summary = summarize_tier(
+                    tier, results, args.target_p99, args.margin)
+                if summary['meetsTarget'] and recommended is None:
+                    summary['recommended'] = True
+                    recommended = summary
+                writer.write(summary, text=tier_text(summary))
+                if recommended is not None and not args.all_tiers:
+                    break
+    finally:
+        if args.dst_dir is None:
+            shutil.rmtree(dst_dir, ignore_errors=True)
+
+    if recommended is None:
+        logging.error('None of the tiers grades the submissions within %s '
+                      'seconds (p99, with a %s%% margin).', args.target_p99,
+                      int(args.margin * 100))
+        return 1
+    tier = (recommended['cpus'], recommended['memoryMb'])
+    timeout = recommended['wallClockTimeout']
+    assignment_part = args.assignment_part or ['COURSE', 'ITEM', 'PART']
+    if args.format == 'text':
+        sys.stdout.write(
+            '\nRecommended: %s CPU, %s MB and a wall clock timeout of %s '
+            'seconds:\n\n    coursera_autograder update_resource_limits '
+            '%s %s %s --grader-cpu %s --grader-memory-limit %s '
+            '--grader-timeout %s\n' % (
+                tier[0], tier[1], timeout, assignment_part[0],
+                assignment_part[1], assignment_part[2], tier[0], tier[1],
+                timeout))
+    if args.write_manifest:
+        write_manifest(args.write_manifest, assignment_part, tier, timeout)
+    return 0
+
+
+def parser(subparsers):
+    "Build an argparse argument parser to parse the command line."
+
+    # create the parser for the recommend_limits command
+    parser_recommend_limits = subparsers.add_parser(
+        'recommend_limits',
+        help='Recommends the CPU, memory and timeout limits of a grader by '
+             'grading sample submissions locally.',
+        description=sys.modules[__name__].__doc__,
+        parents=[common.container_parser()])
+    parser_recommend_limits.set_defaults(func=command_recommend_limits)
+
+    parser_recommend_limits.add_argument(
+        'submissions',
+        help='Directory whose subdirectories each contain a sample '
+             'submission, or a manifest file listing them (see `grade '
+             'batch`).')
+    parser_recommend_limits.add_argument(
+        'envVar',
+        help='Environment variable that passed into the containers')
+    parser_recommend_limits.add_argument(
+        '--target-p99',
+        type=float,
+        default=1200,
+        help='The time, in seconds, within which 99%% of the submissions '
+             'should be graded. (Default: %(default)s, the default wall '
+             'clock timeout)')
+    parser_recommend_limits.add_argument(
+        '--margin',
+        type=float,
+        default=0.25,
+        help='The safety margin to leave below the target time and each '
+             'tier\'s memory, as a fraction of the measured time and peak '
+             'memory. (Default: %(default)s)')
+    parser_recommend_limits.add_argument(
+        '--tiers',
+        type=parse_tiers,
+        default=TIERS,
+        help='The tiers to try, as a comma separated list of CPUS:MEMORY '
+             '(in MB). (Default: %s)' % ','.join(
+                 '%s:%s' % tier for tier in TIERS))
+    parser_recommend_limits.add_argument(
+        '--all-tiers',
+        action='store_true',
+        help='Measure every tier, rather than stopping at the cheapest one '
+             'that meets the target.')
+    parser_recommend_limits.add_argument(
+        '--runs',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=1,
+        help='The number of times to grade each submission at each tier. '
+             '(Default: %(default)s)')
+    parser_recommend_limits.add_argument(
+        '--workers',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=1,
+        help='The number of submissions to grade concurrently. Gradings '
+             'running side by side compete for CPUs and memory bandwidth, '
+             'which skews their times. (Default: %(default)s)')
+    parser_recommend_limits.add_argument(
+        '--timeout',
+        type=int,
+        help='Stop gradings after TIMEOUT seconds. (Default: the target '
+             'time)')
+    parser_recommend_limits.add_argument(
+        '--dst-dir',
+        type=common.arg_fq_dir,
+        help='Keep the output of every grading in this directory, in a '
+             'subdirectory per tier. (Default: discard it)')
+    parser_recommend_limits.add_argument(
+        '--assignment-part',
+        nargs=3,
+        metavar=('COURSE', 'ITEM', 'PART'),
+        help='The assignment part the grader is for, to fill in the '
+             'recommended update_resource_limits command.')
+    parser_recommend_limits.add_argument(
+        '--write-manifest',
+        metavar='FILE',
+        help='Write the recommendation to FILE as a manifest for '
+             '`update_resource_limits --manifest`.')
+    output.add_output_parser(parser_recommend_limits)
+    return parser_recommend_limits
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Measures the resources a grader container uses while the grader runs: its peak
+memory, CPU time (and time spent throttled), block I/O and wall time.
+
+When the docker daemon runs on this machine, the container's cgroup counters
+are read directly, every SAMPLE_INTERVAL seconds. Otherwise, they are read from
+the (roughly once a second) samples of the docker stats API.
+'''
+
+import json
+import logging
+import os
+import os.path
+import threading
+import time
+
+from coursera_autograder.commands import output
+
+REPORT_FILE = 'resources.json'
+SAMPLE_INTERVAL = 0.1
+CGROUP_ROOT = '/sys/fs/cgroup'
+PROC_ROOT = '/proc'
+
+# Warn when the grader's peak memory comes closer than this to the limit.
+MEMORY_HEADROOM_WARNING = 0.1
+
+# The counters of a sample that only ever grow while the container runs.
+COUNTERS = ['cpu', 'throttled', 'throttledPeriods', 'readBytes', 'writeBytes']
+
+
+def _read(file_name):
+    with open(file_name, 'r') as f:
+        return f.read()
+
+
+def _read_int(file_name):
+    return int(_read(file_name).strip())
+
+
+def _read_fields(file_name):
+    "Reads a file of 'name value' lines (e.g. cpu.stat) into a dictionary."
+    fields = {}
+    for line in _read(file_name).splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            fields[parts[0]] = int(parts[1])
+    return fields
+
+
+def _read_optional_int(file_name):
+    try:
+        return _read_int(file_name)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+class CgroupCounters(object):
+    '''
+    Reads the resource counters of a container from its cgroup, under either
+    the unified (v2) or the legacy (v1) cgroup hierarchy.
+    '''
+
+    def __init__(self, paths):
+        # Either {'unified': dir} or a {controller: dir} for v1 controllers.
+        self.paths = paths
+
+    @classmethod
+    def find(cls, container_id, pid, cgroup_root=CGROUP_ROOT,
+             proc_root=PROC_ROOT):
+        '''
+        Finds the cgroup of the container from the cgroup membership of its
+        main process. Returns None if it is not visible from this machine
+        (e.g. the docker daemon runs in a virtual machine).
+        '''
+        try:
+            membership = _read(
+                os.path.join(proc_root, str(pid), 'cgroup')).splitlines()
+        except (IOError, OSError):
+            return None
+        paths = {}
+        for line in membership:
+            parts = line.split(':', 2)
+            if len(parts) != 3 or container_id not in parts[2]:
+                continue
+            relative_path = parts[2].lstrip('/')
+            if parts[0] == '0' and parts[1] == '':
+                paths['unified'] = os.path.join(cgroup_root, relative_path)
+            for controller in parts[1].split(','):
+                if controller in ('memory', 'cpu', 'cpuacct', 'blkio'):
+                    paths[controller] = os.path.join(
+                        cgroup_root, controller, relative_path)
+        if os.path.isfile(os.path.join(paths.get('unified', ''),
+                                       'memory.current')):
+            paths = {'unified': paths['unified']}
+        else:
+            # Hybrid hierarchies also list a unified cgroup without any
+            # controllers.
+            paths.pop('unified', None)
+        paths = dict((controller, cgroup_path)
+                     for (controller, cgroup_path) in paths.items()
+                     if os.path.isdir(cgroup_path))
+        if not paths:
+            return None
+        return cls(paths)
+
+    def sample(self):
+        '''
+        Returns the current counters, or None once the cgroup is gone. Memory
+        figures exclude the inactive page cache, like `docker stats`.
+        '''
+        try:
+            if 'unified' in self.paths:
+                return self._sample_unified(self.paths['unified'])
+            return self._sample_legacy()
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def _sample_unified(self, cgroup_dir):
+        memory_stat = _read_fields(os.path.join(cgroup_dir, 'memory.stat'))
+        cpu_stat = _read_fields(os.path.join(cgroup_dir, 'cpu.stat'))
+        read_bytes = write_bytes = 0
+        try:
+            io_stat = _read(os.path.join(cgroup_dir, 'io.stat'))
+        except (IOError, OSError):
+            io_stat = ''
+        for line in io_stat.splitlines():
+            for field in line.split()[1:]:
+                name, _, value = field.partition('=')
+                if name == 'rbytes':
+                    read_bytes += int(value)
+                elif name == 'wbytes':
+                    write_bytes += int(value)
+        return {
+            'memory': (_read_int(os.path.join(cgroup_dir, 'memory.current')) -
+                       memory_stat.get('inactive_file', 0)),
+            'peakMemory': _read_optional_int(
+                os.path.join(cgroup_dir, 'memory.peak')),
+            'cpu': cpu_stat['usage_usec'] / 1e6,
+            'throttled': cpu_stat.get('throttled_usec', 0) / 1e6,
+            'throttledPeriods': cpu_stat.get('nr_throttled', 0),
+            'readBytes': read_bytes,
+            'writeBytes': write_bytes,
+        }
+
+    def _sample_legacy(self):
+        memory_dir = self.paths['memory']
+        memory_stat = _read_fields(os.path.join(memory_dir, 'memory.stat'))
+        cpuacct_dir = self.paths.get('cpuacct', self.paths.get('cpu'))
+        cpu_stat = {}
+        if 'cpu' in self.paths:
+            cpu_stat = _read_fields(os.path.join(self.paths['cpu'],
+                                                 'cpu.stat'))
+        read_bytes = write_bytes = 0
+        if 'blkio' in self.paths:
+            io_service_bytes = _read(os.path.join(
+                self.paths['blkio'], 'blkio.throttle.io_service_bytes'))
+            for line in io_service_bytes.splitlines():
+                parts = line.split()
+                if len(parts) == 3 and parts[1] == 'Read':
+                    read_bytes += int(parts[2])
+                elif len(parts) == 3 and parts[1] == 'Write':
+                    write_bytes += int(parts[2])
+        return {
+            'memory': (
+                _read_int(os.path.join(memory_dir, 'memory.usage_in_bytes')) -
+                memory_stat.get('total_inactive_file', 0)),
+            'peakMemory': _read_optional_int(
+                os.path.join(memory_dir, 'memory.max_usage_in_bytes')),
+            'cpu': _read_int(os.path.join(cpuacct_dir, 'cpuacct.usage')) / 1e9,
+            'throttled': cpu_stat.get('throttled_time', 0) / 1e9,
+            'throttledPeriods': cpu_stat.get('nr_throttled', 0),
+            'readBytes': read_bytes,
+            'writeBytes': write_bytes,
+        }
+
+
+def parse_docker_stats(stats):
+    '''
+    Converts a sample of the docker stats API into the counters returned by
+    CgroupCounters.sample. Returns None for the empty samples of a stopped
+    container.
+    '''
+    memory_stats = stats.get('memory_stats') or {}
+    cpu_stats = stats.get('cpu_stats') or {}
+    if 'usage' not in memory_stats or 'cpu_usage' not in cpu_stats:
+        return None
+    memory_stat = memory_stats.get('stats') or {}
+    inactive_file = memory_stat.get(
+        'total_inactive_file', memory_stat.get('inactive_file', 0))
+    throttling = cpu_stats.get('throttling_data') or {}
+    read_bytes = write_bytes = 0
+    blkio_stats = stats.get('blkio_stats') or {}
+    for entry in blkio_stats.get('io_service_bytes_recursive') or []:
+        if entry.get('op', '').lower() == 'read':
+            read_bytes += entry.get('value', 0)
+        elif entry.get('op', '').lower() == 'write':
+            write_bytes += entry.get('value', 0)
+    return {
+        'memory': memory_stats['usage'] - inactive_file,
+        'peakMemory': memory_stats.get('max_usage'),
+        'cpu': cpu_stats['cpu_usage'].get('total_usage', 0) / 1e9,
+        'throttled': throttling.get('throttled_time', 0) / 1e9,
+        'throttledPeriods': throttling.get('throttled_periods', 0),
+        'readBytes': read_bytes,
+        'writeBytes': write_bytes,
+    }
+
+
+class ResourceMonitor(object):
+    '''
+    Samples the resource usage of a running container in a background thread,
+    from start() until stop().
+
+    The counters of a fresh container cover the container's whole life. Pass
+    cumulative=False for containers that were running before (e.g. warm
+    containers), so that usage is counted from the first sample instead and
+    the kernel's peak memory high watermark (which would include earlier
+    runs) is ignored.
+    '''
+
+    def __init__(self, docker, container, cumulative=True,
+                 interval=SAMPLE_INTERVAL):
+        self.docker = docker
+        self.container = container
+        self.cumulative = cumulative
+        self.interval = interval
+        self.samples = []
+        self.source = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._cgroup = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        inspected = self.docker.inspect_container(self.container)
+        pid = (inspected.get('State') or {}).get('Pid')
+        if pid:
+            self._cgroup = CgroupCounters.find(inspected['Id'], pid)
+        if self._cgroup is not None:
+            self.source = 'cgroup'
+            self._add(self._cgroup.sample())
+            target = self._sample_cgroup
+        else:
+            self.source = 'docker stats'
+            target = self._sample_docker_stats
+        self._thread = threading.Thread(target=target)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _add(self, sample):
+        if sample is not None:
+            with self._lock:
+                self.samples.append(sample)
+
+    def _sample_cgroup(self):
+        while not self._stopping.wait(self.interval):
+            sample = self._cgroup.sample()
+            if sample is None:
+                return
+            self._add(sample)
+
+    def _sample_docker_stats(self):
+        try:
+            for stats in self.docker.stats(self.container, decode=True):
+                if self._stopping.is_set():
+                    return
+                self._add(parse_docker_stats(stats))
+        except Exception:
+            logging.debug('Could not read the stats of container %s.',
+                          self.container, exc_info=True)
+
+    def stop(self, memory_limit=None):
+        '''
+        Stops sampling and returns the report of the resources used since
+        start(). memory_limit, in bytes, is included to compute headroom.
+        '''
+        wall_seconds = time.perf_counter() - self._started
+        self._stopping.set()
+        if self._cgroup is not None:
+            self._thread.join()
+            self._add(self._cgroup.sample())
+        # The docker stats stream only yields about once a second, so its
+        # thread is left to notice it has been stopped on its own.
+        with self._lock:
+            samples = list(self.samples)
+        return build_report(samples, wall_seconds, self.cumulative,
+                            memory_limit, self.source)
+
+
+def build_report(samples, wall_seconds, cumulative=True, memory_limit=None,
+                 source=None):
+    "Summarizes the samples taken while the grader ran."
+    report = {
+        'wallSeconds': round(wall_seconds, 3),
+        'cpuSeconds': None,
+        'cpuThrottledSeconds': None,
+        'throttledPeriods': None,
+        'peakMemoryBytes': None,
+        'memoryLimitBytes': memory_limit,
+        'blockReadBytes': None,
+        'blockWriteBytes': None,
+        'samples': len(samples),
+        'source': source,
+    }
+    if not samples:
+        return report
+    usage = {}
+    for counter in COUNTERS:
+        usage[counter] = max(sample[counter] for sample in samples)
+        if not cumulative:
+            usage[counter] -= samples[0][counter]
+    peak_memory = max(sample['memory'] for sample in samples)
+    if cumulative:
+        # The kernel's high watermark catches peaks between samples. It
+        # includes the page cache, so errs on the high side.
+        peak_memory = max([peak_memory] + [
+            sample['peakMemory'] for sample in samples
+            if sample.get('peakMemory') is not None])
+    report.update({
+        'cpuSeconds': round(usage['cpu'], 3),
+        'cpuThrottledSeconds': round(usage['throttled'], 3),
+        'throttledPeriods': usage['throttledPeriods'],
+        'peakMemoryBytes': peak_memory,
+        'blockReadBytes': usage['readBytes'],
+        'blockWriteBytes': usage['writeBytes'],
+    })
+    return report
+
+
+def write_report(report, dst_dir):
+    "Writes the report next to feedback.json, returning the path written."
+    report_file = os.path.join(dst_dir, REPORT_FILE)
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report_file
+
+
+def _megabytes(size):
+    return '%.1f MB' % (size / (1024.0 * 1024))
+
+
+def format_summary(report):
+    "Formats the report as a table, with the headroom left below the limits."
+    if not report['samples']:
+        return 'No samples were taken (the grader ran for %.3f s).\n' % (
+            report['wallSeconds'])
+    rows = []
+    peak = report['peakMemoryBytes']
+    limit = report.get('memoryLimitBytes')
+    if limit:
+        rows.append(['peak memory', _megabytes(peak), _megabytes(limit),
+                     '%s (%.0f%%)' % (_megabytes(limit - peak),
+                                      100.0 * (limit - peak) / limit)])
+    else:
+        rows.append(['peak memory', _megabytes(peak), '', ''])
+    cpus = report['cpuSeconds'] / report['wallSeconds'] \
+        if report['wallSeconds'] else 0
+    rows.extend([
+        ['cpu time', '%.3f s (%.2f CPUs)' % (report['cpuSeconds'], cpus),
+         '%g CPUs' % report['cpuLimit'] if report.get('cpuLimit') else '',
+         ''],
+        ['throttled', '%.3f s (%s periods)' % (
+            report['cpuThrottledSeconds'], report['throttledPeriods']),
+         '', ''],
+        ['block read', _megabytes(report['blockReadBytes']), '', ''],
+        ['block write', _megabytes(report['blockWriteBytes']), '', ''],
+        ['wall time', '%.3f s' % report['wallSeconds'], '', ''],
+    ])
+    if report.get('oomKilled'):
+        rows.append(['oom killed', 'yes', '', ''])
+    return output.format_table(['RESOURCE', 'USED', 'LIMIT', 'HEADROOM'],
+                               rows)
+
+
+def check_headroom(report):
+    "Returns warnings about resources the grader came close to running out of."
+    warnings = []
+    if report.get('oomKilled'):
+        warnings.append('The grader was killed for running out of memory. '
+                        'Increase --mem-limit (and the grader\'s memory '
+                        'limit in production).')
+    peak = report.get('peakMemoryBytes')
+    limit = report.get('memoryLimitBytes')
+    if peak is not None and limit and \
+            limit - peak < MEMORY_HEADROOM_WARNING * limit:
+        warnings.append('The grader used %.0f%% of its memory limit; it may '
+                        'run out of memory in production.' %
+                        (100.0 * peak / limit))
+    return warnings
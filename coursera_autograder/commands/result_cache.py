@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A local on-disk cache of grading results, keyed on everything that determines
+the outcome of a grading run: the grader image, the submission, the
+environment variables and the resources given to the grader.
+
+Each entry is a directory holding the grader's exit code, standard output and
+error, and the files it produced. Entries are evicted least recently used
+first once the cache grows beyond its size limit.
+
+The size of the cache is kept as a running total, so that storing a result
+does not size every entry again: the entries are only listed and sized when
+the total exceeds the limit (evicting down to EVICT_TO of it, so that the
+next stores fit), or every RESCAN_INTERVAL stores, to account for the entries
+other processes stored.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+ENTRY_METADATA = 'result.json'
+ENTRY_OUTPUT_DIR = 'output'
+
+# The fraction of the size limit eviction brings the cache down to.
+EVICT_TO = 0.9
+
+# The number of stores after which the cache is sized again from disk.
+RESCAN_INTERVAL = 100
+
+
+def hash_tree(root):
+    "Computes a digest of the names and contents of the files under root."
+    digest = hashlib.sha256()
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            full_path = os.path.join(dir_path, file_name)
+            relative_path = os.path.relpath(full_path, root)
+            digest.update(relative_path.encode('utf-8') + b'\0')
+            if os.path.islink(full_path):
+                link_target = os.readlink(full_path)
+                digest.update(b'link:' + link_target.encode('utf-8'))
+            else:
+                with open(full_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _entry_size(entry_dir):
+    size = 0
+    for dir_path, _, file_names in os.walk(entry_dir):
+        for file_name in file_names:
+            try:
+                size += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+    return size
+
+
+class ResultCache(object):
+    '''
+    Stores grading results under cache_dir, holding at most max_size bytes.
+    Safe to share between threads, and between processes using the same
+    cache_dir: entries are written to a temporary directory and renamed into
+    place.
+    '''
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # The running total of the entries' sizes, None until first sized.
+        self._size = None
+        self._stores_since_scan = 0
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, mode=0o700)
+
+    def key(self, image_id, submission_dir, environment, **settings):
+        "Computes the cache key of a grading run."
+        components = {
+            'image': image_id,
+            'submission': hash_tree(submission_dir),
+            'environment': environment,
+            'settings': settings,
+        }
+        return hashlib.sha256(
+            json.dumps(components, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        '''
+        Returns the cached result for key as a dictionary with the keys
+        exitCode, stdout, stderr (bytes) and files (paths relative to the
+        entry's output directory), or None on a cache miss.
+        '''
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, ENTRY_METADATA), 'r') as f:
+                entry = json.load(f)
+            for stream_name in ('stdout', 'stderr'):
+                with open(os.path.join(entry_dir, stream_name + '.log'),
+                          'rb') as f:
+                    entry[stream_name] = f.read()
+        except (IOError, ValueError):
+            return None
+        # Mark the entry as recently used.
+        try:
+            os.utime(entry_dir, None)
+        except OSError:
+            pass
+        return entry
+
+    def restore(self, key, entry, dst_dir):
+        "Copies the files of a cached result into dst_dir."
+        output_dir = os.path.join(self._entry_dir(key), ENTRY_OUTPUT_DIR)
+        for relative_path in entry['files']:
+            destination = os.path.join(dst_dir, relative_path)
+            if not os.path.isdir(os.path.dirname(destination)):
+                os.makedirs(os.path.dirname(destination))
+            shutil.copyfile(os.path.join(output_dir, relative_path),
+                            destination)
+
+    def store(self, key, dst_dir, files, exit_code, stdout, stderr):
+        '''
+        Caches the result of a grading run. `files` are the paths of the
+        files the run produced within dst_dir.
+        '''
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            relative_paths = []
+            for file_path in files:
+                relative_path = os.path.relpath(file_path, dst_dir)
+                destination = os.path.join(
+                    tmp_dir, ENTRY_OUTPUT_DIR, relative_path)
+                if not os.path.isdir(os.path.dirname(destination)):
+                    os.makedirs(os.path.dirname(destination))
+                shutil.copyfile(file_path, destination)
+                relative_paths.append(relative_path)
+            for stream_name, output in (('stdout', stdout),
+                                        ('stderr', stderr)):
+                if type(output) is not bytes:
+                    output = output.encode('utf-8')
+                with open(os.path.join(tmp_dir, stream_name + '.log'),
+                          'wb') as f:
+                    f.write(output)
+            with open(os.path.join(tmp_dir, ENTRY_METADATA), 'w') as f:
+                json.dump({
+                    'exitCode': exit_code,
+                    'files': relative_paths,
+                    'created': time.time(),
+                }, f)
+            size = _entry_size(tmp_dir)
+            try:
+                os.rename(tmp_dir, self._entry_dir(key))
+            except OSError:
+                # Another run stored the same result first.
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                size = 0
+        except:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+                self._stores_since_scan += 1
+                if self._size <= self.max_size and \
+                        self._stores_since_scan < RESCAN_INTERVAL:
+                    return
+            self._evict()
+
+    def evict(self):
+        "Removes the least recently used entries if the cache is too large."
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held.
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                last_used = os.path.getmtime(entry_dir)
+            except OSError:
+                continue
+            entries.append((last_used, entry_dir, _entry_size(entry_dir)))
+        total_size = sum(size for (_, _, size) in entries)
+        if total_size > self.max_size:
+            for last_used, entry_dir, size in sorted(entries):
+                if total_size <= self.max_size * EVICT_TO:
+                    break
+                logging.debug('Evicting cached result %s.', entry_dir)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total_size -= size
+        self._size = total_size
+        self._stores_since_scan = 0
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Helpers for resumable uploads using the tus protocol (https://tus.io), which
+Transloadit supports for uploading files to an assembly.
+
+The file is sent in chunks, each of which is retried independently. The state
+of an upload is persisted to disk, so an interrupted upload (e.g. a dropped
+connection, a crash or Ctrl-C) picks up where it left off the next time the
+same file is uploaded.
+
+Streams of unknown length (e.g. an image exported on the fly) are uploaded
+with the creation-defer-length extension. Their chunks are retried too, but an
+interrupted upload cannot be resumed later, as the stream cannot be replayed.
+'''
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import os.path
+import requests
+import time
+
+TUS_VERSION = '1.0.0'
+
+
+class UploadError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'Resumable upload failed: %(msg)s' % {
+            'msg': self.msg,
+        }
+
+
+class UploadExpired(UploadError):
+    "The server no longer knows about the upload."
+
+
+class UploadSession(object):
+    '''
+    The persisted state of a resumable upload of a file, stored as a JSON
+    document in session_dir. The session is tied to the file's path, size and
+    modification time (plus any extra context, such as the course), so a
+    changed file starts a fresh upload.
+    '''
+
+    def __init__(self, session_dir, file_path, *context):
+        self.session_dir = os.path.expanduser(session_dir)
+        stat = os.stat(file_path)
+        identity = json.dumps(
+            [os.path.abspath(file_path), stat.st_size, stat.st_mtime] +
+            list(context))
+        session_id = hashlib.sha256(identity.encode('utf-8')).hexdigest()
+        self.path = os.path.join(self.session_dir, session_id + '.json')
+
+    def load(self):
+        "Returns the saved state of the upload, or None if there is none."
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def save(self, state):
+        if not os.path.isdir(self.session_dir):
+            os.makedirs(self.session_dir, mode=0o700)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def encode_metadata(metadata):
+    "Encodes a dictionary as a tus Upload-Metadata header value."
+    return ','.join(
+        '%s %s' % (key,
+                   base64.b64encode(value.encode('utf-8')).decode('ascii'))
+        for (key, value) in sorted(metadata.items()))
+
+
+class TusClient(object):
+    '''
+    A minimal tus 1.0 client supporting the core protocol (creation, offset
+    retrieval and chunked PATCH uploads).
+    '''
+
+    def __init__(self, session=None, chunk_size=16 * 1024 * 1024, retries=5,
+                 retry_delay=1.0, timeout=60):
+        self.session = session if session is not None else requests.Session()
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+
+    def _headers(self, **headers):
+        headers['Tus-Resumable'] = TUS_VERSION
+        return headers
+
+    def create(self, tus_url, length, metadata):
+        '''
+        Creates a new upload, returning its URL. If length is None, the length
+        is only declared along with the last chunk.
+        '''
+        headers = {'Upload-Metadata': encode_metadata(metadata)}
+        if length is None:
+            headers['Upload-Defer-Length'] = '1'
+        else:
+            headers['Upload-Length'] = str(length)
+        response = self.session.post(
+            tus_url, headers=self._headers(**headers), timeout=self.timeout)
+        if response.status_code != 201 or 'Location' not in response.headers:
+            logging.error('Could not create the upload. (%s) %s',
+                          response.status_code, response.text)
+            raise UploadError('the server did not create the upload.')
+        return requests.compat.urljoin(tus_url, response.headers['Location'])
+
+    def offset(self, upload_url):
+        '''
+        Returns how many bytes of the upload the server has received, or None
+        if the server no longer knows about the upload.
+        '''
+        response = self.session.head(
+            upload_url, headers=self._headers(), timeout=self.timeout)
+        if response.status_code in (404, 410):
+            return None
+        if response.status_code not in (200, 204):
+            raise UploadError(
+                'unexpected status %s when checking the upload offset.' %
+                response.status_code)
+        return int(response.headers['Upload-Offset'])
+
+    def _patch(self, upload_url, offset, chunk, length=None):
+        headers = {
+            'Upload-Offset': str(offset),
+            'Content-Type': 'application/offset+octet-stream',
+        }
+        if length is not None:
+            headers['Upload-Length'] = str(length)
+        response = self.session.patch(
+            upload_url, data=chunk, headers=self._headers(**headers),
+            timeout=self.timeout)
+        if response.status_code != 204:
+            raise UploadError('unexpected status %s uploading a chunk. %s' % (
+                response.status_code, response.text))
+        return int(response.headers['Upload-Offset'])
+
+    def _retry_offset(self, upload_url, failures, error, what='Chunk upload'):
+        '''
+        Waits before retrying a failed chunk (backing off exponentially), then
+        returns the offset the server has received up to, or None if it could
+        not be retrieved. Raises UploadError once the retries are exhausted,
+        and UploadExpired if the server no longer has the upload.
+        '''
+        if failures > self.retries:
+            raise UploadError(
+                'giving up after %s failed attempts: %s' % (failures, error))
+        delay = self.retry_delay * 2 ** (failures - 1)
+        logging.warn('%s failed (%s); retrying in %.1f seconds.',
+                     what, error, delay)
+        time.sleep(delay)
+        try:
+            server_offset = self.offset(upload_url)
+        except (requests.exceptions.RequestException, UploadError):
+            return None
+        if server_offset is None:
+            raise UploadExpired('the server no longer has the upload.')
+        return server_offset
+
+    def resume_offset(self, upload_url):
+        '''
+        Returns the offset to resume an interrupted upload at, or None if the
+        server no longer knows about the upload. Failing to retrieve it is
+        retried like a failed chunk.
+        '''
+        try:
+            return self.offset(upload_url)
+        except (requests.exceptions.RequestException, UploadError) as e:
+            error = e
+        failures = 1
+        while True:
+            try:
+                server_offset = self._retry_offset(
+                    upload_url, failures, error, 'Checking the upload offset')
+            except UploadExpired:
+                return None
+            if server_offset is not None:
+                return server_offset
+            failures += 1
+
+    def upload(self, upload_url, file_obj, length, offset=0, progress=None):
+        '''
+        Uploads file_obj (of the given length) from offset onwards, one chunk
+        at a time. A failed chunk is retried (after re-synchronizing the
+        offset with the server) up to `retries` times in a row, backing off
+        exponentially between attempts. A chunk the server accepts without
+        its offset advancing counts as a failure.
+
+        progress, if given, is called with the number of bytes the server has
+        received after each chunk.
+        '''
+        failures = 0
+        while offset < length:
+            file_obj.seek(offset)
+            chunk = file_obj.read(min(self.chunk_size, length - offset))
+            try:
+                new_offset = self._patch(upload_url, offset, chunk)
+                if new_offset <= offset:
+                    raise UploadError('the server accepted no bytes of the '
+                                      'chunk at offset %s.' % offset)
+                offset = new_offset
+                failures = 0
+            except (requests.exceptions.RequestException, UploadError) as e:
+                failures += 1
+                server_offset = self._retry_offset(upload_url, failures, e)
+                if server_offset is not None:
+                    offset = server_offset
+                continue
+            if progress is not None:
+                progress(offset)
+        return offset
+
+    def _read_chunk(self, file_obj):
+        chunk = b''
+        while len(chunk) < self.chunk_size:
+            data = file_obj.read(self.chunk_size - len(chunk))
+            if not data:
+                break
+            chunk += data
+        return chunk
+
+    def upload_stream(self, upload_url, file_obj, progress=None):
+        '''
+        Uploads file_obj, a stream of unknown length, to an upload created
+        with a deferred length. Only the chunk being sent is held in memory, so
+        a failed chunk is retried (as in `upload`) from the offset the server
+        received up to within it. Returns the length of the upload.
+        '''
+        offset = 0
+        chunk = self._read_chunk(file_obj)
+        while True:
+            # Read ahead to find out whether this is the last chunk, which
+            # must declare the length of the upload.
+            next_chunk = self._read_chunk(file_obj)
+            length = None if next_chunk else offset + len(chunk)
+            sent = 0
+            failures = 0
+            while True:
+                try:
+                    new_sent = self._patch(
+                        upload_url, offset + sent, chunk[sent:], length
+                    ) - offset
+                    if new_sent <= sent and new_sent < len(chunk):
+                        raise UploadError(
+                            'the server accepted no bytes of the chunk at '
+                            'offset %s.' % (offset + sent))
+                    sent = new_sent
+                    if sent >= len(chunk):
+                        break
+                except (requests.exceptions.RequestException,
+                        UploadError) as e:
+                    failures += 1
+                    server_offset = self._retry_offset(upload_url, failures, e)
+                    if server_offset is None:
+                        continue
+                    if not offset <= server_offset <= offset + len(chunk):
+                        raise UploadError(
+                            'the server has %s bytes of the upload, but the '
+                            'chunk being sent starts at %s.' %
+                            (server_offset, offset))
+                    sent = server_offset - offset
+            offset += len(chunk)
+            if progress is not None:
+                progress(offset)
+            if length is not None:
+                return length
+            chunk = next_chunk
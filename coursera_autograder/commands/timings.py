@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Wall-clock timers for the phases of a command (e.g. creating, starting and
+waiting for a grader container), reported with --timings.
+'''
+
+from coursera_autograder.commands import output
+import collections
+import contextlib
+import json
+import sys
+import time
+
+FORMATS = ['text', 'json']
+
+
+class PhaseTimings(object):
+    '''
+    The time spent in each phase, in the order the phases were first entered.
+    A phase entered several times accumulates its time.
+    '''
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        "Times the phase for the duration of the with block."
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def as_dict(self):
+        "The seconds spent in each phase, and in total since starting."
+        return {
+            'phases': collections.OrderedDict(
+                (name, round(seconds, 6))
+                for (name, seconds) in self.phases.items()),
+            'total': round(time.perf_counter() - self.started, 6),
+        }
+
+
+def percentile(values, p):
+    "The p-th percentile of the values, by the nearest-rank method."
+    ordered = sorted(values)
+    rank = max(1, -(-p * len(ordered) // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(runs):
+    '''
+    Aggregates the timings (as returned by PhaseTimings.as_dict) of several
+    runs, returning for each phase (and the total) the number of runs it
+    appeared in and its 50th, 90th and 99th percentile and total seconds.
+    '''
+    samples = collections.OrderedDict()
+    for run in runs:
+        for name, seconds in run['phases'].items():
+            samples.setdefault(name, []).append(seconds)
+    samples['total'] = [run['total'] for run in runs]
+    return collections.OrderedDict(
+        (name, {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'sum': round(sum(values), 6),
+        })
+        for (name, values) in samples.items() if values)
+
+
+def write_timings(timings, fmt, stream=None):
+    '''
+    Writes the timings of a run (as returned by PhaseTimings.as_dict) as a
+    table or a JSON document, to standard error by default so that they do
+    not mix with the command's output.
+    '''
+    stream = stream or sys.stderr
+    if fmt == 'json':
+        stream.write(json.dumps(timings) + '\n')
+        return
+    total = timings['total'] or 1
+    rows = [[name, '%.3f' % seconds, '%.1f%%' % (100.0 * seconds / total)]
+            for (name, seconds) in timings['phases'].items()]
+    rows.append(['total', '%.3f' % timings['total'], '100.0%'])
+    stream.write(output.format_table(['PHASE', 'SECONDS', 'SHARE'], rows))
+
+
+def write_summary(runs, fmt, stream=None):
+    "Writes the summary of the timings of several runs (see summarize)."
+    stream = stream or sys.stderr
+    summary = summarize(runs)
+    if fmt == 'json':
+        stream.write(json.dumps(summary) + '\n')
+        return
+    rows = [[name, str(stats['count'])] +
+            ['%.3f' % stats[field] for field in ('p50', 'p90', 'p99', 'sum')]
+            for (name, stats) in summary.items()]
+    stream.write(output.format_table(
+        ['PHASE', 'RUNS', 'P50 S', 'P90 S', 'P99 S', 'TOTAL S'], rows))
+
+
+def add_timings_parser(parser):
+    "Adds the --timings option to the parser."
+    parser.add_argument(
+        '--timings',
+        choices=FORMATS,
+        help='After running, write how long each phase took to standard '
+             'error, as a table (text) or as a JSON document (json).')
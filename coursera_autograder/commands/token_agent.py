@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A long-lived local agent holding the OAuth2 access token in memory, so that
+short-lived invocations of the command line tool neither read the token cache
+file nor wait on the token endpoint.
+
+The agent listens on a Unix socket that only the current user can access. A
+client sends the line `token` and receives a JSON document with the `token`
+and the time it `expires`, or an `error`. The agent refreshes the token in the
+background well before it expires, and writes refreshed tokens through to the
+token cache file, so that clients falling back to the file stay current.
+"""
+
+import errno
+import json
+import logging
+import os
+import os.path
+import socket
+import socketserver
+import threading
+import time
+
+# Refresh the token this many seconds before it expires. Clients consider a
+# token expiring within 5 minutes stale, so this must be comfortably larger.
+REFRESH_MARGIN = 10 * 60
+
+# How long to wait before retrying a failed refresh.
+RETRY_DELAY = 60
+
+
+def request_token(socket_path, timeout=1.0):
+    '''
+    Asks the agent listening on socket_path for the access token. Returns a
+    dictionary with the token and the time it expires, or None if there is
+    no agent or it has no valid token.
+    '''
+    socket_path = os.path.expanduser(socket_path)
+    if not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall(b'token\n')
+        response = b''
+        while not response.endswith(b'\n'):
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            response += chunk
+        body = json.loads(response.decode('utf-8'))
+    except (socket.error, ValueError):
+        logging.debug('Could not get a token from the agent at %s.',
+                      socket_path, exc_info=True)
+        return None
+    finally:
+        client.close()
+    if 'error' in body:
+        logging.debug('The token agent had no token: %s', body['error'])
+        return None
+    return body
+
+
+def agent_listening(socket_path, timeout=1.0):
+    '''
+    Returns whether a process accepts connections on socket_path, whether or
+    not it has a token to serve. Raises socket.error if that cannot be told.
+    '''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+    except socket.error as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+            return False
+        raise
+    finally:
+        client.close()
+    return True
+
+
+class TokenAgent(object):
+    '''
+    Serves the tokens of a CourseraOAuth2 instance on a Unix socket, and
+    keeps them fresh with its refresh token.
+    '''
+
+    def __init__(self, oauth2_instance, socket_path,
+                 refresh_margin=REFRESH_MARGIN, retry_delay=RETRY_DELAY):
+        self.oauth2 = oauth2_instance
+        self.socket_path = os.path.expanduser(socket_path)
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self._stopped = threading.Event()
+        self.server = None
+
+    def tokens(self):
+        "Returns the current token and its expiry, without the refresh token."
+        cache = self.oauth2.token_cache
+        if cache is None or cache['expires'] <= time.time():
+            return {'error': 'No valid token.'}
+        return {'token': cache['token'], 'expires': cache['expires']}
+
+    def refresh(self):
+        '''
+        Exchanges the refresh token for a new token (unless another process
+        already has). Returns True on success. The previous token is served
+        until the new one is in place.
+        '''
+        if not self.oauth2.refresh_tokens(min_validity=self.refresh_margin,
+                                          interactive=False):
+            return False
+        logging.info('Refreshed the access token; it now expires in %d '
+                     'seconds.', self.oauth2.token_cache['expires'] -
+                     time.time())
+        return True
+
+    def _seconds_until_refresh(self):
+        cache = self.oauth2.token_cache
+        if cache is None:
+            return 0
+        return cache['expires'] - self.refresh_margin - time.time()
+
+    def _refresh_loop(self):
+        while not self._stopped.is_set():
+            if self._seconds_until_refresh() <= 0 and not self.refresh():
+                logging.warn('Could not refresh the access token; retrying '
+                             'in %s seconds.', self.retry_delay)
+            # Never refresh more often than every retry_delay seconds, even if
+            # the server hands out tokens shorter lived than refresh_margin.
+            self._stopped.wait(
+                max(self._seconds_until_refresh(), self.retry_delay))
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            try:
+                listening = agent_listening(self.socket_path)
+            except socket.error as e:
+                raise Exception('Could not tell whether a token agent is '
+                                'listening on %s: %s' % (self.socket_path, e))
+            if listening:
+                raise Exception('A token agent is already listening on %s.' %
+                                self.socket_path)
+            # Left behind by an agent that did not shut down cleanly.
+            os.remove(self.socket_path)
+        dir_name = os.path.dirname(self.socket_path)
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name, mode=0o700)
+
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                request = self.rfile.readline().strip()
+                if request == b'token':
+                    response = agent.tokens()
+                else:
+                    response = {'error': 'Unknown request.'}
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+        old_umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(
+                self.socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon_threads = True
+
+    def serve_forever(self):
+        "Serves tokens until shutdown is called (e.g. on Ctrl-C)."
+        self._bind()
+        refresher = threading.Thread(target=self._refresh_loop)
+        refresher.daemon = True
+        refresher.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self._stopped.set()
+            self.server.server_close()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        self._stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
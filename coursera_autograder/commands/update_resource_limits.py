@@ -21,38 +21,45 @@ You may install it from source, or via pip.
 """
 
 from coursera_autograder.commands import common
+from coursera_autograder.commands import get_resource_limits
 from coursera_autograder.commands import oauth2
+from coursera_autograder.commands import output
+from coursera_autograder import utils
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import json
 import logging
+import os.path
 import requests
 import urllib.parse
 
+# The resource limits that can be set from a manifest. reservedCpu is given in
+# vCPUs, as printed by get_resource_limits.
+LIMIT_FIELDS = ['reservedCpu', 'reservedMemory', 'wallClockTimeout']
 
-def command_update_resource_limits(args):
-    "Implements the update_resource_limits subcommand"
 
-    oauth2_instance = oauth2.build_oauth2(args)
-    auth = oauth2_instance.build_authorizer()
+class ManifestError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
 
-    s = requests.Session()
-    s.auth = auth
+    def __str__(self):
+        return 'Invalid manifest: %(msg)s' % {
+            'msg': self.msg,
+        }
 
-    course_branch_id = (args.course.replace("~", "!~")
-                        if "authoringBranch~" in args.course else args.course)
-    course_branch_item = '%s~%s' % (course_branch_id, args.item)
 
-    params = 'id=%s&partId=%s' % (course_branch_item, args.part)
+def post_resource_limits(session, endpoint, course, item, part, body):
+    """
+    Sets the resource limits of an assignment part's grader. Returns the
+    response body, or None (after logging the reason) if the update failed.
+    """
+    course_branch_id = (course.replace("~", "!~")
+                        if "authoringBranch~" in course else course)
+    course_branch_item = '%s~%s' % (course_branch_id, item)
 
-    body = {
-        "reservedCpu": (int(args.grader_cpu) * 1024
-                        if args.grader_cpu is not None else None),
-        "reservedMemory": (int(args.grader_memory_limit)
-                           if args.grader_memory_limit is not None else None),
-        "wallClockTimeout": (int(args.grader_timeout)
-                             if args.grader_timeout is not None else None)
-        }
+    params = 'id=%s&partId=%s' % (course_branch_item, part)
 
-    result = s.post(args.updateGraderResourceLimits_endpoint,
-                    params=params, json=body)
+    result = session.post(endpoint, params=params, json=body)
     if result.status_code == 404:
         logging.error(
             '\nUnable to find the part or grader with ' +
@@ -60,12 +67,12 @@ def command_update_resource_limits(args):
             'Status Code: 404 \n'
             'URL: %s \n'
             'Response: %s\n',
-            args.part,
-            args.item,
-            args.course,
+            part,
+            item,
+            course,
             result.url,
             result.text)
-        return 1
+        return None
     elif result.status_code != 200:
         logging.error(
             '\nUnable to update grader resources.\n'
@@ -75,13 +82,227 @@ def command_update_resource_limits(args):
             'Status Code: %d\n'
             'URL: %s\n'
             'Response: %s\n',
-            args.course,
-            args.item,
-            args.part,
+            course,
+            item,
+            part,
             result.status_code,
             result.url,
             result.text
         )
+        return None
+    return result.json()
+
+
+def _parse_limit(target, field):
+    value = target.get(field)
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ManifestError('%s of part %s is not a number: %r' % (
+            field, target.get('part'), value))
+    return int(number) if number == int(number) else number
+
+
+def load_manifest(file_name):
+    """
+    Reads the targets of a bulk update. The manifest is a CSV file with a
+    header line, a JSON document or (if PyYAML is installed) a YAML document.
+    JSON and YAML manifests hold a list of targets, or an object with the list
+    under `targets`.
+
+    Each target has a course, item and part, and the desired values of any of
+    LIMIT_FIELDS. Limits that are left out are not changed.
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    with open(file_name, 'r') as f:
+        if extension == '.csv':
+            targets = list(csv.DictReader(f))
+        elif extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ManifestError(
+                    'reading YAML manifests requires PyYAML. Install it with '
+                    '`pip install pyyaml`, or use a JSON or CSV manifest.')
+            targets = yaml.safe_load(f)
+        else:
+            try:
+                targets = json.load(f)
+            except ValueError as e:
+                raise ManifestError('%s is not valid JSON: %s' % (
+                    file_name, e))
+    if isinstance(targets, dict):
+        targets = targets.get('targets')
+    if not isinstance(targets, list):
+        raise ManifestError('%s does not list any targets.' % file_name)
+
+    parsed = []
+    for target in targets:
+        if not isinstance(target, dict) or not all(
+                target.get(key) for key in ('course', 'item', 'part')):
+            raise ManifestError(
+                'every target needs a course, item and part: %r' % (target, ))
+        parsed_target = dict(
+            (key, str(target[key])) for key in ('course', 'item', 'part'))
+        for field in LIMIT_FIELDS:
+            parsed_target[field] = _parse_limit(target, field)
+        parsed.append(parsed_target)
+    return parsed
+
+
+def current_limits(limits):
+    "Converts a get_resource_limits response into manifest units."
+    return {
+        'reservedCpu': (int(limits['reservedCpu'])/1024
+                        if limits.get('reservedCpu') is not None else None),
+        'reservedMemory': limits.get('reservedMemory'),
+        'wallClockTimeout': limits.get('wallClockTimeout'),
+    }
+
+
+def plan_changes(target, current):
+    "Returns the limits to change, as a dict of field: (current, desired)."
+    return dict(
+        (field, (current[field], target[field]))
+        for field in LIMIT_FIELDS
+        if target[field] is not None and target[field] != current[field])
+
+
+def request_body(limits):
+    "Converts limits in manifest units into an update request body."
+    return {
+        "reservedCpu": (int(limits['reservedCpu'] * 1024)
+                        if limits['reservedCpu'] is not None else None),
+        "reservedMemory": limits['reservedMemory'],
+        "wallClockTimeout": limits['wallClockTimeout'],
+    }
+
+
+def update_from_manifest(args):
+    "Implements the update_resource_limits subcommand with --manifest."
+    try:
+        targets = load_manifest(args.manifest)
+    except ManifestError as e:
+        logging.error('%s', e)
+        return 1
+
+    oauth2_instance = oauth2.build_oauth2(args)
+    auth = oauth2_instance.build_authorizer()
+
+    workers = min(args.workers, max(len(targets), 1))
+    s = utils.api_session(auth, pool_size=workers)
+
+    def fetch(target):
+        "Returns the current limits of the target, or None."
+        try:
+            limits = get_resource_limits.fetch_resource_limits(
+                s, args.getGraderResourceLimits_endpoint,
+                target['course'], target['item'], target['part'])
+            return None if limits is None else current_limits(limits)
+        except requests.exceptions.RequestException as e:
+            logging.error('Could not read the resource limits of part %s of '
+                          'item %s: %s', target['part'], target['item'], e)
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error('Unexpected response when reading the resource '
+                          'limits of part %s of item %s: %s', target['part'],
+                          target['item'], e)
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetched = list(executor.map(fetch, targets))
+
+    # Work out and print the plan before changing anything.
+    results = []
+    updates = []
+    plan_rows = []
+    for target, current in zip(targets, fetched):
+        if current is None:
+            results.append('failed to read')
+            continue
+        changes = plan_changes(target, current)
+        if not changes:
+            results.append('unchanged')
+            continue
+        results.append('update')
+        desired = dict(current)
+        desired.update((field, new) for (field, (_, new)) in changes.items())
+        updates.append((len(results) - 1, target, desired))
+        for field in LIMIT_FIELDS:
+            if field in changes:
+                plan_rows.append([target['course'], target['item'],
+                                  target['part'], field,
+                                  str(changes[field][0]),
+                                  str(changes[field][1])])
+
+    print('Plan: %d to update, %d unchanged, %d could not be read.\n' % (
+        len(updates), results.count('unchanged'),
+        results.count('failed to read')))
+    if plan_rows:
+        print(output.format_table(
+            ['COURSE', 'ITEM', 'PART', 'LIMIT', 'CURRENT', 'DESIRED'],
+            plan_rows))
+    if args.dry_run:
+        return 1 if 'failed to read' in results else 0
+
+    def update(planned):
+        index, target, desired = planned
+        try:
+            updated = post_resource_limits(
+                s, args.updateGraderResourceLimits_endpoint,
+                target['course'], target['item'], target['part'],
+                request_body(desired))
+        except requests.exceptions.RequestException as e:
+            logging.error('Could not update the resource limits of part %s '
+                          'of item %s: %s', target['part'], target['item'], e)
+            updated = None
+        except ValueError as e:
+            logging.error('Unexpected response when updating the resource '
+                          'limits of part %s of item %s: %s', target['part'],
+                          target['item'], e)
+            updated = None
+        return (index, updated is not None)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, ok in executor.map(update, updates):
+            results[index] = 'updated' if ok else 'failed to update'
+
+    print(output.format_table(
+        ['COURSE', 'ITEM', 'PART', 'RESULT'],
+        [[target['course'], target['item'], target['part'], result]
+         for (target, result) in zip(targets, results)]))
+    return 1 if any(result.startswith('failed') for result in results) else 0
+
+
+def command_update_resource_limits(args):
+    "Implements the update_resource_limits subcommand"
+
+    if getattr(args, 'manifest', None) is not None:
+        return update_from_manifest(args)
+    if args.course is None or args.item is None or args.part is None:
+        logging.error('Either a course, item and part or a --manifest must '
+                      'be given.')
+        return 1
+
+    oauth2_instance = oauth2.build_oauth2(args)
+    auth = oauth2_instance.build_authorizer()
+
+    s = requests.Session()
+    s.auth = auth
+
+    body = {
+        "reservedCpu": (int(args.grader_cpu) * 1024
+                        if args.grader_cpu is not None else None),
+        "reservedMemory": (int(args.grader_memory_limit)
+                           if args.grader_memory_limit is not None else None),
+        "wallClockTimeout": (int(args.grader_timeout)
+                             if args.grader_timeout is not None else None)
+        }
+
+    limits = post_resource_limits(s, args.updateGraderResourceLimits_endpoint,
+                                  args.course, args.item, args.part, body)
+    if limits is None:
         return 1
     print(
         '\nUpdated resource Limits for grader with ' +
@@ -92,14 +313,14 @@ def command_update_resource_limits(args):
         (args.part,
          args.item,
          args.course,
-         (int(result.json()['reservedCpu'])/1024
-          if 'reservedCpu' in result.json()
+         (int(limits['reservedCpu'])/1024
+          if 'reservedCpu' in limits
           else 'Cpu limit not set - default is 1 vCPU'),
-         (result.json()['reservedMemory']
-          if 'reservedMemory' in result.json()
+         (limits['reservedMemory']
+          if 'reservedMemory' in limits
           else 'Memory limit not set - default is 4096 MiB'),
-         (result.json()['wallClockTimeout']
-          if 'wallClockTimeout' in result.json()
+         (limits['wallClockTimeout']
+          if 'wallClockTimeout' in limits
           else 'Timeout not set - default is 1200 seconds')))
     return 0
 
@@ -110,6 +331,7 @@ def setup_registration_parser(parser):
 
     parser.add_argument(
         'course',
+        nargs='?',
         help='The course id associated with the grader. The course id is a '
         'gibberish string UUID. Given a course slug such as `developer-iot`, '
         'you can retrieve the course id by querying the catalog API. e.g.: '
@@ -118,12 +340,14 @@ def setup_registration_parser(parser):
 
     parser.add_argument(
         'item',
+        nargs='?',
         help='The id of the item associated with the grader. The easiest way '
         'to find the item id is by looking at the URL in the authoring web '
         'interface. It is the last part of the URL, and is a short UUID.')
 
     parser.add_argument(
         'part',
+        nargs='?',
         help='The id of the part associated with the grader.')
 
     parser.add_argument(
@@ -154,6 +378,38 @@ def setup_registration_parser(parser):
         help='New timeout'
     )
 
+    parser.add_argument(
+        '--manifest',
+        help='Update many parts at once, as listed in a CSV, JSON or YAML '
+             'file. Each target has a course, item and part, plus the desired '
+             'reservedCpu (in vCPUs), reservedMemory (in MiB) and '
+             'wallClockTimeout (in seconds). Limits that are left out are not '
+             'changed. The current limits are retrieved first, and only the '
+             'parts whose limits differ are updated.'
+    )
+
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='With --manifest, print the planned changes without making them.'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=8,
+        help='With --manifest, the number of parts to retrieve or update at '
+             'the same time. (Default: %(default)s)'
+    )
+
+    parser.add_argument(
+        '--getGraderResourceLimits-endpoint',
+        default='https://api.coursera.org/api/authoringProgramming' +
+                'Assignments.v3/?action=getGraderResourceLimits',
+        help='Override the endpoint used to retrieve the current resource '
+             'limits with --manifest'
+    )
+
 
 def parser(subparsers):
     "Build an argparse argument parser to parse the command line."
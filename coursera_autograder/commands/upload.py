@@ -20,9 +20,13 @@ Coursera's asynchronous grader command line SDK.
 You may install it from source, or via pip.
 """
 
-from coursera_autograder.commands import common
+from coursera_autograder.commands import image_export
+from coursera_autograder.commands import layer_index
 from coursera_autograder.commands import oauth2
+from coursera_autograder.commands import resumable_upload
+from coursera_autograder.commands import upload_ledger
 from coursera_autograder import utils
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import multiprocessing
@@ -32,8 +36,11 @@ import requests
 import requests_toolbelt
 import sys
 import time
+import urllib.parse
 import uuid
 
+TRANSLOADIT_BORED_API = 'https://api2.transloadit.com/instances/bored'
+
 
 def authorize_upload(args, auth):
     "Retrieves a signature to authenticate the transloadit upload."
@@ -46,16 +53,10 @@ def get_container_image(args, d):
     Saves the container image to the file system in zip form. (similar to the
     `docker save` command.)
 
-    Returns the name of the file containing the export.
+    Returns the path and name of the file containing the export.
     '''
     # TODO: get information on the image, and run a few basic sanity checks.
     # (e.g. check for ENTRYPOINT, etc.)
-    # image = d.get_image(args.containerTag)
-    # image_file_name = \
-    #     args.containerTag if args.file_name is None else args.file_name
-    # image_file_name = image_file_name.replace('/', '_')
-    # if not image_file_name.endswith('.zip'):
-    #     image_file_name += '.zip'
     image_file_name = os.path.basename(args.imageZipFile)
     logging.debug('Image file name: %s', image_file_name)
     image_file_path = args.imageZipFile
@@ -67,15 +68,20 @@ def get_container_image(args, d):
             'Saving image %s to %s...' % (args.containerTag, image_file_path))
         sys.stdout.flush()
     with open(image_file_path, 'wb') as image_zip:
-        image_zip.write(image.data)
+        image_export.write_image_zip(d, args.containerTag, image_zip)
     if not args.quiet or args.quiet == 0:
         sys.stdout.write(' done.\n')
         sys.stdout.flush()
     return (image_file_path, image_file_name)
 
 
+def transloadit_bored_api(args):
+    return (getattr(args, 'transloadit_bored_api', None) or
+            TRANSLOADIT_BORED_API)
+
+
 def idle_transloadit_server(args):
-    result = requests.get('https://api2.transloadit.com/instances/bored')
+    result = requests.get(transloadit_bored_api(args))
     if result.status_code != 200:
         logging.error('Transloadit board instance API failure. Code: %s',
                       result.status_code)
@@ -89,40 +95,255 @@ def idle_transloadit_server(args):
     return result.json()['host']
 
 
-def upload(args, upload_url, file_info):
+def assembly_url(args, transloadit_host, assembly_id):
+    "The URL of an assembly, on the same scheme as the bored instances API."
+    return '%(scheme)s://%(host)s/assemblies/%(id)s' % {
+        'scheme': urllib.parse.urlparse(transloadit_bored_api(args)).scheme,
+        'host': transloadit_host,
+        'id': assembly_id,
+    }
+
+
+def transloadit_params(args):
+    "Returns the assembly parameters to send to Transloadit."
+    return json.dumps({
+        'auth': {
+            'key': args.transloadit_account_id,
+        },
+        'template_id': args.transloadit_template,
+    })
+
+
+def upload(args, upload_url, file_info, bytes_sent=None, digests=None):
     '''
     The long-running upload request. This runs in a separate process for
     concurrency reasons.
+
+    If given, bytes_sent (a multiprocessing.Value) is kept up to date with the
+    number of bytes of the request body sent so far, and the checksums of the
+    file (see upload_ledger.HashingReader) are sent to the digests connection
+    once it has been sent.
     '''
-    with open(file_info[0], 'rb') as image_file:
+    with open(file_info[0], 'rb') as f:
+        image_file = upload_ledger.HashingReader(f)
         files = [
             ('file', (file_info[1], image_file, 'application/x-zip')),
         ]
-        transloadit_auth_info = {
-            'auth': {
-                'key': args.transloadit_account_id,
-            },
-            'template_id': args.transloadit_template,
-        }
-        params = json.dumps(transloadit_auth_info)
+        params = transloadit_params(args)
         logging.debug('About to start the upload.')
         m = requests_toolbelt.MultipartEncoder({
             'params': params,
             'file': files[0][1],
         })
+        if bytes_sent is not None:
+            def record_progress(monitor):
+                bytes_sent.value = monitor.bytes_read
+            m = requests_toolbelt.MultipartEncoderMonitor(m, record_progress)
 
         response = requests.post(upload_url,
                                  data=m,
                                  headers={'Content-Type': m.content_type})
         logging.debug('Upload complete... code: %s %s', response.status_code,
                       response.text)
+    if digests is not None:
+        digests.send(image_file.digests())
+
+
+def stream_multipart(fields, file_field, file_info, file_obj,
+                     chunk_size=1024 * 1024):
+    '''
+    Builds a multipart/form-data request body holding the fields followed by
+    the file read from file_obj, whose length need not be known. Returns the
+    content type and the body, as a generator of byte strings to send with
+    chunked transfer encoding.
+    '''
+    boundary = uuid.uuid4().hex
+
+    def body():
+        for (name, value) in fields:
+            yield ('--%s\r\nContent-Disposition: form-data; name="%s"\r\n'
+                   '\r\n%s\r\n' % (boundary, name, value)).encode('utf-8')
+        yield ('--%s\r\nContent-Disposition: form-data; name="%s"; '
+               'filename="%s"\r\nContent-Type: %s\r\n\r\n' % (
+                   boundary, file_field, file_info[0], file_info[1])
+               ).encode('utf-8')
+        for chunk in iter(lambda: file_obj.read(chunk_size), b''):
+            yield chunk
+        yield ('\r\n--%s--\r\n' % boundary).encode('utf-8')
+    return ('multipart/form-data; boundary=%s' % boundary, body())
+
+
+def upload_image(args, upload_url, file_name, bytes_sent=None,
+                 digests=None):
+    '''
+    Like `upload`, but exports args.from_image from the docker daemon and
+    streams its zip archive into the upload as it is produced.
+    '''
+    image_stream = image_export.ImageZipStream(
+        utils.docker_client(args), args.from_image)
+    archive = upload_ledger.HashingReader(image_stream)
+    content_type, body = stream_multipart(
+        [('params', transloadit_params(args))], 'file',
+        (file_name, 'application/x-zip'), archive)
+    if bytes_sent is not None:
+        def record_progress(chunks):
+            for chunk in chunks:
+                yield chunk
+                bytes_sent.value += len(chunk)
+        body = record_progress(body)
+
+    logging.debug('About to start the upload.')
+    try:
+        response = requests.post(upload_url,
+                                 data=body,
+                                 headers={'Content-Type': content_type})
+    finally:
+        image_stream.close()
+    logging.debug('Upload complete... code: %s %s', response.status_code,
+                  response.text)
+    if digests is not None:
+        digests.send(archive.digests())
+
+
+def report_upload_progress(args, sent, total):
+    '''
+    Outputs the progress of the upload to stdout (unless suppressed). If the
+    total is not known (None), the amount sent so far is output.
+    '''
+    if not args.quiet or args.quiet == 0:
+        if total is None:
+            sys.stdout.write('\rUploading... %.1f MB sent.' % (
+                sent / (1024.0 * 1024)))
+        else:
+            sys.stdout.write('\rUploading... %(progress)s%% complete.' % {
+                'progress': min(int(100.0 * sent / max(total, 1)), 100),
+            })
+        sys.stdout.flush()
+
+
+def create_resumable_assembly(args, assembly_url):
+    '''
+    Creates an assembly expecting a single file to be uploaded with tus.
+    Returns the assembly's status URL and the URL to create the tus upload at.
+    '''
+    response = requests.post(assembly_url, data={
+        'params': transloadit_params(args),
+        'tus_num_expected_upload_files': '1',
+    })
+    if response.status_code not in (200, 201) or 'error' in response.json():
+        logging.error('Could not create the assembly. (%s) %s',
+                      response.status_code, response.text)
+        raise Exception('Could not create the transloadit assembly.')
+    body = response.json()
+    return (body['assembly_ssl_url'], body['tus_url'])
+
+
+def start_resumable_upload(args, client, length, file_name):
+    '''
+    Creates an assembly and a tus upload of the given length (None if not
+    known) for it. Returns the assembly's status URL and the upload URL.
+    '''
+    transloadit_host = idle_transloadit_server(args)
+    status_url, tus_url = create_resumable_assembly(
+        args, assembly_url(args, transloadit_host, uuid.uuid4().hex))
+    upload_url = client.create(tus_url, length, {
+        'assembly_url': status_url,
+        'fieldname': 'file',
+        'filename': file_name,
+    })
+    if not args.quiet or args.quiet == 0:
+        sys.stdout.write(
+            'About to upload to server:\n\t%(transloadit_host)s\n'
+            'Status API:\n\t%(upload_url)s\n' % {
+                'transloadit_host': transloadit_host,
+                'upload_url': status_url,
+            })
+        sys.stdout.flush()
+    return (status_url, upload_url)
+
+
+def upload_resumable(args, file_info, digests=None):
+    '''
+    Uploads the file in chunks with tus, resuming a previously interrupted
+    upload of the same file to the same course if there is one.
+
+    Returns the upload session and the status URL of the assembly. If given,
+    the digests dictionary is updated with the checksums of the file.
+    '''
+    session = resumable_upload.UploadSession(
+        args.upload_session_dir, file_info[0], args.course,
+        args.transloadit_template)
+    client = resumable_upload.TusClient(
+        chunk_size=args.chunk_size * 1024 * 1024,
+        retries=args.chunk_retries)
+    length = os.path.getsize(file_info[0])
+
+    state = session.load()
+    offset = None
+    if state is not None:
+        offset = client.resume_offset(state['uploadUrl'])
+        if offset is None:
+            logging.info('The interrupted upload has expired; starting over.')
+            state = None
+        elif not args.quiet or args.quiet == 0:
+            sys.stdout.write(
+                'Resuming upload at %(percent)s%%.\nStatus API:\n'
+                '\t%(upload_url)s\n' % {
+                    'percent': int(100.0 * offset / max(length, 1)),
+                    'upload_url': state['assemblyUrl'],
+                })
+            sys.stdout.flush()
+    if state is None:
+        status_url, upload_url = start_resumable_upload(
+            args, client, length, file_info[1])
+        state = {'assemblyUrl': status_url, 'uploadUrl': upload_url}
+        session.save(state)
+        offset = 0
+
+    with open(file_info[0], 'rb') as f:
+        image_file = upload_ledger.HashingReader(f)
+        # The part sent before the upload was interrupted has to be read
+        # again to be hashed.
+        image_file.hash_to(offset)
+        client.upload(state['uploadUrl'], image_file, length, offset,
+                      progress=lambda received: report_upload_progress(
+                          args, received, length))
+    if digests is not None:
+        digests.update(image_file.digests())
+    return (session, state['assemblyUrl'])
+
+
+def upload_image_resumable(args, file_name, digests=None):
+    '''
+    Streams the zip archive of args.from_image into a tus upload in chunks,
+    retrying each chunk on failure. Returns the status URL of the assembly.
+    If given, the digests dictionary is updated with the archive's checksums.
+    '''
+    client = resumable_upload.TusClient(
+        chunk_size=args.chunk_size * 1024 * 1024,
+        retries=args.chunk_retries)
+    status_url, upload_url = start_resumable_upload(
+        args, client, None, file_name)
+    image_stream = image_export.ImageZipStream(
+        utils.docker_client(args), args.from_image)
+    archive = upload_ledger.HashingReader(image_stream)
+    try:
+        client.upload_stream(upload_url, archive,
+                             progress=lambda received: report_upload_progress(
+                                 args, received, None))
+    finally:
+        image_stream.close()
+    if digests is not None:
+        digests.update(archive.digests())
+    return status_url
 
 
 def poll_transloadit(args, upload_url):
     """
     Polls Transloadit's API to determine the status of the upload. Outputs
     information to stdout (unless suppressed). Raises an exception if there is
-    an error, returns tuple of response information when complete, and None
+    an error, returns tuple of response information (the bucket, the key and
+    Transloadit's description of the uploaded file) when complete, and None
     otherwise
     """
     if args.upload_to_requestbin:
@@ -178,85 +399,291 @@ def poll_transloadit(args, upload_url):
                         'Could not parse the uploaded url correctly. URL: %s',
                         s3_link)
                     raise Exception('Error parsing the upload url!')
-                return (match.group(1), match.group(2))
+                return (match.group(1), match.group(2),
+                        body['results'][':original'][0])
 
 
-def command_upload(args):
-    "Implements the upload subcommand"
-
-    image = (args.imageZipFile, os.path.basename(args.imageZipFile))
-
-    oauth2_instance = oauth2.build_oauth2(args)
-    auth = oauth2_instance.build_authorizer()
-    # TODO: use transloadit's signatures for upload signing.
-    # authorization = authorize_upload(args, auth)
-
-    # Generate a random uuid for upload.
-    upload_id = uuid.uuid4().hex
-    transloadit_host = idle_transloadit_server(args)
-    upload_url = 'https://%(host)s/assemblies/%(id)s' % {
-        'host': transloadit_host,
-        'id': upload_id,
-    }
-    if args.upload_to_requestbin is not None:
-        upload_url = 'http://requestb.in/%s' % args.upload_to_requestbin
+def wait_for_assembly(args, upload_url):
+    '''
+    Polls the assembly until Transloadit has finished processing the upload,
+    starting at args.poll_interval seconds between polls and backing off
+    exponentially up to args.poll_max_interval. Returns the upload information
+    (see poll_transloadit), or None if processing did not finish within
+    args.processing_timeout seconds.
+    '''
+    deadline = time.time() + args.processing_timeout
+    interval = args.poll_interval
+    while True:
+        upload_information = poll_transloadit(args, upload_url)
+        if upload_information is not None:
+            return upload_information
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, args.poll_max_interval)
 
-    if not args.quiet or args.quiet == 0:
-        sys.stdout.write(
-            'About to upload to server:\n\t%(transloadit_host)s\n'
-            'with upload id:\n\t%(upload_id)s\nStatus API:\n'
-            '\t%(upload_url)s\nUploading...' % {
-                'transloadit_host': transloadit_host,
-                'upload_id': upload_id,
-                'upload_url': upload_url,
-            })
-        sys.stdout.flush()
-    p = multiprocessing.Process(target=upload, args=(args, upload_url, image))
-    p.daemon = True  # Auto-kill when the main process exits.
-    p.start()
-    time.sleep(20)  # Yield control to the child process to kick off upload.
 
-    upload_information = None
+def check_image(args):
+    "Checks that the docker daemon has args.from_image before uploading it."
+    try:
+        utils.docker_client(args).inspect_image(args.from_image)
+    except Exception as e:
+        logging.error('Could not find the image %s: %s', args.from_image, e)
+        return False
+    return True
 
-    while p.is_alive():
-        upload_information = poll_transloadit(args, upload_url)
-        if upload_information is not None:
-            logging.warn(
-                'Upload information retrieved before upload completed??! %s',
-                upload_information)
-            break
-        time.sleep(10)  # 10 seconds
 
-    p.join(1)  # Join to clean up zombie.
+def verify_upload(upload_information, digests):
+    '''
+    Checks the size and MD5 of the file Transloadit received (if it reported
+    them) against the checksums of the file sent. Returns True if they match.
+    '''
+    if len(upload_information) < 3 or not digests:
+        return True
+    received = upload_information[2]
+    if 'size' in received and received['size'] != digests['size']:
+        logging.error('Transloadit received %s bytes, but %s were sent.',
+                      received['size'], digests['size'])
+        return False
+    if 'md5hash' in received and received['md5hash'] != digests['md5']:
+        logging.error('The MD5 of the file Transloadit received (%s) does '
+                      'not match the file sent (%s).',
+                      received['md5hash'], digests['md5'])
+        return False
+    return True
+
+
+def send_image(args, image, from_image=None, digests=None):
+    '''
+    Uploads the image zip file (or, given from_image, streams the image from
+    the docker daemon) and waits for Transloadit to process it. Returns the
+    upload information (see poll_transloadit), or None if the upload failed.
 
-    # TODO: make time waiting for transloadit to finish processing configurable
-    for i in range(300):
-        upload_information = poll_transloadit(args, upload_url)
-        if upload_information is not None:
-            break
-        time.sleep(5)
+    The checksums of what is sent are computed as it is read, and, if given,
+    the digests dictionary is updated with them (see upload_ledger).
+    '''
+    if digests is None:
+        digests = {}
+    upload_session = None
+    if from_image is not None and args.resumable:
+        try:
+            upload_url = upload_image_resumable(args, image[1], digests)
+        except (resumable_upload.UploadError,
+                image_export.ExportError) as e:
+            logging.error('%s', e)
+            return None
+    elif args.resumable:
+        try:
+            upload_session, upload_url = upload_resumable(
+                args, image, digests)
+        except resumable_upload.UploadError as e:
+            logging.error('%s Run the same command again to resume.', e)
+            return None
+        except KeyboardInterrupt:
+            logging.error('Upload interrupted. Run the same command again to '
+                          'resume.')
+            return None
+    else:
+        # Generate a random uuid for upload.
+        upload_id = uuid.uuid4().hex
+        transloadit_host = idle_transloadit_server(args)
+        upload_url = assembly_url(args, transloadit_host, upload_id)
+        if args.upload_to_requestbin is not None:
+            upload_url = 'http://requestb.in/%s' % args.upload_to_requestbin
+
+        if not args.quiet or args.quiet == 0:
+            sys.stdout.write(
+                'About to upload to server:\n\t%(transloadit_host)s\n'
+                'with upload id:\n\t%(upload_id)s\nStatus API:\n'
+                '\t%(upload_url)s\nUploading...' % {
+                    'transloadit_host': transloadit_host,
+                    'upload_id': upload_id,
+                    'upload_url': upload_url,
+                })
+            sys.stdout.flush()
+        # Progress is reported by the child as it reads the request body, and
+        # the checksums it computed are sent back once it is done.
+        bytes_sent = multiprocessing.Value('q', 0)
+        digests_receiver, digests_sender = multiprocessing.Pipe(False)
+        if from_image is not None:
+            # The size of the archive is only known once it is complete.
+            total = None
+            p = multiprocessing.Process(
+                target=upload_image,
+                args=(args, upload_url, image[1], bytes_sent,
+                      digests_sender))
+        else:
+            total = os.path.getsize(image[0])
+            p = multiprocessing.Process(
+                target=upload,
+                args=(args, upload_url, image, bytes_sent, digests_sender))
+        p.daemon = True  # Auto-kill when the main process exits.
+        p.start()
+
+        while p.is_alive():
+            report_upload_progress(args, bytes_sent.value, total)
+            p.join(args.progress_interval)
+        report_upload_progress(args, bytes_sent.value, total)
+
+        if p.exitcode != 0:
+            logging.error('Upload failed. (exit code %s)', p.exitcode)
+            return None
+        if digests_receiver.poll():
+            digests.update(digests_receiver.recv())
 
+    upload_information = wait_for_assembly(args, upload_url)
     if upload_information is None:
         logging.error(
             'Upload did not complete within expected time limits. Upload '
             'URL: %s',
             upload_url)
-        return 1
+        return None
+    if upload_session is not None:
+        upload_session.delete()
+    if not verify_upload(upload_information, digests):
+        return None
+    return upload_information
+
+
+def register_upload(args, oauth2_instance, upload_information, session,
+                    digests=None):
+    "Registers the uploaded grader, returning its id (None on failure)."
     # Register the grader with Coursera to initiate the image cleaning process
     logging.debug('Grader upload info is: %s', upload_information)
 
     # Rebuild an authorizer to ensure it's fresh and not expired
     auth = oauth2_instance.build_authorizer()
+    try:
+        return register_grader(auth,
+                               args,
+                               bucket=upload_information[0],
+                               key=upload_information[1],
+                               session=session,
+                               digests=digests)
+    except:
+        print()
+        return None
+
+
+def image_layers(args, image, from_image=None):
+    '''
+    Lists the layers of the image being uploaded (see
+    layer_index.read_image_layers), or returns None if they cannot be read.
+    Layers of an image streamed from the docker daemon have no path or size.
+    '''
+    try:
+        if from_image is not None:
+            digests = utils.docker_client(args).inspect_image(
+                from_image)['RootFS']['Layers']
+            return [{'digest': digest, 'path': None, 'size': None}
+                    for digest in digests]
+        return layer_index.read_image_layers(image[0])
+    except Exception as e:
+        logging.debug('Could not list the layers of the image.', exc_info=True)
+        logging.info('Not indexing the layers of the image: %s', e)
+        return None
+
+
+def command_upload(args):
+    "Implements the upload subcommand"
+
+    image = (args.imageZipFile, os.path.basename(args.imageZipFile))
+    from_image = getattr(args, 'from_image', None)
+    if from_image is not None:
+        if not check_image(args):
+            return 1
+    elif not os.path.isfile(image[0]):
+        logging.error('%s is not a valid file or is not a zip file',
+                      image[0])
+        return 1
+
+    oauth2_instance = oauth2.build_oauth2(args)
+    auth = oauth2_instance.build_authorizer()
+    # TODO: use transloadit's signatures for upload signing.
+    # authorization = authorize_upload(args, auth)
+    session = utils.api_session(pool_size=args.update_workers)
 
+    ledger = None
+    if getattr(args, 'upload_ledger', None) is not None:
+        ledger = upload_ledger.UploadLedger(args.upload_ledger)
+    identity = None
+    image_id = None
     try:
-        grader_id = register_grader(auth,
-                                    args,
-                                    bucket=upload_information[0],
-                                    key=upload_information[1])
+        if from_image is not None:
+            image_id = utils.docker_client(args).inspect_image(
+                from_image)['Id']
+        else:
+            identity = upload_ledger.file_identity(image[0])
+    except Exception as e:
+        logging.debug('Could not identify the image: %s', e)
+    if ledger is not None and not getattr(args, 'force', False):
+        registered = ledger.find_registered(
+            args.course, identity=identity, image_id=image_id,
+            digests_of=lambda: upload_ledger.file_digests(image[0]),
+            settings=registration_settings(args))
+        if registered is not None:
+            logging.warn(
+                'This image was already registered with the course as grader '
+                '%s (on %s), with the same resource limits; not uploading it '
+                'again. Pass --force to upload it anyway.',
+                registered['graderId'], registered.get('uploadedAt'))
+            return use_grader(args, oauth2_instance, registered['graderId'],
+                              session)
+
+    index = None
+    if getattr(args, 'layer_index', None) is not None:
+        index = layer_index.LayerIndex(args.layer_index)
+    digests = {}
+    start = time.time()
+    upload_information = send_image(args, image, from_image, digests)
+    if upload_information is None:
+        return 1
+    grader_id = register_upload(
+        args, oauth2_instance, upload_information, session, digests)
+    if grader_id is None:
+        return 1
+
+    if ledger is not None:
+        entry = {
+            'course': args.course,
+            'graderId': grader_id,
+            'fileName': image[1],
+            'file': identity,
+            'imageId': image_id,
+            'settings': registration_settings(args),
+            'uploadSeconds': round(time.time() - start, 3),
+            'uploadedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        entry.update(digests)
+        if upload_information is not None:
+            entry.update(bucket=upload_information[0],
+                         key=upload_information[1])
+        try:
+            ledger.record(entry)
+        except (IOError, OSError) as e:
+            logging.warn('Could not record the upload in %s: %s',
+                         ledger.path, e)
+
+    if index is not None:
+        layers = image_layers(args, image, from_image)
+        if layers is not None:
+            try:
+                index.record(layers, args.course, grader_id)
+            except (IOError, OSError) as e:
+                logging.warn('Could not record the image layers in %s: %s',
+                             index.path, e)
+
+    return use_grader(args, oauth2_instance, grader_id, session)
 
-        print('Grader id: %s\n' % grader_id)
 
-        return (update_assignments(auth, grader_id, args)
+def use_grader(args, oauth2_instance, grader_id, session):
+    "Prints the id of the grader and updates the assignments to use it."
+    print('Grader id: %s\n' % grader_id)
+
+    auth = oauth2_instance.build_authorizer()
+    try:
+        return (update_assignments(auth, grader_id, args, session=session)
                 if (args.item is not None and args.part is not None)
                 else 0)
     except:
@@ -264,11 +691,21 @@ def command_upload(args):
         return 1
 
 
-def register_grader(auth, args, bucket, key):
+def registration_settings(args):
+    "The resources to reserve for the grader, as sent to register it."
     grader_cpu = None
-
     if hasattr(args, 'grader_cpu') and args.grader_cpu is not None:
         grader_cpu = args.grader_cpu * 1024
+    return {
+        'reservedCpu': grader_cpu,
+        'reservedMemory': getattr(args, 'grader_memory_limit', None),
+        'wallClockTimeout': getattr(args, 'grader_timeout', None),
+    }
+
+
+def register_grader(auth, args, bucket, key, session=None, digests=None):
+    if session is None:
+        session = utils.api_session()
 
     context_body = {
         "typeName": "branchContext",
@@ -280,17 +717,33 @@ def register_grader(auth, args, bucket, key):
         'context': context_body,
         'bucket': bucket,
         'key': key,
-        'reservedCpu': grader_cpu,
-        'reservedMemory': getattr(args, 'grader_memory_limit', None),
-        'wallClockTimeout': getattr(args, 'grader_timeout', None),
     }
+    register_request.update(registration_settings(args))
+    if digests:
+        register_request.update({
+            'artifactSha256': digests['sha256'],
+            'artifactSize': digests['size'],
+        })
     logging.debug('About to POST data to register endpoint: %s',
                   json.dumps(register_request))
 
-    register_result = requests.post(
+    register_result = session.post(
         args.register_endpoint,
         data=json.dumps(register_request),
         auth=auth)
+    if register_result.status_code == 400 and digests and (
+            'artifactSha256' in register_result.text or
+            'artifactSize' in register_result.text):
+        # Endpoints that do not know the checksum fields reject them.
+        logging.debug('The register endpoint rejected the checksum of the '
+                      'image (%s); registering without it.',
+                      register_result.text)
+        del register_request['artifactSha256']
+        del register_request['artifactSize']
+        register_result = session.post(
+            args.register_endpoint,
+            data=json.dumps(register_request),
+            auth=auth)
     if register_result.status_code != 201:  # Created
         logging.error(
             'Failed to register grader (%s) with Coursera.\n' +
@@ -311,7 +764,9 @@ def register_grader(auth, args, bucket, key):
     return grader_id
 
 
-def update_assignment(auth, grader_id, args, item, part):
+def update_assignment(auth, grader_id, args, item, part, session=None):
+    if session is None:
+        session = utils.api_session()
     course_branch_id = (args.course.replace("~", "!~")
                         if "authoringBranch~" in args.course else args.course)
 
@@ -321,7 +776,7 @@ def update_assignment(auth, grader_id, args, item, part):
         'partId': part,
         'executorId': grader_id,
     }
-    update_result = requests.post(
+    update_result = session.post(
         args.update_part_endpoint,
         params=update_assignment_params,
         auth=auth)
@@ -343,29 +798,54 @@ def update_assignment(auth, grader_id, args, item, part):
     return 0
 
 
-def update_assignments(auth, grader_id, args):
+def update_assignments(auth, grader_id, args, session=None):
+    """
+    Updates all the assignment parts to use the grader, args.update_workers at
+    a time. Failures are collected and reported once all parts have been
+    attempted. Returns 0 if every part was updated, 1 otherwise.
+    """
     item_and_parts = [[args.item, args.part]]
     if args.additional_item_and_part is not None:
         item_and_parts.extend(args.additional_item_and_part)
-    return_result = 0
-    for item_and_part in item_and_parts:
-        item = item_and_part[0]
-        part = item_and_part[1]
-        result = update_assignment(auth,
-                                   grader_id,
-                                   args,
-                                   item,
-                                   part)
-        if result != 0:
-            logging.error(
-                'Executor was successfully uploaded, but we were unable ' +
-                'to update assignment part %s to new executor %s. ' +
-                'You may select your grader in the item page',
-                part,
-                grader_id)
-            return_result = 1
-
-    return return_result
+    workers = getattr(args, 'update_workers', 1)
+    if session is None:
+        session = utils.api_session(pool_size=workers)
+
+    def update(item_and_part):
+        try:
+            return update_assignment(auth,
+                                     grader_id,
+                                     args,
+                                     item_and_part[0],
+                                     item_and_part[1],
+                                     session=session)
+        except requests.exceptions.RequestException as e:
+            logging.error('Unable to update assignment part %s to use the '
+                          'new grader: %s', item_and_part[1], e)
+            return 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(update, item_and_part)
+                   for item_and_part in item_and_parts]
+        results = [future.result() for future in futures]
+
+    failed_parts = [item_and_part[1]
+                    for (item_and_part, result) in zip(item_and_parts, results)
+                    if result != 0]
+    if failed_parts:
+        logging.error(
+            'Executor was successfully uploaded, but we were unable ' +
+            'to update %d of %d assignment parts (%s) to new executor %s. ' +
+            'You may select your grader in the item page',
+            len(failed_parts),
+            len(item_and_parts),
+            ', '.join(failed_parts),
+            grader_id)
+        return 1
+    logging.info('Updated %d assignment parts to new executor %s',
+                 len(item_and_parts),
+                 grader_id)
+    return 0
 
 
 def setup_registration_parser(parser):
@@ -374,8 +854,9 @@ def setup_registration_parser(parser):
 
     parser.add_argument(
         'imageZipFile',
-        help='Path to the docker image zip file',
-        type=common.arg_fq_file
+        help='Path to the docker image zip file. With --from-image, the name '
+             'to give the uploaded zip file instead (e.g. grader.zip).',
+        type=lambda value: os.path.abspath(os.path.expanduser(value))
     )
 
     parser.add_argument(
@@ -433,6 +914,13 @@ def setup_registration_parser(parser):
         help='Amount of time allowed before your grader times out, in '
              'seconds. The default time is 1200 seconds (20 minutes).')
 
+    parser.add_argument(
+        '--update-workers',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=8,
+        help='Number of assignment parts to update with the new grader at '
+             'the same time. (Default: %(default)s)')
+
     parser.add_argument(
         '--register-endpoint',
         default='https://api.coursera.org/api/gridExecutorBuildAttempts.v1',
@@ -475,4 +963,94 @@ def parser(subparsers):
         default='05912e90e83346abb96c261bf458b615',
         help='The Coursera transloadit account id.')
 
+    parser_upload.add_argument(
+        '--transloadit-bored-api',
+        default=TRANSLOADIT_BORED_API,
+        help='Override the endpoint used to find an idle Transloadit '
+             'instance to upload to.')
+
+    parser_upload.add_argument(
+        '--progress-interval',
+        type=float,
+        default=0.5,
+        help='Seconds between updates of the upload progress. '
+             '(Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--poll-interval',
+        type=float,
+        default=0.5,
+        help='Seconds to wait before first re-checking the status of the '
+             'upload with Transloadit. The wait doubles after each check. '
+             '(Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--poll-max-interval',
+        type=float,
+        default=10,
+        help='Maximum number of seconds between checks of the status of the '
+             'upload. (Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--processing-timeout',
+        type=float,
+        default=1500,
+        help='Number of seconds to wait for Transloadit to finish processing '
+             'the upload. (Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--resumable',
+        action='store_true',
+        help='Upload the image in chunks, retrying each chunk on failure. An '
+             'interrupted upload resumes where it left off when the same '
+             'command is run again.')
+
+    parser_upload.add_argument(
+        '--chunk-size',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        default=16,
+        help='Size of each chunk of a resumable upload, in MB. '
+             '(Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--chunk-retries',
+        type=lambda value: utils.check_int_range(value, lower=0),
+        default=5,
+        help='Number of times a chunk of a resumable upload is retried in a '
+             'row before giving up. (Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--from-image',
+        metavar='TAG',
+        help='Export the image with this tag (or id) from the docker daemon '
+             'and upload it, compressing it on the fly, instead of uploading '
+             'imageZipFile. No zip file is written to disk. With '
+             '--resumable, failed chunks are retried, but an interrupted '
+             'upload starts over.')
+
+    parser_upload.add_argument(
+        '--layer-index',
+        metavar='FILE',
+        help='Record the layers of the uploaded image in FILE (e.g. '
+             '~/.coursera/layer_index.json). Listing the layers of an image '
+             'zip file reads through the whole image once more.')
+
+    parser_upload.add_argument(
+        '--upload-session-dir',
+        default='~/.coursera/uploads',
+        help='Where the state of resumable uploads is kept. '
+             '(Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--upload-ledger',
+        default='~/.coursera/upload_ledger.jsonl',
+        help='Where the checksums, size and upload time of registered images '
+             'are recorded. (Default: %(default)s)')
+
+    parser_upload.add_argument(
+        '--force',
+        action='store_true',
+        help='Upload and register the image even if the upload ledger shows '
+             'it was already registered with the course.')
+
     return parser_upload
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Checksums of uploaded artifacts, and a local ledger of uploads.
+
+The checksums are computed as the artifact is read to be sent, so that
+uploading a multi-GB image does not mean reading it twice. The ledger is a
+JSON Lines file with one entry per registered upload: the artifact's
+checksums and size, how long the upload took, and the grader it was
+registered as, with the resources reserved for it.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+
+
+class HashingReader(object):
+    '''
+    Wraps a file object opened for reading, computing the SHA-256 and MD5 of
+    its contents as they are read. Data read again after seeking back (e.g.
+    to retry a chunk) is only hashed once. Reading must otherwise be
+    sequential: seeking past the data hashed so far requires `hash_to`.
+    '''
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.hashed = 0
+        self.position = 0
+
+    def _update(self, data, position):
+        if position + len(data) <= self.hashed:
+            return
+        if position > self.hashed:
+            raise ValueError('Cannot hash past %s bytes before reading them.' %
+                             self.hashed)
+        data = data[self.hashed - position:]
+        self.sha256.update(data)
+        self.md5.update(data)
+        self.hashed += len(data)
+
+    def read(self, size=-1):
+        data = self.file_obj.read(size)
+        self._update(data, self.position)
+        self.position += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.position = self.file_obj.seek(offset, whence)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def fileno(self):
+        return self.file_obj.fileno()
+
+    def hash_to(self, offset, chunk_size=1024 * 1024):
+        '''
+        Hashes the data up to offset (e.g. the part of a resumed upload sent
+        before), then seeks back to the current position.
+        '''
+        position = self.position
+        self.seek(self.hashed)
+        while self.hashed < offset:
+            if not self.read(min(chunk_size, offset - self.hashed)):
+                break
+        self.seek(position)
+
+    def digests(self):
+        "The checksums and size of the data hashed so far."
+        return {
+            'sha256': self.sha256.hexdigest(),
+            'md5': self.md5.hexdigest(),
+            'size': self.hashed,
+        }
+
+
+def file_digests(path, chunk_size=1024 * 1024):
+    "Computes the checksums of a file, as HashingReader does."
+    with open(path, 'rb') as f:
+        reader = HashingReader(f)
+        while reader.read(chunk_size):
+            pass
+    return reader.digests()
+
+
+def file_identity(path):
+    "The path, size and modification time of a file."
+    stat = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+    }
+
+
+class UploadLedger(object):
+    '''
+    The ledger of uploads, a JSON Lines file at path. Entries are appended
+    with a single write, so concurrent uploads do not corrupt it.
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def entries(self):
+        "Returns the entries of the ledger, oldest first."
+        entries = []
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        logging.debug('Skipping a bad ledger entry: %s', line)
+        except IOError:
+            pass
+        return entries
+
+    def record(self, entry):
+        dir_name = os.path.dirname(self.path)
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name, mode=0o700)
+        line = (json.dumps(entry, sort_keys=True) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def find_registered(self, course, identity=None, image_id=None,
+                        digests_of=None, settings=None):
+        '''
+        Returns the latest entry of an artifact registered for the course
+        with the same settings (the resources reserved for the grader) that
+        is identical to the one about to be uploaded, or None. An entry
+        matches if it has the same file identity (see file_identity) or image
+        id. Failing that, if digests_of is given and an entry has the same
+        size as the artifact, digests_of() is called to compute the
+        artifact's checksums (at most once) to compare them.
+        '''
+        digests = None
+        for entry in reversed(self.entries()):
+            if entry.get('course') != course or not entry.get('graderId'):
+                continue
+            if entry.get('settings') != settings:
+                continue
+            if image_id is not None and entry.get('imageId') == image_id:
+                return entry
+            if identity is None:
+                continue
+            if entry.get('file') == identity:
+                return entry
+            if digests_of is not None and \
+                    entry.get('size') == identity['size']:
+                if digests is None:
+                    digests = digests_of()
+                if entry.get('sha256') == digests['sha256']:
+                    return entry
+        return None
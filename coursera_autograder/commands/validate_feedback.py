@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The validate_feedback subcommand checks feedback files written by graders
+(e.g. the output of `grade batch`) against the feedback format Coursera
+expects, and reports every problem found in each of them.
+"""
+
+import copy
+from coursera_autograder.commands import feedback_schema
+from coursera_autograder.commands import output
+from coursera_autograder import utils
+import logging
+import sys
+import time
+
+FEEDBACK_FIELDS = ['file', 'valid', 'errors']
+
+
+def build_validator(args):
+    """
+    Compiles the feedback schema: the checks `grade` runs, or the stricter
+    ones with --strict, limiting the size of the feedback if asked to.
+    """
+    schema = copy.deepcopy(feedback_schema.STRICT_FEEDBACK_SCHEMA
+                           if args.strict else
+                           feedback_schema.FEEDBACK_SCHEMA)
+    if args.max_feedback_size is not None:
+        for (name, rules) in schema['fields']:
+            if name == 'feedback':
+                rules['maxBytes'] = args.max_feedback_size * 1024
+    return feedback_schema.compile_schema(schema)
+
+
+def command_validate_feedback(args):
+    """
+    Implements the validate_feedback subcommand: validates each feedback file
+    and returns 1 if any of them is invalid.
+    """
+    validate = build_validator(args)
+    file_names = feedback_schema.find_feedback_files(args.paths)
+    if len(file_names) == 0:
+        logging.error('No feedback files found in %s.', ', '.join(args.paths))
+        return 1
+
+    invalid = 0
+    start = time.time()
+    with output.row_writer(args, FEEDBACK_FIELDS) as writer:
+        for file_name in file_names:
+            try:
+                errors = feedback_schema.validate_feedback_file(
+                    file_name, validate)
+            except (IOError, OSError) as e:
+                errors = ['Could not read the feedback: %s' % e]
+            if errors:
+                invalid += 1
+                text = '\n'.join('%s: %s' % (file_name, error)
+                                 for error in errors)
+            elif args.only_invalid:
+                text = None
+            else:
+                text = '%s: OK' % file_name
+            writer.write({'file': file_name, 'valid': not errors,
+                          'errors': errors}, text=text)
+    elapsed = time.time() - start
+    logging.info('Validated %s feedback files in %.3f seconds (%.0f per '
+                 'second): %s invalid.', len(file_names), elapsed,
+                 len(file_names) / max(elapsed, 1e-6), invalid)
+    return 1 if invalid else 0
+
+
+def parser(subparsers):
+    "Build an argparse argument parser to parse the command line."
+
+    # create the parser for the validate_feedback command
+    parser_validate_feedback = subparsers.add_parser(
+        'validate_feedback',
+        help='Checks feedback files written by graders against the feedback '
+             'format Coursera expects.',
+        description=sys.modules[__name__].__doc__)
+    parser_validate_feedback.set_defaults(func=command_validate_feedback)
+
+    parser_validate_feedback.add_argument(
+        'paths',
+        nargs='+',
+        help='Feedback files, or directories to search for feedback.json '
+             'files in (e.g. the --dst-dir of `grade batch`).')
+    parser_validate_feedback.add_argument(
+        '--max-feedback-size',
+        type=lambda value: utils.check_int_range(value, lower=1),
+        metavar='KB',
+        help='Report feedback larger than KB kilobytes. (Default: no limit)')
+    parser_validate_feedback.add_argument(
+        '--strict',
+        action='store_true',
+        help='Also require a finite score, a string feedback whose '
+             'feedbackType (if any) is HTML or MARKDOWN, a boolean isCorrect '
+             'even alongside fractionalScore, and no other fields (such as '
+             'misspelled ones). By default, only the checks `grade` runs are '
+             'made.')
+    parser_validate_feedback.add_argument(
+        '--only-invalid',
+        action='store_true',
+        help='Only list the invalid feedback files.')
+    output.add_output_parser(parser_validate_feedback)
+    return parser_validate_feedback
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Warm grader containers are long-lived containers that are reused across
+grading runs, so that heavy images only pay the cost of container creation and
+start-up once.
+
+A warm container runs an idle process instead of the image's entrypoint. The
+grader is run inside it with `docker exec`, after the submission has been
+copied into /shared/submission with `put_archive`. Between runs, /shared is
+emptied and the container is paused. Paused warm containers are left behind
+when the command exits, so that later invocations can claim them again.
+
+Nothing a run leaves behind may reach the next one: once /shared is emptied,
+a container whose filesystem differs from its image anywhere else (files in
+/tmp, $HOME, the working directory, caches...) or that still runs processes
+the grader started is removed instead of being returned to the pool, and the
+next run gets a fresh container created from the image. Images declaring
+volumes other than /shared cannot be checked this way and are refused.
+
+Graders that write caches on every run (e.g. to $HOME/.cache) would then never
+reuse a container. Directories the grader only uses as scratch space can be
+listed as scratch paths, with the SCRATCH_LABEL of the image (paths separated
+by spaces or commas) or on the command line: they are emptied between runs
+like /shared, and changes to them do not prevent reuse, unless files the image
+shipped in them were removed. The pool counts how often containers are reused
+and removed (and why), so that the benefit can be checked.
+"""
+
+import collections
+import hashlib
+import logging
+import os.path
+import shlex
+import tarfile
+import tempfile
+import threading
+from requests.exceptions import ReadTimeout
+
+WARM_LABEL = 'org.coursera.autograder.warm'
+
+# The image label listing its scratch paths.
+SCRATCH_LABEL = WARM_LABEL + '.scratch-paths'
+
+# Keeps the container alive (and responsive to `docker stop`) between runs.
+IDLE_COMMAND = [
+    '/bin/sh', '-c',
+    'trap "exit 0" TERM; while :; do sleep 3600 & wait $!; done',
+]
+
+# Where the grader's standard output and error are captured during a run.
+LOG_DIR = '/tmp/.coursera_autograder'
+
+
+def reset_script(scratch_paths=()):
+    "The script emptying /shared and the scratch paths, and the log dir."
+    emptied = ' '.join(
+        '%s/%s' % (shlex.quote(emptied_path), pattern)
+        for emptied_path in ['/shared'] + list(scratch_paths)
+        for pattern in ('*', '.[!.]*', '..?*'))
+    return 'rm -rf %(emptied)s %(log_dir)s; mkdir -p /shared %(log_dir)s' % {
+        'emptied': emptied, 'log_dir': LOG_DIR}
+
+# The only paths a grading run may leave changed once the container is reset
+# (besides the scratch paths).
+RESET_PATHS = ['/shared', LOG_DIR]
+
+RUN_SCRIPT = 'exec env "$@" > %(log_dir)s/stdout 2> %(log_dir)s/stderr' % {
+    'log_dir': LOG_DIR}
+
+
+def pool_key(image_id, host_config):
+    """
+    Computes the key identifying interchangeable warm containers: containers
+    of the same image with the same resource constraints.
+    """
+    key = hashlib.sha256()
+    key.update(image_id.encode('utf-8'))
+    key.update(repr(sorted(host_config.items())).encode('utf-8'))
+    return key.hexdigest()[:32]
+
+
+def is_reset_path(path, reset_paths=RESET_PATHS):
+    "Whether the path is one of the reset_paths, or within one."
+    return any(path == reset_path or path.startswith(reset_path + '/')
+               for reset_path in reset_paths)
+
+
+def is_reset_parent(path, reset_paths=RESET_PATHS):
+    "Whether the path is a directory containing one of the reset_paths."
+    return any(reset_path.startswith(path.rstrip('/') + '/')
+               for reset_path in reset_paths)
+
+
+def parse_scratch_paths(paths, source):
+    '''
+    Normalizes scratch paths, raising ValueError unless each is an absolute
+    path other than the root directory.
+    '''
+    parsed = []
+    for scratch_path in paths:
+        normalized = os.path.normpath(scratch_path)
+        if not os.path.isabs(normalized) or normalized == '/':
+            raise ValueError('Invalid scratch path %r in %s: scratch paths '
+                             'must be absolute directories other than /.' %
+                             (scratch_path, source))
+        parsed.append(normalized)
+    return parsed
+
+
+def _changed_area(path):
+    "The top two levels of a changed path (e.g. /root/.cache), to tally."
+    return '/' + '/'.join(path.strip('/').split('/')[:2])
+
+
+def submission_archive(submission_dir):
+    "Packs a submission directory into a tar file rooted at `submission/`."
+    archive = tempfile.TemporaryFile()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        tar.add(submission_dir, arcname='submission')
+    archive.seek(0)
+    return archive
+
+
+class WarmContainerPool(object):
+    '''
+    Hands out warm containers for a given image and resource configuration.
+
+    Containers are claimed by unpausing them: unpausing a container that
+    another process has already claimed fails, so concurrent invocations never
+    share a container.
+    '''
+
+    def __init__(self, docker, image, host_config, scratch_paths=None):
+        self.docker = docker
+        self.image = image
+        self.host_config = host_config
+        image_config = docker.inspect_image(image)
+        self.image_id = image_config['Id']
+        config = image_config.get('Config') or {}
+        self.grader_command = (
+            (config.get('Entrypoint') or []) + (config.get('Cmd') or []))
+        if not self.grader_command:
+            raise ValueError(
+                'Image %s has neither an ENTRYPOINT nor a CMD to run.' % image)
+        volumes = sorted(
+            set(config.get('Volumes') or {}) - set(['/shared', '/shared/']))
+        if volumes:
+            raise ValueError(
+                'Image %s declares volumes (%s) that cannot be reset between '
+                'runs; it cannot be used with warm containers.' % (
+                    image, ', '.join(volumes)))
+        label = (config.get('Labels') or {}).get(SCRATCH_LABEL) or ''
+        self.scratch_paths = parse_scratch_paths(
+            label.replace(',', ' ').split(),
+            'the %s label of %s' % (SCRATCH_LABEL, image)) + \
+            parse_scratch_paths(scratch_paths or [], 'the command line')
+        self.reset_script = reset_script(self.scratch_paths)
+        self.key = pool_key(self.image_id, host_config)
+        self._stats_lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.changed_areas = collections.Counter()
+
+    def _count(self, event):
+        with self._stats_lock:
+            self.stats[event] += 1
+
+    def _claim_paused(self):
+        paused = self.docker.containers(
+            all=True,
+            filters={
+                'label': '%s=%s' % (WARM_LABEL, self.key),
+                'status': 'paused',
+            })
+        for candidate in paused:
+            try:
+                self.docker.unpause(candidate['Id'])
+            except Exception:
+                logging.debug('Warm container %s was claimed by someone '
+                              'else.', candidate['Id'])
+                continue
+            logging.debug('Claimed warm container %s.', candidate['Id'])
+            self._count('reused')
+            return candidate['Id']
+        return None
+
+    def acquire(self):
+        "Returns the id of a running warm container, reserved for the caller."
+        container = self._claim_paused()
+        if container is None:
+            logging.debug('No idle warm container found; creating one.')
+            container = self.docker.create_container(
+                image=self.image,
+                entrypoint=IDLE_COMMAND,
+                command=[],
+                host_config=self.host_config,
+                labels={WARM_LABEL: self.key},
+            )['Id']
+            self.docker.start(container)
+            self._count('created')
+        return container
+
+    def _exec(self, container, command, timeout=None):
+        '''
+        Runs the command within the container, returning its exit code. Raises
+        ReadTimeout if it has not finished within `timeout` seconds, just like
+        docker.wait.
+        '''
+        exec_id = self.docker.exec_create(container, command)
+        runner = threading.Thread(
+            target=self.docker.exec_start, args=(exec_id, ))
+        runner.daemon = True
+        runner.start()
+        runner.join(timeout)
+        inspected = self.docker.exec_inspect(exec_id)
+        if inspected['Running']:
+            raise ReadTimeout('Command did not complete within %s seconds.' %
+                              timeout)
+        return inspected['ExitCode']
+
+    def run(self, container, submission_dir, environment, timeout):
+        '''
+        Runs the grader on a submission within a warm container, returning the
+        grader's exit code. The grader's feedback is left in /shared, exactly
+        as when running in a fresh container.
+        '''
+        if self._exec(container, ['/bin/sh', '-c', self.reset_script]) != 0:
+            raise Exception('Could not reset warm container %s.' % container)
+        with submission_archive(submission_dir) as archive:
+            self.docker.put_archive(container, '/shared', archive)
+        env_assignments = [
+            '%s=%s' % (name, value)
+            for (name, value) in sorted((environment or {}).items())]
+        return self._exec(
+            container,
+            ['/bin/sh', '-c', RUN_SCRIPT, 'grader'] + env_assignments +
+            self.grader_command,
+            timeout=timeout)
+
+    def logs(self, container):
+        "Returns the (stdout, stderr) of the last grader run, as bytes."
+        raw_stream, _ = self.docker.get_archive(container, LOG_DIR)
+        output = {'stdout': b'', 'stderr': b''}
+        with tarfile.open(mode='r|', fileobj=raw_stream) as tar:
+            for member in tar:
+                name = member.name.split('/')[-1]
+                if member.isfile() and name in output:
+                    output[name] = tar.extractfile(member).read()
+        return (output['stdout'], output['stderr'])
+
+    def leftovers(self, container):
+        '''
+        Lists what a grading run left behind in a container once reset: the
+        paths changed since it was created from the image (other than the
+        directories holding the RESET_PATHS and scratch paths, changed by
+        creating them, and the scratch paths unless files of the image were
+        removed from them) and the processes running besides the idle
+        command.
+        '''
+        reset_paths = RESET_PATHS + self.scratch_paths
+        changed = []
+        for change in self.docker.diff(container) or []:
+            # Kind 0 is a modified path; 1 and 2 are added and deleted ones.
+            if is_reset_path(change['Path']) or (
+                    change['Kind'] == 0 and
+                    is_reset_parent(change['Path'], reset_paths)) or (
+                    change['Kind'] != 2 and
+                    is_reset_path(change['Path'], self.scratch_paths)):
+                continue
+            changed.append(change['Path'])
+        # The idle shell, and the sleep it waits on.
+        processes = (self.docker.top(container) or {}).get('Processes') or []
+        if len(processes) > 2:
+            changed.append('%s processes running' % len(processes))
+        return changed
+
+    def _record_leftovers(self, leftovers):
+        areas = set(leftover if leftover.endswith('running') else
+                    _changed_area(leftover) for leftover in leftovers)
+        with self._stats_lock:
+            self.changed_areas.update(areas)
+
+    def release(self, container):
+        '''
+        Returns a container to the pool once a grading run is complete, or
+        removes it if the run left anything behind besides /shared.
+        '''
+        try:
+            if self._exec(container,
+                          ['/bin/sh', '-c', self.reset_script]) != 0:
+                raise Exception('Could not reset warm container %s.' %
+                                container)
+            leftovers = self.leftovers(container)
+            if leftovers:
+                logging.debug('The grader changed warm container %s (%s); '
+                              'removing it.', container,
+                              ', '.join(leftovers[:10]))
+                self._record_leftovers(leftovers)
+                self.discard(container)
+                return
+            self.docker.pause(container)
+            self._count('returned')
+            logging.debug('Returned warm container %s to the pool.',
+                          container)
+        except Exception:
+            logging.warn('Could not return warm container %s to the pool.',
+                         container, exc_info=True)
+            self.discard(container)
+
+    def discard(self, container):
+        "Removes a container that can no longer be reused (e.g. timed out)."
+        self._count('removed')
+        try:
+            self.docker.remove_container(container, force=True)
+        except Exception:
+            logging.warn('Could not remove warm container %s.', container)
+
+    def summary(self):
+        '''
+        Describes how often runs reused a container, and how often containers
+        were removed rather than returned to the pool (and what the graders
+        changed in them), for logging.
+        '''
+        with self._stats_lock:
+            stats = dict(self.stats)
+            changed = self.changed_areas.most_common(5)
+        text = ('%s runs reused a warm container and %s created one; %s '
+                'containers were returned to the pool and %s removed.' % (
+                    stats.get('reused', 0), stats.get('created', 0),
+                    stats.get('returned', 0), stats.get('removed', 0)))
+        if changed:
+            text += (' Most often changed outside /shared: %s. Directories '
+                     'the grader only uses as scratch space or caches may be '
+                     'listed as scratch paths, to be emptied instead.' %
+                     ', '.join('%s (%s)' % area for area in changed))
+        return text
+
+
+def clear_pool(docker):
+    "Removes all warm containers. Returns the number of containers removed."
+    containers = docker.containers(all=True, filters={'label': WARM_LABEL})
+    for container in containers:
+        logging.debug('Removing warm container %s.', container['Id'])
+        docker.remove_container(container['Id'], force=True)
+    return len(containers)
@@ -21,82 +21,142 @@ You may install it from source, or via pip.
 """
 
 import argparse
-from coursera_autograder import commands
 from coursera_autograder import utils
+import importlib
 import logging
 import sys
 
-
-def build_parser():
-    "Build an argparse argument parser to parse the command line."
-
-    parser = argparse.ArgumentParser(
-        description="""Coursera asynchronous grader command-line tool. This tool
-        helps instructional teams as they develop sophisticated assignments.
-        There are a number of subcommands, each with their own help
-        documentation. Feel free to view them by executing `%(prog)s
-        SUB_COMMAND -h`. For example: `%(prog)s ls -h`.""",
-        epilog="""Please file bugs on github at:
-        https://github.com/coursera/coursera_autograder/issues. If you
-        would like to contribute to this tool's development, check us out at:
-        https://github.com/coursera/coursera_autograder""",
-        parents=[utils.docker_client_arg_parser()])
-    parser.add_argument('-c', '--config', help='the configuration file to use')
-
-    utils.add_logging_parser(parser)
-
-    # We have a number of subcommands. These subcommands have their own
-    # subparsers. Each subcommand should set a default value for the 'func'
-    # option. We then call the parsed 'func' function, and execution carries on
-    # from there.
-    subparsers = parser.add_subparsers(dest="-h")
-    subparsers.required = True
-
+# The subcommands, and the modules of coursera_autograder.commands that
+# implement them, in the order they are listed in the help.
+SUBCOMMANDS = [
     # create the parser for the cat command
-    # commands.cat.parser(subparsers)
+    # ('cat', 'cat'),
 
     # create the parser for the configure subcommand. (authentication / etc.)
-    commands.config.parser(subparsers)
+    ('configure', 'config'),
 
     # create the parser for the grade subcommand.
-    commands.grade.parser(subparsers)
+    ('grade', 'grade'),
 
     # create the parser for the inspect command
-    # commands.inspect.parser(subparsers)
+    # ('inspect', 'inspect'),
 
     # create the parser for the ls command
-    # commands.ls.parser(subparsers)
+    # ('ls', 'ls'),
 
     # create the parser for the sanity check command
-    # commands.sanity.parser(subparsers)
+    # ('sanity', 'sanity'),
 
     # create the parser for the version subcommand.
-    # commands.version.parser(subparsers)
+    # ('version', 'version'),
 
     # create the parser for the run command?
 
     # create the parser for the build command?
 
+    # create the parser for the package command.
+    ('package', 'package'),
+
     # create the parser for the upload command.
-    commands.upload.parser(subparsers)
+    ('upload', 'upload'),
 
     # create the parser for the publish command.
-    # commands.publish.parser(subparsers)
+    # ('publish', 'publish'),
 
     # create the parser for the reregister command.
-    # commands.reregister.parser(subparsers)
+    # ('reregister', 'reregister'),
 
     # create the parser for the get_resource_limits command.
-    commands.get_resource_limits.parser(subparsers)
+    ('get_resource_limits', 'get_resource_limits'),
 
     # create the parser for the update_resource_limits command.
-    commands.update_resource_limits.parser(subparsers)
+    ('update_resource_limits', 'update_resource_limits'),
+
+    # create the parser for the recommend_limits command.
+    ('recommend_limits', 'recommend_limits'),
+
+    # create the parser for the validate_feedback command.
+    ('validate_feedback', 'validate_feedback'),
 
     # create the parser for the get_status command.
-    commands.get_status.parser(subparsers)
+    ('get_status', 'get_status'),
 
     # create the parser for the list command.
-    commands.list_graders.parser(subparsers)
+    ('list_graders', 'list_graders'),
+]
+
+
+class _OptionsParser(argparse.ArgumentParser):
+    "An argument parser raising ValueError instead of exiting on errors."
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def add_main_arguments(parser):
+    "Adds the options that precede the subcommand to the parser."
+    parser.add_argument('-c', '--config', help='the configuration file to use')
+    utils.add_logging_parser(parser)
+
+
+def requested_subcommands(argv):
+    """
+    Returns the subcommand named on the command line (as a list), or None if
+    there is none (e.g. for --help), in which case all subcommands are needed.
+
+    The options preceding the subcommand are parsed just like the full parser
+    does, so that their values (e.g. `-c grade`) are not mistaken for the
+    subcommand. If they cannot be parsed, all subcommands are needed to report
+    the error.
+    """
+    parser = _OptionsParser(
+        add_help=False, parents=[utils.docker_client_arg_parser()])
+    add_main_arguments(parser)
+    parser.add_argument('subcommand', nargs='?')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER)
+    try:
+        subcommand = parser.parse_known_args(argv)[0].subcommand
+    except ValueError:
+        return None
+    if subcommand in [name for (name, _) in SUBCOMMANDS]:
+        return [subcommand]
+    return None
+
+
+def build_parser(subcommands=None):
+    """
+    Build an argparse argument parser to parse the command line.
+
+    Only the modules of the given subcommands (all of them by default) are
+    imported, so that running a subcommand does not pay for loading the
+    dependencies of the others.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="""Coursera asynchronous grader command-line tool. This tool
+        helps instructional teams as they develop sophisticated assignments.
+        There are a number of subcommands, each with their own help
+        documentation. Feel free to view them by executing `%(prog)s
+        SUB_COMMAND -h`. For example: `%(prog)s ls -h`.""",
+        epilog="""Please file bugs on github at:
+        https://github.com/coursera/coursera_autograder/issues. If you
+        would like to contribute to this tool's development, check us out at:
+        https://github.com/coursera/coursera_autograder""",
+        parents=[utils.docker_client_arg_parser()])
+    add_main_arguments(parser)
+
+    # We have a number of subcommands. These subcommands have their own
+    # subparsers. Each subcommand should set a default value for the 'func'
+    # option. We then call the parsed 'func' function, and execution carries on
+    # from there.
+    subparsers = parser.add_subparsers(dest="-h")
+    subparsers.required = True
+
+    for name, module_name in SUBCOMMANDS:
+        if subcommands is None or name in subcommands:
+            module = importlib.import_module(
+                'coursera_autograder.commands.' + module_name)
+            module.parser(subparsers)
 
     return parser
 
@@ -104,7 +164,7 @@ def build_parser():
 def main():
     "Boots up the command line tool"
     logging.captureWarnings(True)
-    args = build_parser().parse_args()
+    args = build_parser(requested_subcommands(sys.argv[1:])).parse_args()
     # Configure logging
     args.setup_logging(args)
     # Dispatch into the appropriate subcommand function.
@@ -20,10 +20,9 @@ Coursera's asynchronous grader command line SDK.
 You may install it from source, or via pip.
 """
 
+# docker and requests are imported where they are used, so that commands
+# which do not need them start up quickly.
 import argparse
-from docker import Client
-from docker.utils import kwargs_from_env
-import requests
 import logging
 import sys
 from sys import platform as _platform
@@ -85,6 +84,7 @@ def set_logging_level(args):
 
     if args.silence_urllib3:
         # See: https://urllib3.readthedocs.org/en/latest/security.html
+        import requests
         requests.packages.urllib3.disable_warnings()
 
 
@@ -116,6 +116,9 @@ def docker_client(args):
      - args: The arguments parsed on the command line.
      - returns: a docker-py client
     """
+    from docker import Client
+    from docker.utils import kwargs_from_env
+
     if _platform == 'linux' or _platform == 'linux2':
         # linux
         if "docker_url" in args:
@@ -150,6 +153,27 @@ def docker_client(args):
         sys.exit(2)
 
 
+def api_session(auth=None, pool_size=10):
+    """
+    Creates a requests session for talking to Coursera's APIs. Connections are
+    kept alive and pooled, so that a series of calls (possibly made from
+    several threads) only pays for the TCP and TLS handshakes once per
+    connection.
+
+     - auth: the authorizer to attach to every request made with the session.
+     - pool_size: the maximum number of connections kept open per host.
+    """
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.auth = auth
+    return session
+
+
 def check_int_range(value, lower=None, upper=None):
     try:
         value = int(value)
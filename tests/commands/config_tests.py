@@ -35,3 +35,11 @@ def test_config_help_message(exit):
             parser = main.build_parser()
 
     config.sys.exit.assert_called_with(1)
+
+
+def test_config_parsing_token_agent():
+    parser = main.build_parser()
+    args = parser.parse_args(
+        'configure token-agent --token-agent-socket /tmp/agent.sock'.split())
+    assert args.func == config.run_token_agent
+    assert args.token_agent_socket == '/tmp/agent.sock'
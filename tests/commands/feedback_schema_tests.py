@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import feedback_schema
+from os import path
+import os
+import shutil
+import tempfile
+
+
+def test_valid_feedback():
+    for document in [
+            {'fractionalScore': 0.5, 'feedback': 'Half way there.'},
+            {'fractionalScore': 1, 'feedback': ''},
+            {'fractionalScore': 0, 'isCorrect': False, 'feedback': 'No'},
+            {'isCorrect': True, 'feedback': '<b>Yes</b>',
+             'feedbackType': 'HTML'},
+            {'isCorrect': True, 'feedback': '**Yes**',
+             'feedbackType': 'MARKDOWN', 'extra': 'ignored'}]:
+        assert feedback_schema.validate_feedback(document) == [], document
+
+
+def test_bad_scores():
+    validate = feedback_schema.validate_feedback
+    for (score, error) in [
+            (False, "Field 'fractionalScore' must be a decimal."),
+            ('0.3', "Field 'fractionalScore' must be a decimal."),
+            (1.1, "Field 'fractionalScore' must be <= 1."),
+            (-1.1, "Field 'fractionalScore' must be >= 0.")]:
+        assert validate({'fractionalScore': score, 'feedback': ''}) == [
+            error]
+    assert validate({'isCorrect': 'true', 'feedback': ''}) == [
+        "Field 'isCorrect' is not a boolean value."]
+
+
+def test_grade_checks_unchanged():
+    # Only what `grade` always checked: isCorrect is ignored alongside
+    # fractionalScore, and any feedback will do.
+    assert feedback_schema.validate_feedback({
+        'fractionalScore': 1, 'isCorrect': 'yes',
+        'feedback': {'html': 'x' * 1000000}, 'feedbackType': 'PDF'}) == []
+
+
+def test_reports_all_errors():
+    assert feedback_schema.validate_feedback({}) == [
+        "Required field 'fractionalScore' is missing.",
+        "Field 'feedback' not present in parsed output."]
+    assert feedback_schema.validate_feedback([1]) == [
+        "The output must be a JSON object."]
+
+    validate = feedback_schema.compile_schema(
+        feedback_schema.STRICT_FEEDBACK_SCHEMA)
+    assert validate({'fractionalScore': 2, 'isCorrect': 1,
+                     'feedbackType': 'PDF'}) == [
+        "Field 'fractionalScore' must be <= 1.",
+        "Field 'isCorrect' is not a boolean value.",
+        "Field 'feedback' not present in parsed output.",
+        "Field 'feedbackType' must be one of HTML, MARKDOWN."]
+
+
+def test_feedback_size():
+    validate = feedback_schema.compile_schema({'fields': [
+        ('feedback', {'type': 'string', 'maxBytes': 8})]})
+
+    assert validate({'feedback': 'ab'}) == []
+    assert validate({'feedback': u'é' * 4}) == []
+    assert validate({'feedback': u'é' * 5}) == [
+        "Field 'feedback' is 10 bytes long, more than the limit of 8."]
+
+
+def test_strict():
+    validate = feedback_schema.compile_schema(
+        feedback_schema.STRICT_FEEDBACK_SCHEMA)
+
+    assert validate({'fractionalscore': 1, 'feedback': ''}) == [
+        "Required field 'fractionalScore' is missing.",
+        "Unknown field 'fractionalscore'."]
+    assert validate({'fractionalScore': float('nan'), 'feedback': 1}) == [
+        "Field 'fractionalScore' must be a decimal.",
+        "Field 'feedback' must be a string."]
+
+
+def test_compile_schema_rejects_unknown_types():
+    try:
+        feedback_schema.compile_schema(
+            {'fields': [('score', {'type': 'integer'})]})
+    except ValueError:
+        pass
+    else:
+        assert False, 'The unknown type should have been rejected'
+
+
+def test_validate_feedback_file():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        file_name = path.join(dst_dir, 'feedback.json')
+        with open(file_name, 'w') as f:
+            f.write('{"isCorrect": false, "feedback": "garbage')
+        assert feedback_schema.validate_feedback_file(file_name) == [
+            "The output was not a valid JSON document."]
+
+        with open(file_name, 'w') as f:
+            f.write('{"isCorrect": false, "feedback": "Try again"}')
+        assert feedback_schema.validate_feedback_file(file_name) == []
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_find_feedback_files():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        for name in ['b', 'a', 'a/nested', 'c']:
+            os.makedirs(path.join(dst_dir, name))
+        for name in ['b', 'a', 'a/nested']:
+            open(path.join(dst_dir, name, 'feedback.json'), 'w').close()
+        other = path.join(dst_dir, 'c', 'other.json')
+
+        assert feedback_schema.find_feedback_files([dst_dir, other]) == [
+            path.join(dst_dir, 'a', 'feedback.json'),
+            path.join(dst_dir, 'a', 'nested', 'feedback.json'),
+            path.join(dst_dir, 'b', 'feedback.json'),
+            other]
+    finally:
+        shutil.rmtree(dst_dir)
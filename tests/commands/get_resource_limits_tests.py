@@ -147,3 +147,31 @@ def test_get_resource_limits_ok_default_values(mock_oauth, mock_post):
         exit_val = get_resource_limits.command_get_resource_limits(args)
 
     assert exit_val == 0
+
+
+@patch('coursera_autograder.commands.get_resource_limits.oauth2')
+@patch.object(requests.Session, 'post')
+def test_get_resource_limits_jsonl(mock_post, mock_oauth):
+    response = MockResponse(200, 'endpoint', 'OK', {'reservedMemory': 8192})
+    response.json = MagicMock(return_value=response.jsonObj)
+    mock_post.return_value = response
+    args = argparse.Namespace()
+    args.course = 'COURSE_ID'
+    args.item = 'ITEM_ID'
+    args.part = 'PART_ID'
+    args.getGraderResourceLimits_endpoint = 'endpoint'
+    args.format = 'jsonl'
+
+    with patch('sys.stdout') as mock_stdout:
+        exit_val = get_resource_limits.command_get_resource_limits(args)
+
+    assert exit_val == 0
+    assert response.json.call_count == 1
+    assert json.loads(mock_stdout.write.call_args[0][0]) == {
+        'course': 'COURSE_ID',
+        'item': 'ITEM_ID',
+        'part': 'PART_ID',
+        'reservedCpu': None,
+        'reservedMemory': 8192,
+        'wallClockTimeout': None,
+    }
@@ -119,3 +119,155 @@ def test_get_status_ok(mock_oauth, mock_post):
         exit_val = get_status.command_get_status(args)
 
     assert exit_val == 0
+
+
+def test_get_status_parsing_watch():
+    parser = main.build_parser()
+
+    args = parser.parse_args(
+        'get_status COURSE_ID GRADER_1 GRADER_2 --watch --deadline 60 '
+        '--pending-status QUEUED'.split())
+    assert args.graderId == 'GRADER_1'
+    assert args.additional_grader_ids == ['GRADER_2']
+    assert args.watch
+    assert args.deadline == 60
+    assert args.pending_status == ['QUEUED']
+
+
+def watch_args(deadline=60):
+    args = argparse.Namespace()
+    args.course = 'COURSE_ID'
+    args.graderId = 'GRADER_1'
+    args.additional_grader_ids = ['GRADER_2']
+    args.getGraderStatus_endpoint = 'endpoint/'
+    args.watch = True
+    args.poll_interval = 1
+    args.poll_max_interval = 4
+    args.deadline = deadline
+    args.pending_status = None
+    args.success_status = 'COMPLETED'
+    args.format = 'jsonl'
+    return args
+
+
+def status_sequence(statuses):
+    "Mocks Session.get, returning the next status of each grader."
+    def get(url):
+        grader_id = url.split('~')[-1]
+        status = statuses[grader_id].pop(0)
+        return MockResponse(200, url, 'OK',
+                            {'elements': [{'status': status}]})
+    return get
+
+
+@patch('coursera_autograder.commands.get_status.time.sleep')
+@patch('coursera_autograder.commands.get_status.oauth2')
+@patch.object(requests.Session, 'get')
+def test_get_status_watch(mock_get, mock_oauth, mock_sleep):
+    mock_get.side_effect = status_sequence({
+        'GRADER_1': ['PENDING', 'PENDING', 'COMPLETED'],
+        'GRADER_2': ['PENDING', 'IN_PROGRESS', 'IN_PROGRESS', 'COMPLETED'],
+    })
+
+    with patch('sys.stdout') as mock_stdout:
+        exit_val = get_status.command_get_status(watch_args())
+
+    assert exit_val == 0
+    changes = [(row['graderId'], row['status']) for row in
+               (json.loads(call[0][0])
+                for call in mock_stdout.write.call_args_list)]
+    assert changes == [
+        ('GRADER_1', 'PENDING'),
+        ('GRADER_2', 'PENDING'),
+        ('GRADER_2', 'IN_PROGRESS'),
+        ('GRADER_1', 'COMPLETED'),
+        ('GRADER_2', 'COMPLETED'),
+    ]
+    waits = [call[0][0] for call in mock_sleep.call_args_list]
+    assert len(waits) == 3
+    assert 0.5 <= waits[0] <= 1 and 1 <= waits[1] <= 2 and 2 <= waits[2] <= 4
+
+
+@patch('coursera_autograder.commands.get_status.time.sleep')
+@patch('coursera_autograder.commands.get_status.oauth2')
+@patch.object(requests.Session, 'get')
+def test_get_status_watch_failed_grader(mock_get, mock_oauth, mock_sleep):
+    mock_get.side_effect = status_sequence({
+        'GRADER_1': ['FAILED'],
+        'GRADER_2': ['COMPLETED'],
+    })
+
+    with patch('sys.stdout'):
+        assert get_status.command_get_status(watch_args()) == 1
+    assert not mock_sleep.called
+
+
+@patch('coursera_autograder.commands.get_status.oauth2')
+@patch.object(requests.Session, 'get')
+def test_get_status_watch_deadline(mock_get, mock_oauth):
+    mock_get.side_effect = status_sequence({
+        'GRADER_1': ['PENDING'],
+        'GRADER_2': ['COMPLETED'],
+    })
+
+    with patch('sys.stdout'), LogCapture():
+        assert get_status.command_get_status(watch_args(deadline=0)) == 2
+
+
+@patch('coursera_autograder.commands.get_status.time.sleep')
+@patch('coursera_autograder.commands.get_status.oauth2')
+@patch.object(requests.Session, 'get')
+def test_get_status_watch_retries_unavailable_status(
+        mock_get, mock_oauth, mock_sleep):
+    def status(status):
+        return MockResponse(200, 'endpoint', 'OK',
+                            {'elements': [{'status': status}]})
+    # Each round polls GRADER_1, then GRADER_2 (until it is done).
+    responses = iter([
+        status('PENDING'), MockResponse(503, 'endpoint', 'unavailable'),
+        requests.exceptions.ConnectionError('reset'),
+        MockResponse(200, 'endpoint', 'OK', {'elements': []}),
+        MockResponse(429, 'endpoint', 'slow down'), status('COMPLETED'),
+        status('COMPLETED'),
+    ])
+
+    def get(url):
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    mock_get.side_effect = get
+
+    with patch('sys.stdout'), LogCapture():
+        assert get_status.command_get_status(watch_args()) == 0
+    assert mock_sleep.call_count == 3
+
+
+@patch('coursera_autograder.commands.get_status.time.sleep')
+@patch('coursera_autograder.commands.get_status.oauth2')
+@patch.object(requests.Session, 'get')
+def test_get_status_watch_gives_up_after_retries(
+        mock_get, mock_oauth, mock_sleep):
+    mock_get.return_value = MockResponse(500, 'endpoint', 'oops')
+    args = watch_args()
+    args.additional_grader_ids = []
+    args.status_retries = 2
+
+    with patch('sys.stdout'), LogCapture() as logs:
+        assert get_status.command_get_status(args) == 1
+    assert mock_get.call_count == 3
+    assert 'Giving up on grader GRADER_1' in logs.records[-1].getMessage()
+
+
+@patch('coursera_autograder.commands.get_status.oauth2')
+@patch.object(requests.Session, 'get',
+              return_value=MockResponse(200, 'endpoint', 'OK', {}))
+def test_get_status_malformed_response(mock_oauth, mock_post):
+    args = argparse.Namespace()
+    args.course = 'COURSE_ID'
+    args.graderId = 'GRADER_ID'
+    args.getGraderStatus_endpoint = 'endpoint'
+
+    with LogCapture() as logs:
+        assert get_status.command_get_status(args) == 1
+    assert 'Unexpected response' in logs.records[-1].getMessage()
@@ -18,11 +18,17 @@ import argparse
 import docker
 from coursera_autograder import main
 from coursera_autograder.commands import grade
+from mock import ANY
 from mock import MagicMock
 from mock import patch
 from testfixtures import LogCapture
 from os import path, remove
+import io
 import json
+import os
+import shutil
+import tarfile
+import tempfile
 
 
 def test_grade_local_parsing():
@@ -571,4 +577,454 @@ def test_command_local_grade_simple(
     run_container.assert_called_with(
         docker_mock,
         docker_mock.create_container.return_value,
-        args)
+        args,
+        on_result=None,
+        timer=ANY)
+
+
+def test_grade_batch_parsing():
+    parser = main.build_parser()
+    args = parser.parse_args(
+        ('grade batch --workers 3 myContainerTag /tmp ' +
+         '{"partId":"1a2b3"}').split())
+    assert args.func == grade.command_grade_batch
+    assert args.containerTag == 'myContainerTag'
+    assert args.submissions == '/tmp'
+    assert args.workers == 3
+    assert not args.no_rm
+
+
+def test_find_submissions_directory():
+    root = tempfile.mkdtemp()
+    try:
+        for name in ['b', 'a']:
+            os.mkdir(path.join(root, name))
+        open(path.join(root, 'not-a-submission.txt'), 'w').close()
+        submissions = grade.find_submissions(root, {'partId': 'x'})
+        assert submissions == [
+            ('a', path.join(root, 'a'), {'partId': 'x'}),
+            ('b', path.join(root, 'b'), {'partId': 'x'}),
+        ]
+    finally:
+        shutil.rmtree(root)
+
+
+def test_find_submissions_manifest():
+    root = tempfile.mkdtemp()
+    try:
+        os.makedirs(path.join(root, 'one', 'sub'))
+        os.makedirs(path.join(root, 'two', 'sub'))
+        manifest = path.join(root, 'manifest.txt')
+        with open(manifest, 'w') as f:
+            f.write('# comment\n')
+            f.write('one/sub\n')
+            f.write('two/sub {"partId": "override"}\n')
+        submissions = grade.find_submissions(manifest, {'partId': 'x'})
+        assert submissions == [
+            ('sub', path.join(root, 'one', 'sub'), {'partId': 'x'}),
+            ('sub-2', path.join(root, 'two', 'sub'),
+             {'partId': 'override'}),
+        ]
+    finally:
+        shutil.rmtree(root)
+
+
+@patch('coursera_autograder.commands.grade.get_feedback')
+@patch('coursera_autograder.commands.grade.utils')
+def test_command_grade_batch(utils, get_feedback):
+    src_dir = tempfile.mkdtemp()
+    dst_dir = tempfile.mkdtemp()
+    try:
+        for name in ['good', 'bad']:
+            os.mkdir(path.join(src_dir, name))
+
+        def fake_get_feedback(docker, container, file_name, dst, **kwargs):
+            data = {'fractionalScore': 1.0, 'feedback': 'Nice!'}
+            if dst.endswith('bad'):
+                data = {'fractionalScore': 2.0, 'feedback': 'Oops'}
+            with open(path.join(dst, file_name), 'w') as f:
+                json.dump(data, f)
+        get_feedback.side_effect = fake_get_feedback
+
+        docker_mock = MagicMock()
+        docker_mock.wait.return_value = 0
+        docker_mock.logs.return_value = b'output'
+        utils.docker_client.return_value = docker_mock
+
+        args = argparse.Namespace()
+        args.containerTag = 'myimageId'
+        args.envVar = '{"partId":"1a2b3"}'
+        args.mem_limit = 1024
+        args.timeout = 300
+        args.no_rm = False
+        args.quiet = 1
+        args.workers = 2
+        args.submissions = src_dir
+        args.dst_dir = dst_dir
+
+        with LogCapture():
+            exit_val = grade.command_grade_batch(args)
+
+        assert exit_val == 1
+        assert docker_mock.create_container.call_count == 2
+        assert docker_mock.remove_container.call_count == 2
+        assert path.isfile(path.join(dst_dir, 'good', 'feedback.json'))
+        assert path.isfile(path.join(dst_dir, 'good', 'stdout.log'))
+        with open(path.join(dst_dir, 'results.json')) as f:
+            results = json.load(f)
+        assert [r['submission'] for r in results] == ['bad', 'good']
+        assert results[0]['errors'] == [
+            "Field 'fractionalScore' must be <= 1."]
+        assert results[1]['errors'] == []
+    finally:
+        shutil.rmtree(src_dir)
+        shutil.rmtree(dst_dir)
+
+
+def test_grade_local_parsing_warm():
+    parser = main.build_parser()
+    args = parser.parse_args(
+        'grade local --warm myContainerTag /tmp {"partId":"1a2b3"}'.split())
+    assert args.warm
+
+
+@patch('coursera_autograder.commands.grade.sys')
+@patch('coursera_autograder.commands.grade.get_feedback')
+@patch('coursera_autograder.commands.grade.utils')
+@patch('coursera_autograder.commands.grade.warm_pool')
+def test_command_local_grade_warm(warm_pool, utils, get_feedback, sys):
+    args = argparse.Namespace()
+    args.dir = '/tmp'
+    args.dst_dir = tempfile.mkdtemp()
+    args.containerTag = 'myimageId'
+    args.envVar = '{"partId":"1a2b3"}'
+    args.mem_limit = 1024
+    args.timeout = 300
+    args.warm = True
+    try:
+        with open(path.join(args.dst_dir, 'feedback.json'), 'w') as f:
+            json.dump({'fractionalScore': 1, 'feedback': 'Great'}, f)
+        pool = warm_pool.WarmContainerPool.return_value
+        pool.acquire.return_value = 'warmContainer'
+        pool.run.return_value = 0
+        pool.logs.return_value = (b'out', b'err')
+
+        with LogCapture():
+            grade.command_grade_local(args)
+
+        pool.run.assert_called_with(
+            'warmContainer', '/tmp', {'partId': '1a2b3'}, 300)
+        pool.release.assert_called_with('warmContainer')
+        assert not utils.docker_client.return_value.create_container.called
+        assert not grade.sys.exit.called
+    finally:
+        shutil.rmtree(args.dst_dir)
+
+
+def make_archive(files):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return archive.getvalue()
+
+
+def test_get_feedback_streams_chunks():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        archive = make_archive([('feedback.json', b'{"feedback": "hi"}')])
+        docker_mock = MagicMock()
+        # docker may hand back an iterable of chunks rather than a file.
+        docker_mock.get_archive.return_value = (
+            (archive[i:i + 100] for i in range(0, len(archive), 100)), {})
+        grade.get_feedback(docker_mock, 'container', 'feedback.json', dst_dir)
+        docker_mock.get_archive.assert_called_with(
+            'container', '/shared/feedback.json')
+        with open(path.join(dst_dir, 'feedback.json'), 'rb') as f:
+            assert f.read() == b'{"feedback": "hi"}'
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_get_feedback_too_large():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        archive = make_archive([('feedback.json', b'x' * 2048)])
+        docker_mock = MagicMock()
+        docker_mock.get_archive.return_value = (io.BytesIO(archive), {})
+        try:
+            grade.get_feedback(docker_mock, 'container', 'feedback.json',
+                               dst_dir, max_size=1024)
+        except grade.OutputTooLarge:
+            pass
+        else:
+            assert False, 'get_feedback should have raised OutputTooLarge'
+        assert not path.exists(path.join(dst_dir, 'feedback.json'))
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_get_outputs_glob():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        archive = make_archive([
+            ('shared/feedback.json', b'{}'),
+            ('shared/report.html', b'<p>hi</p>'),
+            ('shared/artifacts/plot.png', b'png'),
+            ('shared/submission/solution.py', b'print(1)'),
+            ('shared/../escape.html', b'nope'),
+            ('shared/..report.html', b'<p>dots</p>'),
+        ])
+        docker_mock = MagicMock()
+        docker_mock.get_archive.return_value = (io.BytesIO(archive), {})
+        with LogCapture():
+            written = grade.get_outputs(
+                docker_mock, 'container', ['*.html', 'artifacts/*'], dst_dir)
+        docker_mock.get_archive.assert_called_with('container', '/shared')
+        assert sorted(written) == [
+            path.join(dst_dir, '..report.html'),
+            path.join(dst_dir, 'artifacts', 'plot.png'),
+            path.join(dst_dir, 'report.html'),
+        ]
+        assert not path.exists(path.join(dst_dir, '..', 'escape.html'))
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+@patch('coursera_autograder.commands.grade.sys')
+@patch('coursera_autograder.commands.grade.utils')
+@patch('coursera_autograder.commands.grade.run_container')
+def test_command_local_grade_cached(run_container, utils, sys):
+    submission_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    dst_dir = tempfile.mkdtemp()
+    try:
+        args = argparse.Namespace()
+        args.dir = submission_dir
+        args.dst_dir = dst_dir
+        args.containerTag = 'myimageId'
+        args.envVar = '{"partId":"1a2b3"}'
+        args.mem_limit = 1024
+        args.cache_dir = cache_dir
+        args.cache_max_size = 10
+        args.no_cache = False
+
+        docker_mock = MagicMock()
+        docker_mock.inspect_image.return_value = {'Id': 'sha256:abc'}
+        utils.docker_client.return_value = docker_mock
+
+        # The first run is a cache miss, and stores its result.
+        grade.command_grade_local(args)
+        on_result = run_container.call_args[1]['on_result']
+        feedback = path.join(dst_dir, 'feedback.json')
+        with open(feedback, 'w') as f:
+            json.dump({'fractionalScore': 1, 'feedback': 'Yay'}, f)
+        on_result([feedback], 0, 'grader output', 'grader errors')
+        remove(feedback)
+
+        # The second is served from the cache.
+        run_container.reset_mock()
+        with LogCapture():
+            grade.command_grade_local(args)
+        assert not run_container.called
+        assert docker_mock.create_container.call_count == 1
+        assert path.isfile(feedback)
+        assert not grade.sys.exit.called
+
+        # Unless the cache is disabled.
+        args.no_cache = True
+        grade.command_grade_local(args)
+        assert run_container.called
+    finally:
+        for directory in [submission_dir, cache_dir, dst_dir]:
+            shutil.rmtree(directory)
+
+
+def test_grade_local_parsing_timings():
+    parser = main.build_parser()
+    args = parser.parse_args(
+        'grade local --timings text myContainerTag /tmp {}'.split())
+    assert args.timings == 'text'
+    args = parser.parse_args(
+        'grade batch --timings json myContainerTag /tmp {}'.split())
+    assert args.timings == 'json'
+
+
+@patch('coursera_autograder.commands.grade.get_feedback')
+def test_run_container_times_phases(get_feedback):
+    dst_dir = tempfile.mkdtemp()
+    try:
+        with open(path.join(dst_dir, 'feedback.json'), 'w') as f:
+            json.dump({'fractionalScore': 1.0, 'feedback': 'Nice!'}, f)
+        docker_mock = MagicMock()
+        docker_mock.wait.return_value = 0
+        docker_mock.logs.return_value = b'output'
+        args = argparse.Namespace(dst_dir=dst_dir, timeout=300, no_rm=False)
+        timer = grade.timings.PhaseTimings()
+
+        with LogCapture():
+            grade.run_container(docker_mock, {'Id': 'container'}, args,
+                                timer=timer)
+
+        assert list(timer.as_dict()['phases']) == [
+            'start', 'grader', 'get_archive', 'logs', 'validate', 'remove']
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+@patch('coursera_autograder.commands.grade.grade_local')
+def test_command_local_grade_writes_timings_on_failure(grade_local):
+    def fail(args, timer):
+        timer.add('create', 0.5)
+        raise SystemExit(1)
+    grade_local.side_effect = fail
+    args = argparse.Namespace(timings='json')
+
+    with patch('coursera_autograder.commands.timings.sys') as timings_sys:
+        try:
+            grade.command_grade_local(args)
+            assert False, 'The failure was not passed on.'
+        except SystemExit:
+            pass
+
+    written = timings_sys.stderr.write.call_args[0][0]
+    assert json.loads(written)['phases'] == {'create': 0.5}
+
+
+@patch('coursera_autograder.commands.grade.get_feedback')
+def test_run_container_records_resource_usage(get_feedback):
+    dst_dir = tempfile.mkdtemp()
+    try:
+        feedback_file = path.join(dst_dir, 'feedback.json')
+        with open(feedback_file, 'w') as f:
+            json.dump({'fractionalScore': 1.0, 'feedback': 'Nice!'}, f)
+        get_feedback.return_value = feedback_file
+        docker_mock = MagicMock()
+        docker_mock.wait.return_value = 0
+        docker_mock.logs.return_value = b'output'
+        docker_mock.inspect_container.return_value = {
+            'Id': 'container', 'State': {'Pid': 0, 'OOMKilled': False}}
+        docker_mock.stats.return_value = iter([])
+        args = argparse.Namespace(dst_dir=dst_dir, timeout=300, no_rm=False,
+                                  mem_limit=1024, no_resource_stats=False)
+        on_result = MagicMock()
+        timer = grade.timings.PhaseTimings()
+
+        with LogCapture():
+            grade.run_container(docker_mock, {'Id': 'container'}, args,
+                                on_result=on_result, timer=timer)
+
+        assert 'resources' in timer.as_dict()['phases']
+        with open(path.join(dst_dir, 'resources.json')) as f:
+            report = json.load(f)
+        assert report['memoryLimitBytes'] == 1024 * 1024 * 1024
+        assert report['oomKilled'] is False
+        outputs = on_result.call_args[0][0]
+        assert outputs == [feedback_file, path.join(dst_dir,
+                                                    'resources.json')]
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_create_grader_host_config_cpus():
+    docker_mock = MagicMock()
+    args = argparse.Namespace(mem_limit=2048, cpus=1.5)
+
+    grade.create_grader_host_config(docker_mock, args)
+
+    docker_mock.create_host_config.assert_called_with(
+        network_mode='none', mem_limit='2g', memswap_limit='2g',
+        cpu_period=100000, cpu_quota=150000)
+
+
+def test_grade_local_parsing_cpus():
+    parser = main.build_parser()
+    args = parser.parse_args(
+        'grade local --cpus 2 --cpuset 0-1,4 myContainerTag /tmp {}'.split())
+    assert args.cpus == 2.0
+    assert args.cpuset == '0-1,4'
+    assert grade.cpuset_size(args.cpuset) == 3
+    args = parser.parse_args('grade local myContainerTag /tmp {}'.split())
+    assert args.cpus is None
+    assert args.cpuset is None
+    for flags in ['--cpus 0', '--cpus two', '--cpuset 0-', '--cpuset a']:
+        try:
+            with patch('sys.stderr'):
+                parser.parse_args(
+                    ('grade local %s myContainerTag /tmp {}' % flags).split())
+        except SystemExit:
+            pass
+        else:
+            assert False, '%s should have been rejected' % flags
+
+
+def test_create_grader_host_config_cpuset():
+    docker_mock = MagicMock()
+    args = argparse.Namespace(mem_limit=1024, cpus=None, cpuset='0-1')
+
+    grade.create_grader_host_config(docker_mock, args)
+
+    docker_mock.create_host_config.assert_called_with(
+        network_mode='none', mem_limit='1g', memswap_limit='1g',
+        cpuset_cpus='0-1')
+
+
+def test_result_cache_key_includes_limits():
+    cache = MagicMock()
+    args = argparse.Namespace(mem_limit=1024, cpus=2.0, cpuset='0-1',
+                              timeout=300)
+
+    grade.result_cache_key(cache, args, 'image', '/tmp', {})
+
+    cache.key.assert_called_with(
+        'image', '/tmp', {}, mem_limit=1024, cpus=2.0, cpuset='0-1',
+        timeout=300, extract=[], max_output_size=None)
+
+
+@patch('coursera_autograder.commands.grade.os.cpu_count')
+def test_check_cpu_limits(cpu_count):
+    cpu_count.return_value = 2
+    with LogCapture() as logs:
+        grade.check_cpu_limits(argparse.Namespace(cpus=1.0, cpuset='0'))
+    logs.check()
+    with LogCapture() as logs:
+        grade.check_cpu_limits(argparse.Namespace(cpus=4.0, cpuset='0-1'))
+    assert len(logs.records) == 2
+
+
+@patch('coursera_autograder.commands.grade.get_feedback')
+def test_run_container_streams_logs(get_feedback):
+    dst_dir = tempfile.mkdtemp()
+    try:
+        feedback_file = path.join(dst_dir, 'feedback.json')
+        with open(feedback_file, 'w') as f:
+            json.dump({'fractionalScore': 1.0, 'feedback': 'Nice!'}, f)
+        get_feedback.return_value = feedback_file
+        docker_mock = MagicMock()
+        docker_mock.wait.return_value = 0
+
+        def logs(container, stdout=True, stderr=True, stream=False,
+                 follow=None):
+            assert stream and follow, 'Logs should not be fetched again.'
+            return iter([b'streamed output\n' if stdout else b'errors\n'])
+        docker_mock.logs.side_effect = logs
+        args = argparse.Namespace(dst_dir=dst_dir, timeout=300, no_rm=False,
+                                  no_stream_logs=False, max_log_size=1)
+        on_result = MagicMock()
+
+        stdout = io.StringIO()
+        with LogCapture(), patch('sys.stdout', stdout):
+            grade.run_container(docker_mock, {'Id': 'container'}, args,
+                                on_result=on_result)
+
+        # Shown once, as it was written.
+        assert stdout.getvalue().count('streamed output') == 1
+        assert stdout.getvalue().count('errors') == 1
+        with open(path.join(dst_dir, 'stdout.log'), 'rb') as f:
+            assert f.read() == b'streamed output\n'
+        assert on_result.call_args[0][2:] == (b'streamed output\n',
+                                              b'errors\n')
+    finally:
+        shutil.rmtree(dst_dir)
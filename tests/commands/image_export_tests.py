@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import image_export
+from mock import MagicMock
+import io
+import os
+import zipfile
+
+
+class Unseekable(io.RawIOBase):
+    "A write-only stream, like a socket or a pipe."
+
+    def __init__(self):
+        self.data = b''
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += bytes(data)
+        return len(data)
+
+
+def fake_docker(image_data):
+    docker = MagicMock()
+    docker.get_image.side_effect = lambda tag: io.BytesIO(image_data)
+    return docker
+
+
+def test_image_file_name():
+    assert image_export.image_file_name('registry/grader:1.0') == \
+        'registry_grader_1.0.zip'
+
+
+def test_write_image_zip_to_unseekable_stream():
+    image_data = os.urandom(1024) * 64
+    out = Unseekable()
+    image_export.write_image_zip(fake_docker(image_data), 'grader:1', out)
+    with zipfile.ZipFile(io.BytesIO(out.data)) as archive:
+        assert archive.namelist() == ['grader_1.tar']
+        assert archive.read('grader_1.tar') == image_data
+        assert archive.infolist()[0].compress_type == zipfile.ZIP_DEFLATED
+    assert len(out.data) < len(image_data)
+
+
+def test_image_zip_stream():
+    image_data = os.urandom(1024) * 4096
+    stream = image_export.ImageZipStream(fake_docker(image_data), 'grader',
+                                         max_pending=2)
+    data = b''
+    for chunk in iter(lambda: stream.read(65536), b''):
+        data += chunk
+    stream.close()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read('grader.tar') == image_data
+
+
+def test_image_zip_stream_raises_export_errors():
+    docker = MagicMock()
+    docker.get_image.side_effect = Exception('No such image: grader')
+    stream = image_export.ImageZipStream(docker, 'grader')
+    try:
+        stream.read()
+    except image_export.ExportError as e:
+        assert 'No such image' in str(e)
+    else:
+        assert False, 'the export error should have been raised'
+
+
+def test_closing_image_zip_stream_stops_export():
+    stream = image_export.ImageZipStream(
+        fake_docker(os.urandom(1024 * 1024)), 'grader', max_pending=1)
+    stream.read(10)
+    stream.close()
+    stream._thread.join(5)
+    assert not stream._thread.is_alive()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import layer_index
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+
+def write_image_zip(zip_path, layers):
+    '''
+    Writes an image zip file laid out like the output of `docker save`, with
+    layers given as a list of (digest, contents) pairs.
+    '''
+    tar_data = io.BytesIO()
+    with tarfile.open(fileobj=tar_data, mode='w') as image:
+        def add(name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            image.addfile(info, io.BytesIO(data))
+        for (i, (_, contents)) in enumerate(layers):
+            add('layer%d/VERSION' % i, b'1.0')
+            add('layer%d/layer.tar' % i, contents)
+        add('config.json', json.dumps({'rootfs': {
+            'type': 'layers',
+            'diff_ids': [digest for (digest, _) in layers],
+        }}).encode('utf-8'))
+        add('manifest.json', json.dumps([{
+            'Config': 'config.json',
+            'RepoTags': ['grader:latest'],
+            'Layers': ['layer%d/layer.tar' % i for i in range(len(layers))],
+        }]).encode('utf-8'))
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        archive.writestr('grader.tar', tar_data.getvalue())
+
+
+def image_zip(tmp_dir):
+    "Writes a two layer image zip file to tmp_dir, returning its path."
+    zip_path = os.path.join(tmp_dir, 'grader.zip')
+    write_image_zip(zip_path, [('sha256:base', b'b' * 1000),
+                               ('sha256:top', b't' * 10)])
+    return zip_path
+
+
+def test_read_image_layers():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        assert layer_index.read_image_layers(image_zip(tmp_dir)) == [
+            {'digest': 'sha256:base', 'path': 'layer0/layer.tar',
+             'size': 1000},
+            {'digest': 'sha256:top', 'path': 'layer1/layer.tar', 'size': 10},
+        ]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_read_layers_of_other_zip_file():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        zip_path = os.path.join(tmp_dir, 'grader.zip')
+        with zipfile.ZipFile(zip_path, 'w') as archive:
+            archive.writestr('grader.tar', b'')
+        try:
+            layer_index.read_image_layers(zip_path)
+        except layer_index.LayerError:
+            pass
+        else:
+            assert False, 'the zip file does not hold an image'
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_record_layers():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        index = layer_index.LayerIndex(
+            os.path.join(tmp_dir, 'index', 'layer_index.json'))
+        layers = layer_index.read_image_layers(image_zip(tmp_dir))
+        index.record(layers[:1], 'COURSE', 'GRADER_1')
+        index.record(layers, 'OTHER_COURSE', 'GRADER_2')
+
+        recorded = index.load()['layers']
+        assert sorted(recorded) == ['sha256:base', 'sha256:top']
+        assert recorded['sha256:base']['size'] == 1000
+        assert [(upload['course'], upload['graderId'])
+                for upload in recorded['sha256:base']['uploads']] == [
+            ('COURSE', 'GRADER_1'), ('OTHER_COURSE', 'GRADER_2')]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_uploads_per_layer_are_bounded():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        index = layer_index.LayerIndex(
+            os.path.join(tmp_dir, 'layer_index.json'))
+        layers = layer_index.read_image_layers(image_zip(tmp_dir))
+        for i in range(layer_index.MAX_UPLOADS_PER_LAYER + 5):
+            index.record(layers, 'COURSE', 'GRADER_%d' % i)
+
+        uploads = index.load()['layers']['sha256:base']['uploads']
+        assert len(uploads) == layer_index.MAX_UPLOADS_PER_LAYER
+        assert uploads[-1]['graderId'] == 'GRADER_14'
+    finally:
+        shutil.rmtree(tmp_dir)
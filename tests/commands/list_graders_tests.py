@@ -110,3 +110,83 @@ def test_list_graders_ok(mock_oauth, mock_get):
         exit_val = list_graders.command_list_graders(args)
 
     assert exit_val == 0
+
+
+def test_list_graders_parsing_many_courses():
+    parser = main.build_parser()
+
+    args = parser.parse_args(
+        'list_graders COURSE_1 COURSE_2 COURSE_3 --workers 2'.split())
+    assert args.course == 'COURSE_1'
+    assert args.additional_courses == ['COURSE_2', 'COURSE_3']
+    assert args.workers == 2
+
+
+@patch('coursera_autograder.commands.list_graders.sys.stdin')
+def test_course_ids_from_stdin(mock_stdin):
+    mock_stdin.read.return_value = '# nightly audit\nCOURSE_2\n\nCOURSE_1\n'
+    args = argparse.Namespace(
+        course='COURSE_1', additional_courses=['COURSE_3'], courses_file='-')
+
+    assert list_graders.course_ids(args) == [
+        'COURSE_1', 'COURSE_3', 'COURSE_2']
+
+
+def mock_course_get(url):
+    course = url.split('=')[-1]
+    if course == 'MISSING':
+        return MockResponse(404, url, 'not found!')
+    return MockResponse(200, url, 'OK', {'elements': [
+        {'id': '%s~grader-%s' % (course, course), 'filename': 'grader.zip'},
+    ]})
+
+
+@patch('coursera_autograder.commands.list_graders.oauth2')
+@patch.object(requests.Session, 'get', side_effect=mock_course_get)
+def test_list_graders_many_courses(mock_get, mock_oauth):
+    args = argparse.Namespace()
+    args.course = 'COURSE_1'
+    args.additional_courses = ['MISSING', 'COURSE_2']
+    args.listGrader_endpoint = 'endpoint?branchId='
+    args.workers = 3
+
+    with patch('builtins.print') as mock_print, LogCapture() as logs:
+        exit_val = list_graders.command_list_graders(args)
+
+    printed = ''.join(call[0][0] for call in mock_print.call_args_list)
+    assert 'GraderId: grader-COURSE_1' in printed
+    assert 'GraderId: grader-COURSE_2' in printed
+    assert mock_get.call_count == 3
+    assert 'Unable to list graders for 1 of 3 courses.' in [
+        record.getMessage() for record in logs.records]
+    assert exit_val == 1
+
+
+@patch('coursera_autograder.commands.list_graders.oauth2')
+@patch.object(requests.Session, 'get')
+def test_list_graders_malformed_response(mock_get, mock_oauth):
+    def get(url):
+        course = url.split('=')[-1]
+        if course == 'ERROR':
+            return MockResponse(200, url, '{"errorCode": "oops"}',
+                                {'errorCode': 'oops'})
+        if course == 'NOT_JSON':
+            response = MockResponse(200, url, '<html>')
+            response.json = MagicMock(side_effect=ValueError('No JSON'))
+            return response
+        return mock_course_get(url)
+    mock_get.side_effect = get
+    args = argparse.Namespace()
+    args.course = 'ERROR'
+    args.additional_courses = ['NOT_JSON', 'COURSE_1']
+    args.listGrader_endpoint = 'endpoint?branchId='
+    args.workers = 3
+
+    with patch('builtins.print') as mock_print, LogCapture() as logs:
+        exit_val = list_graders.command_list_graders(args)
+
+    printed = ''.join(call[0][0] for call in mock_print.call_args_list)
+    assert 'GraderId: grader-COURSE_1' in printed
+    assert 'Unable to list graders for 2 of 3 courses.' in [
+        record.getMessage() for record in logs.records]
+    assert exit_val == 1
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import log_stream
+from mock import MagicMock
+from os import path
+from testfixtures import LogCapture
+import io
+import shutil
+import tempfile
+
+
+def read(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+def test_rotating_log_file():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        file_name = path.join(dst_dir, 'stdout.log')
+        log = log_stream.RotatingLogFile(file_name, 10)
+        log.write(b'0123456')
+        log.write(b'789abcdefghijklmnopq')
+        log.write(b'rs')
+        log.close()
+
+        assert log.rotated
+        assert log.total == 29
+        assert read(file_name + '.1') == b'abcdefghij'
+        assert read(file_name) == b'klmnopqrs'
+        assert log.tail() == b'jklmnopqrs'
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_rotating_log_file_small():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        log = log_stream.RotatingLogFile(path.join(dst_dir, 'stdout.log'), 10)
+        log.write(b'abc')
+        log.close()
+
+        assert not log.rotated
+        assert log.tail() == b'abc'
+        assert not path.exists(path.join(dst_dir, 'stdout.log.1'))
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def fake_logs(outputs):
+    "Fakes docker.logs, following the outputs given for each stream."
+    def logs(container, stdout=True, stderr=True, stream=False, follow=None):
+        assert stream and follow
+        chunks = outputs['stdout' if stdout else 'stderr']
+        if isinstance(chunks, Exception):
+            raise chunks
+        return iter(chunks)
+    return logs
+
+
+def test_log_streamer():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        docker_mock = MagicMock()
+        # The snowman is split across two chunks.
+        snowman = u'☃'.encode('utf-8')
+        docker_mock.logs.side_effect = fake_logs({
+            'stdout': [b'Hello ', snowman[:1], snowman[1:] + b'\n'],
+            'stderr': [b'warning\n'],
+        })
+        echo = io.StringIO()
+
+        streamer = log_stream.LogStreamer(
+            docker_mock, 'container', dst_dir, 1024, {'stdout': echo})
+        streamer.start()
+        outputs = streamer.finish()
+
+        assert outputs == (b'Hello ' + snowman + b'\n', b'warning\n')
+        assert echo.getvalue() == u'Hello ☃\n'
+        assert read(path.join(dst_dir, 'stdout.log')) == outputs[0]
+        assert read(path.join(dst_dir, 'stderr.log')) == outputs[1]
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_log_streamer_failed_stream():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        docker_mock = MagicMock()
+        docker_mock.logs.side_effect = fake_logs({
+            'stdout': [b'output'],
+            'stderr': IOError('Connection reset'),
+        })
+
+        streamer = log_stream.LogStreamer(
+            docker_mock, 'container', dst_dir, 1024)
+        streamer.start()
+        outputs = streamer.finish()
+
+        assert outputs == (b'output', None)
+        assert streamer.failed == ['stderr']
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_log_streamer_warns_when_rotated():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        docker_mock = MagicMock()
+        docker_mock.logs.side_effect = fake_logs({
+            'stdout': [b'x' * 25],
+            'stderr': [],
+        })
+
+        with LogCapture() as logs:
+            streamer = log_stream.LogStreamer(
+                docker_mock, 'container', dst_dir, 10)
+            streamer.start()
+            outputs = streamer.finish()
+
+        assert outputs == (b'x' * 10, b'')
+        assert 'wrote 25 bytes to stdout' in logs.records[-1].getMessage()
+    finally:
+        shutil.rmtree(dst_dir)
@@ -17,9 +17,14 @@
 from coursera_autograder.commands import oauth2
 
 import argparse
+import json
+import os
 import pickle
 import configparser
 from mock import mock_open, MagicMock, patch
+import shutil
+import tempfile
+import threading
 import time
 
 # Set up mocking of the `open` call. See http://www.ichimonji10.name/blog/6/
@@ -80,6 +85,26 @@ def test_compute_cache_filname_expanded_path_overrides():
     assert 'override_cache.pickle' in computed, 'Computed was not override!'
 
 
+def test_build_oauth2_configured_endpoints():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config_file = os.path.join(tmp_dir, 'autograder.cfg')
+        with open(config_file, 'w') as f:
+            f.write('[oauth2]\n'
+                    'token_endpoint = http://localhost:8080/token\n'
+                    'verify_tls = False\n')
+        args = argparse.Namespace(config=config_file)
+
+        oauth2_instance = oauth2.build_oauth2(args)
+
+        assert oauth2_instance.token_endpoint == 'http://localhost:8080/token'
+        assert oauth2_instance.auth_endpoint == \
+            'https://accounts.coursera.org/oauth2/v1/auth'
+        assert not oauth2_instance.verify_tls
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
 def test_check_cache_types():
     # test cases are tuples of:
     # (name, cache_value, expected)
@@ -195,3 +220,75 @@ def loading_cache_checker(read_data, expected):
         oauth2_instanced = oauth2.CourseraOAuth2('id', 'secret', 'scopes')
         token_cache = oauth2_instanced.token_cache
         assert token_cache == expected, 'Token cache was: %s' % token_cache
+
+
+def test_token_cache_round_trip():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cache_file = os.path.join(tmp_dir, 'oauth2_cache.json')
+        tokens = {'token': 'abc', 'expires': time.time() + 3600.0,
+                  'refresh': 'def'}
+        oauth2.CourseraOAuth2(
+            'id', 'secret', 'scopes', token_cache_file=cache_file
+        ).token_cache = tokens
+
+        with open(cache_file) as f:
+            assert json.load(f)['version'] == oauth2.TOKEN_CACHE_VERSION
+        assert os.listdir(tmp_dir) == ['oauth2_cache.json']
+        assert oauth2.CourseraOAuth2(
+            'id', 'secret', 'scopes', token_cache_file=cache_file
+        ).token_cache == tokens
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_token_cache_converts_legacy_pickle():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tokens = {'token': 'abc', 'expires': time.time() + 3600.0}
+        with open(os.path.join(tmp_dir, 'oauth2_cache.pickle'), 'wb') as f:
+            pickle.dump(tokens, f)
+        cache_file = os.path.join(tmp_dir, 'oauth2_cache.json')
+
+        assert oauth2.CourseraOAuth2(
+            'id', 'secret', 'scopes', token_cache_file=cache_file
+        ).token_cache == tokens
+        assert os.path.isfile(cache_file)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_refresh_is_single_flight():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cache_file = os.path.join(tmp_dir, 'oauth2_cache.json')
+        oauth2.CourseraOAuth2(
+            'id', 'secret', 'scopes', token_cache_file=cache_file
+        ).token_cache = {'token': 'old', 'expires': time.time() + 1.0,
+                         'refresh': 'refresh'}
+        exchanges = []
+
+        def slow_exchange():
+            exchanges.append(1)
+            time.sleep(0.2)
+            return {'token': 'new', 'expires': time.time() + 3600.0,
+                    'refresh': 'refresh'}
+
+        clients = []
+        for _ in range(4):
+            client = oauth2.CourseraOAuth2(
+                'id', 'secret', 'scopes', token_cache_file=cache_file)
+            client._exchange_refresh_tokens = slow_exchange
+            clients.append(client)
+        threads = [threading.Thread(target=client.build_authorizer)
+                   for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(exchanges) == 1
+        assert [client.token_cache['token'] for client in clients] == \
+            ['new'] * 4
+    finally:
+        shutil.rmtree(tmp_dir)
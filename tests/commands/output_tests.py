@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import output
+import io
+import json
+
+ROWS = [
+    {'graderId': 'g1', 'filename': 'a.zip'},
+    {'graderId': 'g2', 'filename': 'b,c.zip'},
+]
+
+
+def write_rows(output_format, rows=ROWS):
+    stream = io.StringIO()
+    with output.RowWriter(output_format, ['graderId', 'filename'],
+                          stream) as writer:
+        writer.text('Graders:')
+        for row in rows:
+            writer.write(row, text='GraderId: %s' % row['graderId'])
+    return stream.getvalue()
+
+
+def test_text():
+    assert write_rows('text') == 'Graders:\nGraderId: g1\nGraderId: g2\n'
+
+
+def test_json():
+    assert json.loads(write_rows('json')) == ROWS
+    assert json.loads(write_rows('json', rows=[])) == []
+
+
+def test_jsonl():
+    lines = write_rows('jsonl').splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+
+
+def test_csv():
+    assert write_rows('csv') == (
+        'graderId,filename\ng1,a.zip\ng2,"b,c.zip"\n')
+    assert write_rows('csv', rows=[]) == 'graderId,filename\n'
+
+
+def test_rows_are_written_incrementally():
+    stream = io.StringIO()
+    writer = output.RowWriter('jsonl', ['graderId'], stream)
+    writer.write({'graderId': 'g1'})
+    assert stream.getvalue() == '{"graderId": "g1"}\n'
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder import main
+from coursera_autograder.commands import package
+from mock import patch
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+
+def test_package_parsing():
+    parser = main.build_parser()
+
+    args = parser.parse_args('package grader.zip --from-image grader:1 '
+                             '--codec store --level 1 --workers 4'.split())
+    assert args.func == package.command_package
+    assert args.output == 'grader.zip'
+    assert args.from_image == 'grader:1'
+    assert args.image_tar is None
+    assert args.codec == 'store'
+    assert args.level == 1
+    assert args.workers == 4
+    assert args.block_size == 1024
+
+
+def test_package_parsing_needs_a_source():
+    parser = main.build_parser()
+    try:
+        with patch('sys.stderr'):
+            parser.parse_args('package grader.zip'.split())
+    except SystemExit:
+        pass
+    else:
+        assert False, 'parser should have thrown exception'
+
+
+def test_package_image_tar():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        image_tar = os.path.join(tmp_dir, 'grader.tar')
+        with open(image_tar, 'wb') as f:
+            f.write(b'layer' * 100000)
+        output = os.path.join(tmp_dir, 'grader.zip')
+        args = main.build_parser().parse_args(
+            ['-q', 'package', output, '--image-tar', image_tar,
+             '--workers', '2', '--block-size', '64'])
+
+        assert args.func(args) == 0
+
+        with zipfile.ZipFile(output) as archive:
+            assert archive.read('grader.tar') == b'layer' * 100000
+        assert sorted(os.listdir(tmp_dir)) == ['grader.tar', 'grader.zip']
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@patch('coursera_autograder.commands.package.utils.docker_client')
+def test_package_image_from_daemon(docker_client):
+    docker_client.return_value.get_image.side_effect = \
+        lambda tag: io.BytesIO(b'image')
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        output = os.path.join(tmp_dir, 'grader.zip')
+        args = main.build_parser().parse_args(
+            ['-q', 'package', output, '--from-image', 'registry/grader:1'])
+
+        assert args.func(args) == 0
+
+        with zipfile.ZipFile(output) as archive:
+            assert archive.read('registry_grader_1.tar') == b'image'
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@patch('coursera_autograder.commands.package.utils.docker_client')
+def test_package_failure_leaves_no_file(docker_client):
+    docker_client.return_value.get_image.side_effect = Exception('No image')
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        args = main.build_parser().parse_args(
+            ['-q', 'package', os.path.join(tmp_dir, 'grader.zip'),
+             '--from-image', 'grader'])
+
+        assert args.func(args) == 1
+        assert os.listdir(tmp_dir) == []
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import parallel_zip
+import io
+import os
+import zipfile
+import zlib
+
+
+class Unseekable(object):
+    "A write-only stream, like a socket or a pipe."
+
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def write(self, data):
+        return self.data.write(data)
+
+
+def sample_data():
+    return b'grader layer ' * 50000 + os.urandom(100000)
+
+
+def test_crc32_combine():
+    first = os.urandom(1000)
+    second = os.urandom(3000)
+    assert parallel_zip.crc32_combine(
+        zlib.crc32(first), zlib.crc32(second), len(second)) == \
+        zlib.crc32(first + second)
+    assert parallel_zip.crc32_combine(zlib.crc32(first), 0, 0) == \
+        zlib.crc32(first)
+
+
+def check_archive(data, expected):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['grader.tar']
+        assert archive.read('grader.tar') == expected
+        return archive.infolist()[0]
+
+
+def test_write_zip_to_file():
+    data = sample_data()
+    out = io.BytesIO()
+    result = parallel_zip.write_zip(out, 'grader.tar', io.BytesIO(data),
+                                    workers=4, block_size=16384)
+
+    info = check_archive(out.getvalue(), data)
+    assert info.compress_type == zipfile.ZIP_DEFLATED
+    assert info.flag_bits & parallel_zip.FLAG_DATA_DESCRIPTOR == 0
+    assert result == {'crc': zlib.crc32(data), 'size': len(data),
+                      'compressedSize': info.compress_size}
+    # Priming each block with the end of the previous one keeps the archive
+    # about as small as compressing the data in one go.
+    assert info.compress_size < len(zlib.compress(data, 6)) * 1.05
+
+
+def test_write_zip_to_stream():
+    data = sample_data()
+    out = Unseekable()
+    parallel_zip.write_zip(out, 'grader.tar', io.BytesIO(data), workers=3,
+                           block_size=10000)
+
+    info = check_archive(out.data.getvalue(), data)
+    assert info.flag_bits & parallel_zip.FLAG_DATA_DESCRIPTOR
+
+
+def test_write_stored_zip():
+    data = sample_data()
+    out = io.BytesIO()
+    parallel_zip.write_zip(out, 'grader.tar', io.BytesIO(data),
+                           codec='store', block_size=16384)
+
+    info = check_archive(out.getvalue(), data)
+    assert info.compress_type == zipfile.ZIP_STORED
+    assert info.compress_size == len(data)
+
+
+def test_write_empty_zip():
+    out = io.BytesIO()
+    parallel_zip.write_zip(out, 'grader.tar', io.BytesIO(b''))
+    check_archive(out.getvalue(), b'')
+
+
+def test_progress():
+    read = []
+    parallel_zip.write_zip(io.BytesIO(), 'grader.tar', io.BytesIO(b'x' * 25),
+                           block_size=10, progress=read.append)
+    assert read == [10, 20, 25]
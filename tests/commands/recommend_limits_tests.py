@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+from coursera_autograder import main
+from coursera_autograder.commands import recommend_limits
+from mock import MagicMock
+from mock import patch
+from os import path
+import io
+import json
+import os
+import shutil
+import tempfile
+
+MB = 1024 * 1024
+
+
+def result(seconds, peak_mb=100, timed_out=False, oom_killed=False):
+    return {
+        'exitCode': None if timed_out else 0,
+        'timedOut': timed_out,
+        'errors': [],
+        'resources': {'peakMemoryBytes': peak_mb * MB,
+                      'oomKilled': oom_killed},
+        'timings': {'phases': {'start': 0.5, 'grader': seconds - 0.5},
+                    'total': seconds + 1},
+    }
+
+
+def test_recommend_limits_parsing():
+    parser = main.build_parser(['recommend_limits'])
+    args = parser.parse_args(
+        'recommend_limits myimage /tmp {} --target-p99 30 --tiers '
+        '2:8192,1:4096 --assignment-part COURSE ITEM PART'.split())
+
+    assert args.func == recommend_limits.command_recommend_limits
+    assert args.containerTag == 'myimage'
+    assert args.target_p99 == 30
+    assert args.tiers == [(2, 8192), (1, 4096)]
+    assert args.assignment_part == ['COURSE', 'ITEM', 'PART']
+    assert args.margin == 0.25
+    assert args.timeout is None
+
+
+def test_parse_tiers_rejects_bad_tiers():
+    for value in ['2', '2:8000', '0:4096', 'a:b']:
+        try:
+            recommend_limits.parse_tiers(value)
+        except argparse.ArgumentTypeError:
+            pass
+        else:
+            assert False, '%s should have been rejected' % value
+
+
+def test_tiers_ordered_by_cost():
+    assert sorted(recommend_limits.TIERS, key=recommend_limits.tier_cost) == [
+        (1, 4096), (1, 8192), (2, 4096), (2, 8192), (2, 16384), (4, 8192),
+        (4, 16384)]
+
+
+def test_summarize_tier_timeout():
+    # The longest grading, increased by the margin or the start up overhead.
+    results = [result(100.0), result(400.0)]
+    assert recommend_limits.summarize_tier(
+        (1, 4096), results, 1200, 0.25)['wallClockTimeout'] == 500
+    assert recommend_limits.summarize_tier(
+        (1, 4096), results, 1200, 0.05)['wallClockTimeout'] == 430
+
+
+def test_summarize_tier():
+    results = [result(float(i)) for i in range(1, 11)]
+
+    summary = recommend_limits.summarize_tier((2, 4096), results, 20, 0.25)
+
+    assert summary['gradings'] == 10
+    assert summary['p50Seconds'] == 5
+    assert summary['p99Seconds'] == 10
+    assert summary['peakMemoryMb'] == 100
+    # At least the minimum timeout.
+    assert summary['wallClockTimeout'] == 60
+    assert summary['meetsTarget']
+
+    # The margin must fit within the target.
+    assert not recommend_limits.summarize_tier(
+        (2, 4096), results, 12, 0.25)['meetsTarget']
+
+
+def test_summarize_tier_resource_failures():
+    assert not recommend_limits.summarize_tier(
+        (1, 4096), [result(1), result(60, timed_out=True)], 100,
+        0.25)['meetsTarget']
+    assert not recommend_limits.summarize_tier(
+        (1, 4096), [result(1, oom_killed=True)], 100, 0.25)['meetsTarget']
+    # Too close to the memory limit.
+    assert not recommend_limits.summarize_tier(
+        (1, 4096), [result(1, peak_mb=3500)], 100, 0.25)['meetsTarget']
+
+    # Gradings that exit with an error or write invalid feedback.
+    failed = result(1)
+    failed['exitCode'] = 1
+    invalid = result(1)
+    invalid['errors'] = ["Field 'feedback' not present in parsed output."]
+    summary = recommend_limits.summarize_tier(
+        (1, 4096), [failed, invalid, result(1)], 100, 0.25)
+    assert summary['failed'] == 2
+    assert not summary['meetsTarget']
+
+    summary = recommend_limits.summarize_tier(
+        (1, 4096), [result(1, timed_out=True)], 100, 0.25)
+    assert summary['p99Seconds'] is None
+    assert 'every grading timed out' in recommend_limits.tier_text(summary)
+
+
+@patch('coursera_autograder.commands.recommend_limits.grade.grade_submission')
+@patch('coursera_autograder.commands.recommend_limits.utils')
+def test_command_recommend_limits(utils, grade_submission):
+    src_dir = tempfile.mkdtemp()
+    try:
+        for name in ['a', 'b']:
+            os.makedirs(path.join(src_dir, name))
+        graded = []
+
+        def grade(docker, args, name, directory, environment):
+            graded.append((args.cpus, args.mem_limit, name))
+            # Only 2 CPUs are fast enough.
+            return result(5 if args.cpus >= 2 else 50)
+        grade_submission.side_effect = grade
+        utils.docker_client.return_value = MagicMock()
+        manifest = path.join(src_dir, 'limits.json')
+        args = main.build_parser(['recommend_limits']).parse_args([
+            'recommend_limits', 'myimage', src_dir, '{}', '--target-p99',
+            '10', '--tiers', '4:8192,1:4096,2:4096,2:8192', '--format',
+            'jsonl', '--assignment-part', 'COURSE', 'ITEM', 'PART',
+            '--write-manifest', manifest])
+
+        stdout = io.StringIO()
+        with patch('sys.stdout', stdout), \
+                patch('os.cpu_count', return_value=8):
+            assert recommend_limits.command_recommend_limits(args) == 0
+
+        # The cheapest tiers are tried first, stopping at the first to meet
+        # the target.
+        assert graded == [(1, 4096, 'a'), (1, 4096, 'b'),
+                          (2, 4096, 'a'), (2, 4096, 'b')]
+        assert args.timeout == 10
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        assert [(row['cpus'], row['recommended']) for row in rows] == [
+            (1, False), (2, True)]
+        with open(manifest) as f:
+            assert json.load(f) == [{
+                'course': 'COURSE', 'item': 'ITEM', 'part': 'PART',
+                'reservedCpu': 2, 'reservedMemory': 4096,
+                'wallClockTimeout': 60}]
+    finally:
+        shutil.rmtree(src_dir)
+
+
+@patch('coursera_autograder.commands.recommend_limits.grade.grade_submission')
+@patch('coursera_autograder.commands.recommend_limits.utils')
+def test_command_recommend_limits_no_tier_meets_target(
+        utils, grade_submission):
+    src_dir = tempfile.mkdtemp()
+    try:
+        os.makedirs(path.join(src_dir, 'a'))
+        grade_submission.return_value = result(50)
+        args = main.build_parser(['recommend_limits']).parse_args([
+            'recommend_limits', 'myimage', src_dir, '{}', '--target-p99',
+            '10', '--tiers', '1:4096,1:8192'])
+
+        with patch('sys.stdout', io.StringIO()):
+            assert recommend_limits.command_recommend_limits(args) == 1
+        assert grade_submission.call_count == 2
+    finally:
+        shutil.rmtree(src_dir)
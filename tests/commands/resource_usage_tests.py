@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import resource_usage
+from mock import MagicMock
+from os import path
+import json
+import os
+import shutil
+import tempfile
+
+CONTAINER_ID = 'c0ffee' * 10
+
+
+def write_files(root, files):
+    for (name, content) in files.items():
+        file_name = path.join(root, name)
+        if not path.isdir(path.dirname(file_name)):
+            os.makedirs(path.dirname(file_name))
+        with open(file_name, 'w') as f:
+            f.write(content)
+
+
+def test_cgroup_v2_counters():
+    root = tempfile.mkdtemp()
+    try:
+        cgroup = 'system.slice/docker-%s.scope' % CONTAINER_ID
+        write_files(root, {
+            'proc/42/cgroup': '0::/%s\n' % cgroup,
+            'cgroup/%s/memory.current' % cgroup: '3000\n',
+            'cgroup/%s/memory.peak' % cgroup: '5000\n',
+            'cgroup/%s/memory.stat' % cgroup:
+                'anon 2000\ninactive_file 1000\n',
+            'cgroup/%s/cpu.stat' % cgroup:
+                'usage_usec 1500000\nnr_throttled 3\nthrottled_usec 250000\n',
+            'cgroup/%s/io.stat' % cgroup:
+                '8:0 rbytes=100 wbytes=20 rios=1 wios=1\n'
+                '8:16 rbytes=1 wbytes=2 rios=1 wios=1\n',
+        })
+
+        counters = resource_usage.CgroupCounters.find(
+            CONTAINER_ID, 42, path.join(root, 'cgroup'),
+            path.join(root, 'proc'))
+
+        assert counters.sample() == {
+            'memory': 2000,
+            'peakMemory': 5000,
+            'cpu': 1.5,
+            'throttled': 0.25,
+            'throttledPeriods': 3,
+            'readBytes': 101,
+            'writeBytes': 22,
+        }
+        shutil.rmtree(path.join(root, 'cgroup'))
+        assert counters.sample() is None
+    finally:
+        shutil.rmtree(root)
+
+
+def test_cgroup_v1_counters():
+    root = tempfile.mkdtemp()
+    try:
+        cgroup = 'docker/%s' % CONTAINER_ID
+        write_files(root, {
+            'proc/42/cgroup':
+                '12:memory:/%s\n4:cpu,cpuacct:/%s\n8:blkio:/%s\n'
+                '1:name=systemd:/%s\n0::/%s\n' % ((cgroup, ) * 5),
+            'cgroup/memory/%s/memory.usage_in_bytes' % cgroup: '4096\n',
+            'cgroup/memory/%s/memory.max_usage_in_bytes' % cgroup: '8192\n',
+            'cgroup/memory/%s/memory.stat' % cgroup:
+                'cache 100\ntotal_inactive_file 96\n',
+            'cgroup/cpuacct/%s/cpuacct.usage' % cgroup: '2000000000\n',
+            'cgroup/cpu/%s/cpu.stat' % cgroup:
+                'nr_periods 10\nnr_throttled 2\nthrottled_time 500000000\n',
+            'cgroup/blkio/%s/blkio.throttle.io_service_bytes' % cgroup:
+                '8:0 Read 10\n8:0 Write 5\n8:0 Total 15\nTotal 15\n',
+        })
+
+        counters = resource_usage.CgroupCounters.find(
+            CONTAINER_ID, 42, path.join(root, 'cgroup'),
+            path.join(root, 'proc'))
+
+        assert 'unified' not in counters.paths
+        assert counters.sample() == {
+            'memory': 4000,
+            'peakMemory': 8192,
+            'cpu': 2.0,
+            'throttled': 0.5,
+            'throttledPeriods': 2,
+            'readBytes': 10,
+            'writeBytes': 5,
+        }
+    finally:
+        shutil.rmtree(root)
+
+
+def test_cgroup_not_visible():
+    root = tempfile.mkdtemp()
+    try:
+        write_files(root, {'proc/42/cgroup': '0::/init.scope\n'})
+        assert resource_usage.CgroupCounters.find(
+            CONTAINER_ID, 42, path.join(root, 'cgroup'),
+            path.join(root, 'proc')) is None
+        assert resource_usage.CgroupCounters.find(
+            CONTAINER_ID, 43, path.join(root, 'cgroup'),
+            path.join(root, 'proc')) is None
+    finally:
+        shutil.rmtree(root)
+
+
+DOCKER_STATS = {
+    'memory_stats': {
+        'usage': 1100,
+        'max_usage': 2000,
+        'stats': {'total_inactive_file': 100},
+    },
+    'cpu_stats': {
+        'cpu_usage': {'total_usage': 3000000000},
+        'throttling_data': {'throttled_periods': 1,
+                            'throttled_time': 100000000},
+    },
+    'blkio_stats': {
+        'io_service_bytes_recursive': [
+            {'op': 'Read', 'value': 7},
+            {'op': 'Write', 'value': 3},
+            {'op': 'Total', 'value': 10},
+        ],
+    },
+}
+
+
+def test_parse_docker_stats():
+    assert resource_usage.parse_docker_stats(DOCKER_STATS) == {
+        'memory': 1000,
+        'peakMemory': 2000,
+        'cpu': 3.0,
+        'throttled': 0.1,
+        'throttledPeriods': 1,
+        'readBytes': 7,
+        'writeBytes': 3,
+    }
+    # A stopped container yields empty samples.
+    assert resource_usage.parse_docker_stats(
+        {'memory_stats': {}, 'cpu_stats': {}}) is None
+
+
+def sample(memory, cpu, peak=None, read_bytes=0):
+    return {'memory': memory, 'peakMemory': peak, 'cpu': cpu,
+            'throttled': 0.0, 'throttledPeriods': 0,
+            'readBytes': read_bytes, 'writeBytes': 0}
+
+
+def test_build_report():
+    samples = [sample(100, 1.0, peak=150, read_bytes=10),
+               sample(300, 2.5, peak=400, read_bytes=30),
+               sample(200, 3.0, peak=400, read_bytes=30)]
+
+    report = resource_usage.build_report(samples, 4.0, memory_limit=1000)
+
+    assert report['peakMemoryBytes'] == 400
+    assert report['cpuSeconds'] == 3.0
+    assert report['blockReadBytes'] == 30
+    assert report['memoryLimitBytes'] == 1000
+    assert report['samples'] == 3
+
+    # Counters of containers that ran before are relative to the first
+    # sample, and their high watermark is ignored.
+    report = resource_usage.build_report(samples, 4.0, cumulative=False)
+
+    assert report['peakMemoryBytes'] == 300
+    assert report['cpuSeconds'] == 2.0
+    assert report['blockReadBytes'] == 20
+
+
+def test_build_report_without_samples():
+    report = resource_usage.build_report([], 0.01)
+
+    assert report['samples'] == 0
+    assert report['peakMemoryBytes'] is None
+    assert 'No samples' in resource_usage.format_summary(report)
+
+
+def test_check_headroom():
+    mb = 1024 * 1024
+    report = resource_usage.build_report(
+        [sample(500 * mb, 1.0)], 2.0, memory_limit=1024 * mb)
+    assert resource_usage.check_headroom(report) == []
+    assert '524.0 MB (51%)' in resource_usage.format_summary(report)
+
+    report = resource_usage.build_report(
+        [sample(1000 * mb, 1.0)], 2.0, memory_limit=1024 * mb)
+    assert len(resource_usage.check_headroom(report)) == 1
+
+    report['oomKilled'] = True
+    assert 'out of memory' in resource_usage.check_headroom(report)[0]
+
+
+def test_monitor_docker_stats():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        docker_mock = MagicMock()
+        docker_mock.inspect_container.return_value = {
+            'Id': CONTAINER_ID, 'State': {'Pid': 0}}
+        docker_mock.stats.return_value = iter([
+            DOCKER_STATS, {'memory_stats': {}, 'cpu_stats': {}}])
+
+        monitor = resource_usage.ResourceMonitor(docker_mock, 'container')
+        monitor.start()
+        monitor._thread.join()
+        report = monitor.stop(4096)
+
+        docker_mock.stats.assert_called_with('container', decode=True)
+        assert report['source'] == 'docker stats'
+        assert report['samples'] == 1
+        assert report['peakMemoryBytes'] == 2000
+        assert report['memoryLimitBytes'] == 4096
+
+        report_file = resource_usage.write_report(report, dst_dir)
+        with open(report_file) as f:
+            assert json.load(f) == report
+    finally:
+        shutil.rmtree(dst_dir)
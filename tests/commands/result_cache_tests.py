@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import result_cache
+from mock import patch
+from os import path
+import os
+import shutil
+import tempfile
+import time
+
+
+def write_file(file_path, data):
+    if not path.isdir(path.dirname(file_path)):
+        os.makedirs(path.dirname(file_path))
+    with open(file_path, 'w') as f:
+        f.write(data)
+
+
+def test_hash_tree():
+    root = tempfile.mkdtemp()
+    try:
+        write_file(path.join(root, 'a.py'), 'print(1)')
+        write_file(path.join(root, 'lib', 'b.py'), 'print(2)')
+        original = result_cache.hash_tree(root)
+        assert original == result_cache.hash_tree(root)
+
+        write_file(path.join(root, 'lib', 'b.py'), 'print(3)')
+        assert original != result_cache.hash_tree(root)
+
+        write_file(path.join(root, 'lib', 'b.py'), 'print(2)')
+        assert original == result_cache.hash_tree(root)
+        os.rename(path.join(root, 'lib', 'b.py'), path.join(root, 'c.py'))
+        assert original != result_cache.hash_tree(root)
+    finally:
+        shutil.rmtree(root)
+
+
+def test_key_depends_on_settings():
+    root = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache = result_cache.ResultCache(cache_dir, 1024)
+        key = cache.key('sha256:abc', root, {'partId': 'a'}, mem_limit=1024)
+        assert key == cache.key(
+            'sha256:abc', root, {'partId': 'a'}, mem_limit=1024)
+        assert key != cache.key(
+            'sha256:abd', root, {'partId': 'a'}, mem_limit=1024)
+        assert key != cache.key(
+            'sha256:abc', root, {'partId': 'b'}, mem_limit=1024)
+        assert key != cache.key(
+            'sha256:abc', root, {'partId': 'a'}, mem_limit=2048)
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(cache_dir)
+
+
+def test_store_lookup_restore():
+    cache_dir = tempfile.mkdtemp()
+    dst_dir = tempfile.mkdtemp()
+    restore_dir = tempfile.mkdtemp()
+    try:
+        cache = result_cache.ResultCache(cache_dir, 1024 * 1024)
+        assert cache.lookup('key') is None
+
+        write_file(path.join(dst_dir, 'feedback.json'), '{"feedback": ""}')
+        write_file(path.join(dst_dir, 'out', 'report.html'), '<p></p>')
+        cache.store('key', dst_dir,
+                    [path.join(dst_dir, 'feedback.json'),
+                     path.join(dst_dir, 'out', 'report.html')],
+                    1, 'the output', b'the errors')
+
+        entry = cache.lookup('key')
+        assert entry['exitCode'] == 1
+        assert entry['stdout'] == b'the output'
+        assert entry['stderr'] == b'the errors'
+
+        cache.restore('key', entry, restore_dir)
+        with open(path.join(restore_dir, 'out', 'report.html')) as f:
+            assert f.read() == '<p></p>'
+        assert path.isfile(path.join(restore_dir, 'feedback.json'))
+    finally:
+        for directory in [cache_dir, dst_dir, restore_dir]:
+            shutil.rmtree(directory)
+
+
+def test_evicts_least_recently_used():
+    cache_dir = tempfile.mkdtemp()
+    dst_dir = tempfile.mkdtemp()
+    try:
+        feedback = path.join(dst_dir, 'feedback.json')
+        write_file(feedback, 'x' * 1000)
+        cache = result_cache.ResultCache(cache_dir, 2500)
+        cache.store('first', dst_dir, [feedback], 0, '', '')
+        cache.store('second', dst_dir, [feedback], 0, '', '')
+        # Make 'first' the most recently used entry.
+        old = time.time() - 100
+        os.utime(path.join(cache_dir, 'second'), (old, old))
+        assert cache.lookup('first') is not None
+
+        cache.store('third', dst_dir, [feedback], 0, '', '')
+
+        assert cache.lookup('second') is None
+        assert cache.lookup('first') is not None
+        assert cache.lookup('third') is not None
+    finally:
+        shutil.rmtree(cache_dir)
+        shutil.rmtree(dst_dir)
+
+
+def test_store_sizes_cache_only_when_needed():
+    cache_dir = tempfile.mkdtemp()
+    dst_dir = tempfile.mkdtemp()
+    try:
+        feedback = path.join(dst_dir, 'feedback.json')
+        write_file(feedback, 'x' * 1000)
+        cache = result_cache.ResultCache(cache_dir, 10000)
+        with patch('coursera_autograder.commands.result_cache.os.listdir',
+                   wraps=os.listdir) as listdir:
+            for i in range(8):
+                cache.store('entry%d' % i, dst_dir, [feedback], 0, '', '')
+            # Only the first store sized the cache from disk.
+            assert listdir.call_count == 1
+
+            # Going over the limit evicts down to EVICT_TO of it, so that
+            # the next stores need not size the cache again.
+            for i in range(8, 11):
+                cache.store('entry%d' % i, dst_dir, [feedback], 0, '', '')
+            assert listdir.call_count == 2
+        entries = [name for name in os.listdir(cache_dir)
+                   if not name.startswith('.')]
+        assert len(entries) == 9
+        assert cache._size == sum(
+            result_cache._entry_size(path.join(cache_dir, name))
+            for name in entries)
+    finally:
+        shutil.rmtree(cache_dir)
+        shutil.rmtree(dst_dir)
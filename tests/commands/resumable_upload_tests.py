@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import resumable_upload
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+
+class TusServer(object):
+    '''
+    A stand-in for a tus server on localhost. `fail_patches` is the number of
+    PATCH requests to reject (after storing half of the chunk, as if the
+    connection had dropped mid-request) before accepting them again, and
+    `fail_heads` the number of HEAD requests to reject. `stall_patches` is
+    the number of PATCH requests to acknowledge without storing anything.
+    '''
+
+    def __init__(self, fail_patches=0, fail_heads=0, stall_patches=0):
+        self.uploads = {}
+        self.fail_patches = fail_patches
+        self.fail_heads = fail_heads
+        self.stall_patches = stall_patches
+        self.patches = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                upload_id = '/files/%d' % len(server.uploads)
+                length = self.headers['Upload-Length']
+                server.uploads[upload_id] = {
+                    'length': int(length) if length is not None else None,
+                    'metadata': self.headers['Upload-Metadata'],
+                    'data': b'',
+                }
+                self._reply(201, {'Location': upload_id})
+
+            def do_HEAD(self):
+                if server.fail_heads > 0:
+                    server.fail_heads -= 1
+                    self._reply(503)
+                    return
+                if self.path not in server.uploads:
+                    self._reply(404)
+                    return
+                self._reply(200, {'Upload-Offset': str(
+                    len(server.uploads[self.path]['data']))})
+
+            def do_PATCH(self):
+                upload = server.uploads[self.path]
+                chunk = self.rfile.read(int(self.headers['Content-Length']))
+                if int(self.headers['Upload-Offset']) != len(upload['data']):
+                    self._reply(409)
+                    return
+                server.patches += 1
+                if self.headers['Upload-Length'] is not None:
+                    upload['length'] = int(self.headers['Upload-Length'])
+                if server.stall_patches > 0:
+                    server.stall_patches -= 1
+                    self._reply(204, {'Upload-Offset': str(
+                        len(upload['data']))})
+                    return
+                if server.fail_patches > 0:
+                    server.fail_patches -= 1
+                    upload['data'] += chunk[:len(chunk) // 2]
+                    self._reply(500)
+                    return
+                upload['data'] += chunk
+                self._reply(204, {'Upload-Offset': str(len(upload['data']))})
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/files/' % self.httpd.server_port
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def test_encode_metadata():
+    assert resumable_upload.encode_metadata(
+        {'filename': 'a.zip', 'fieldname': 'file'}) == \
+        'fieldname ZmlsZQ==,filename YS56aXA='
+
+
+def test_upload_in_chunks():
+    server = TusServer()
+    try:
+        client = resumable_upload.TusClient(chunk_size=4)
+        data = b'0123456789'
+        upload_url = client.create(server.url, len(data), {'filename': 'a'})
+        received = []
+        assert client.upload(upload_url, io.BytesIO(data), len(data),
+                             progress=received.append) == len(data)
+        assert received == [4, 8, 10]
+        assert server.uploads['/files/0']['data'] == data
+        assert client.offset(upload_url) == len(data)
+    finally:
+        server.stop()
+
+
+def test_upload_retries_failed_chunk_from_server_offset():
+    server = TusServer(fail_patches=2)
+    try:
+        client = resumable_upload.TusClient(chunk_size=4, retry_delay=0)
+        data = b'0123456789'
+        upload_url = client.create(server.url, len(data), {})
+        client.upload(upload_url, io.BytesIO(data), len(data))
+        assert server.uploads['/files/0']['data'] == data
+    finally:
+        server.stop()
+
+
+def test_upload_gives_up_after_retries():
+    server = TusServer(fail_patches=10)
+    try:
+        client = resumable_upload.TusClient(
+            chunk_size=4, retries=2, retry_delay=0)
+        upload_url = client.create(server.url, 10, {})
+        try:
+            client.upload(upload_url, io.BytesIO(b'0123456789'), 10)
+        except resumable_upload.UploadError:
+            pass
+        else:
+            assert False, 'upload should have given up'
+        assert server.patches == 3
+    finally:
+        server.stop()
+
+
+def test_upload_gives_up_without_progress():
+    data = b'0123456789'
+    for stalls in [2, 10]:
+        for stream in [False, True]:
+            server = TusServer(stall_patches=stalls)
+            try:
+                client = resumable_upload.TusClient(
+                    chunk_size=4, retries=2, retry_delay=0)
+                try:
+                    if stream:
+                        client.upload_stream(client.create(
+                            server.url, None, {}), io.BytesIO(data))
+                    else:
+                        client.upload(client.create(
+                            server.url, len(data), {}), io.BytesIO(data),
+                            len(data))
+                except resumable_upload.UploadError:
+                    assert stalls > 2, 'should have retried the chunk'
+                else:
+                    assert stalls <= 2, 'should have given up'
+                    assert server.uploads['/files/0']['data'] == data
+            finally:
+                server.stop()
+
+
+def test_offset_of_unknown_upload():
+    server = TusServer()
+    try:
+        client = resumable_upload.TusClient()
+        assert client.offset(server.url + 'missing') is None
+    finally:
+        server.stop()
+
+
+def test_resume_offset_retries():
+    server = TusServer(fail_heads=2)
+    try:
+        client = resumable_upload.TusClient(retries=2, retry_delay=0)
+        upload_url = client.create(server.url, 10, {})
+        server.uploads['/files/0']['data'] = b'0123'
+        assert client.resume_offset(upload_url) == 4
+
+        server.fail_heads = 1
+        assert client.resume_offset(server.url + 'missing') is None
+
+        server.fail_heads = 3
+        try:
+            client.resume_offset(upload_url)
+        except resumable_upload.UploadError:
+            pass
+        else:
+            assert False, 'resume_offset should have given up'
+    finally:
+        server.stop()
+
+
+def test_session_persists_state():
+    session_dir = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(session_dir, 'image.zip')
+        with open(file_path, 'wb') as f:
+            f.write(b'image')
+        session = resumable_upload.UploadSession(
+            os.path.join(session_dir, 'sessions'), file_path, 'COURSE')
+        assert session.load() is None
+        session.save({'uploadUrl': 'http://example.com/files/1'})
+
+        reopened = resumable_upload.UploadSession(
+            os.path.join(session_dir, 'sessions'), file_path, 'COURSE')
+        assert reopened.load() == {'uploadUrl': 'http://example.com/files/1'}
+        other_course = resumable_upload.UploadSession(
+            os.path.join(session_dir, 'sessions'), file_path, 'OTHER')
+        assert other_course.load() is None
+
+        reopened.delete()
+        assert session.load() is None
+    finally:
+        shutil.rmtree(session_dir)
+
+
+def test_upload_stream_declares_length_with_last_chunk():
+    server = TusServer()
+    try:
+        client = resumable_upload.TusClient(chunk_size=4)
+        data = b'0123456789'
+        upload_url = client.create(server.url, None, {})
+        assert server.uploads['/files/0']['length'] is None
+        received = []
+        assert client.upload_stream(upload_url, io.BytesIO(data),
+                                    progress=received.append) == len(data)
+        assert received == [4, 8, 10]
+        assert server.uploads['/files/0']['data'] == data
+        assert server.uploads['/files/0']['length'] == len(data)
+    finally:
+        server.stop()
+
+
+def test_upload_stream_retries_rest_of_failed_chunk():
+    server = TusServer(fail_patches=2)
+    try:
+        client = resumable_upload.TusClient(chunk_size=4, retry_delay=0)
+        data = b'0123456789'
+        upload_url = client.create(server.url, None, {})
+        client.upload_stream(upload_url, io.BytesIO(data))
+        assert server.uploads['/files/0']['data'] == data
+        assert server.uploads['/files/0']['length'] == len(data)
+    finally:
+        server.stop()
+
+
+def test_upload_empty_stream():
+    server = TusServer()
+    try:
+        client = resumable_upload.TusClient(chunk_size=4)
+        upload_url = client.create(server.url, None, {})
+        assert client.upload_stream(upload_url, io.BytesIO(b'')) == 0
+        assert server.uploads['/files/0']['length'] == 0
+    finally:
+        server.stop()
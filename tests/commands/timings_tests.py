@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import timings
+import io
+import json
+
+
+def test_phase_timings_accumulate():
+    timer = timings.PhaseTimings()
+    with timer.phase('start'):
+        pass
+    timer.add('grader', 1.5)
+    timer.add('grader', 0.5)
+
+    result = timer.as_dict()
+    assert list(result['phases']) == ['start', 'grader']
+    assert result['phases']['grader'] == 2.0
+    assert result['total'] >= result['phases']['start']
+
+
+def test_phase_timings_time_failed_phases():
+    timer = timings.PhaseTimings()
+    try:
+        with timer.phase('grader'):
+            raise ValueError()
+    except ValueError:
+        pass
+    assert 'grader' in timer.as_dict()['phases']
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert timings.percentile(values, 50) == 50
+    assert timings.percentile(values, 99) == 99
+    assert timings.percentile([3, 1, 2], 50) == 2
+    assert timings.percentile([7], 90) == 7
+
+
+def test_summarize():
+    runs = [{'phases': {'create': 1.0, 'grader': float(i)}, 'total': i + 1.0}
+            for i in range(1, 11)]
+    runs.append({'phases': {'cache_restore': 0.1}, 'total': 0.1})
+
+    summary = timings.summarize(runs)
+
+    assert list(summary) == ['create', 'grader', 'cache_restore', 'total']
+    assert summary['grader']['count'] == 10
+    assert summary['grader']['p50'] == 5.0
+    assert summary['grader']['p90'] == 9.0
+    assert summary['grader']['sum'] == 55.0
+    assert summary['cache_restore']['count'] == 1
+    assert summary['total']['count'] == 11
+
+
+def test_write_timings():
+    result = {'phases': {'create': 0.25, 'grader': 0.5}, 'total': 1.0}
+
+    text = io.StringIO()
+    timings.write_timings(result, 'text', text)
+    lines = text.getvalue().splitlines()
+    assert lines[0].split() == ['PHASE', 'SECONDS', 'SHARE']
+    assert lines[2].split() == ['grader', '0.500', '50.0%']
+    assert lines[3].split() == ['total', '1.000', '100.0%']
+
+    document = io.StringIO()
+    timings.write_timings(result, 'json', document)
+    assert json.loads(document.getvalue()) == result
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import oauth2
+from coursera_autograder.commands import token_agent
+from mock import MagicMock
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import time
+
+
+class FakeOAuth2(object):
+    def __init__(self, expires_in):
+        self.token_cache = {
+            'token': 'first', 'expires': time.time() + expires_in,
+            'refresh': 'refresh-token'}
+        self.refreshes = 0
+
+    def refresh_tokens(self, min_validity, interactive):
+        assert not interactive
+        self.refreshes += 1
+        self.token_cache = {
+            'token': 'refreshed-%d' % self.refreshes,
+            'expires': time.time() + 3600, 'refresh': 'refresh-token'}
+        return True
+
+
+def start_agent(oauth2_instance, refresh_margin=token_agent.REFRESH_MARGIN):
+    tmp_dir = tempfile.mkdtemp()
+    agent = token_agent.TokenAgent(
+        oauth2_instance, os.path.join(tmp_dir, 'agent.sock'),
+        refresh_margin=refresh_margin)
+    thread = threading.Thread(target=agent.serve_forever)
+    thread.daemon = True
+    thread.start()
+    for _ in range(100):
+        if agent.server is not None and os.path.exists(agent.socket_path):
+            break
+        time.sleep(0.01)
+    agent.thread = thread
+    return agent, tmp_dir
+
+
+def stop_agent(agent, tmp_dir):
+    agent.shutdown()
+    agent.thread.join()
+    shutil.rmtree(tmp_dir)
+
+
+def test_request_token_without_agent():
+    assert token_agent.request_token('/nonexistent/agent.sock') is None
+
+
+def test_agent_serves_token():
+    oauth2_instance = FakeOAuth2(expires_in=3600)
+    agent, tmp_dir = start_agent(oauth2_instance)
+    try:
+        tokens = token_agent.request_token(agent.socket_path)
+        assert tokens == {'token': 'first',
+                          'expires': oauth2_instance.token_cache['expires']}
+        assert stat.S_IMODE(os.stat(agent.socket_path).st_mode) == 0o600
+        assert oauth2_instance.refreshes == 0
+    finally:
+        stop_agent(agent, tmp_dir)
+
+
+def test_agent_refreshes_before_expiry():
+    oauth2_instance = FakeOAuth2(expires_in=60)
+    agent, tmp_dir = start_agent(oauth2_instance, refresh_margin=600)
+    try:
+        for _ in range(100):
+            if oauth2_instance.refreshes:
+                break
+            time.sleep(0.01)
+        tokens = token_agent.request_token(agent.socket_path)
+        assert tokens['token'] == 'refreshed-1'
+        assert oauth2_instance.refreshes == 1
+    finally:
+        stop_agent(agent, tmp_dir)
+
+
+def test_agent_without_valid_token():
+    oauth2_instance = FakeOAuth2(expires_in=-1)
+    oauth2_instance.refresh_tokens = MagicMock(return_value=False)
+    agent, tmp_dir = start_agent(oauth2_instance)
+    try:
+        assert token_agent.request_token(agent.socket_path) is None
+    finally:
+        stop_agent(agent, tmp_dir)
+
+
+def test_second_agent_does_not_take_over_socket():
+    # The running agent has no valid token, so it answers with an error.
+    oauth2_instance = FakeOAuth2(expires_in=-1)
+    oauth2_instance.refresh_tokens = MagicMock(return_value=False)
+    agent, tmp_dir = start_agent(oauth2_instance)
+    try:
+        second = token_agent.TokenAgent(FakeOAuth2(expires_in=3600),
+                                        agent.socket_path)
+        try:
+            second._bind()
+        except Exception as e:
+            assert 'already listening' in str(e)
+        else:
+            assert False, 'the second agent should have refused to start'
+        assert token_agent.agent_listening(agent.socket_path)
+    finally:
+        stop_agent(agent, tmp_dir)
+
+
+def test_agent_replaces_stale_socket():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        socket_path = os.path.join(tmp_dir, 'agent.sock')
+        # A socket file nobody listens on, as left behind by a crash.
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        assert not token_agent.agent_listening(socket_path)
+
+        agent = token_agent.TokenAgent(FakeOAuth2(expires_in=3600),
+                                       socket_path)
+        agent._bind()
+        try:
+            assert token_agent.agent_listening(socket_path)
+        finally:
+            agent.server.server_close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_build_authorizer_asks_agent_first():
+    oauth2_instance = FakeOAuth2(expires_in=3600)
+    agent, tmp_dir = start_agent(oauth2_instance)
+    try:
+        client = oauth2.CourseraOAuth2(
+            'id', 'secret', 'scopes',
+            token_cache_file=os.path.join(tmp_dir, 'missing', 'cache'),
+            token_agent_socket=agent.socket_path)
+        client._load_token_cache = MagicMock()
+        authorizer = client.build_authorizer()
+        assert authorizer.token == 'first'
+        assert not client._load_token_cache.called
+    finally:
+        stop_agent(agent, tmp_dir)
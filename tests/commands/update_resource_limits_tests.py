@@ -25,6 +25,7 @@ from nose.tools import nottest
 from testfixtures import LogCapture
 from os import remove
 import json
+import tempfile
 
 
 def test_update_resource_limits_parsing():
@@ -164,3 +165,184 @@ def test_update_resource_limits_ok_default_values(mock_oauth, mock_post):
         exit_val = update_resource_limits.command_update_resource_limits(args)
 
     assert exit_val == 0
+
+
+def write_manifest(extension, content):
+    manifest = tempfile.NamedTemporaryFile(
+        'w', suffix=extension, delete=False)
+    with manifest:
+        manifest.write(content)
+    return manifest.name
+
+
+def test_load_manifest_csv():
+    manifest = write_manifest(
+        '.csv',
+        'course,item,part,reservedCpu,reservedMemory,wallClockTimeout\n'
+        'COURSE_ID,ITEM_1,PART_1,2,8192,\n')
+    try:
+        assert update_resource_limits.load_manifest(manifest) == [{
+            'course': 'COURSE_ID', 'item': 'ITEM_1', 'part': 'PART_1',
+            'reservedCpu': 2, 'reservedMemory': 8192,
+            'wallClockTimeout': None,
+        }]
+    finally:
+        remove(manifest)
+
+
+def test_load_manifest_json_rejects_incomplete_target():
+    manifest = write_manifest(
+        '.json', json.dumps({'targets': [{'course': 'C', 'item': 'I'}]}))
+    try:
+        update_resource_limits.load_manifest(manifest)
+    except update_resource_limits.ManifestError:
+        pass
+    else:
+        assert False, 'manifest without a part should be rejected'
+    finally:
+        remove(manifest)
+
+
+def manifest_args(manifest, dry_run=False):
+    args = argparse.Namespace()
+    args.manifest = manifest
+    args.dry_run = dry_run
+    args.workers = 4
+    args.getGraderResourceLimits_endpoint = 'get'
+    args.updateGraderResourceLimits_endpoint = 'update'
+    return args
+
+
+CURRENT_LIMITS = {
+    'PART_1': {'reservedCpu': 1024, 'reservedMemory': 4096},
+    'PART_2': {'reservedCpu': 2048, 'reservedMemory': 8192},
+}
+
+
+def mock_limits_post(url, params, json=None):
+    part = params.split('partId=')[-1]
+    if part not in CURRENT_LIMITS:
+        return MockResponse(404, url, 'not found!')
+    if url == 'get':
+        return MockResponse(200, url, 'OK', CURRENT_LIMITS[part])
+    return MockResponse(200, url, 'OK', json)
+
+
+@patch('coursera_autograder.commands.update_resource_limits.oauth2')
+@patch.object(requests.Session, 'post', side_effect=mock_limits_post)
+def test_update_from_manifest(mock_post, mock_oauth):
+    manifest = write_manifest('.json', json.dumps([
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'PART_1',
+         'reservedCpu': 2, 'reservedMemory': 8192},
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'PART_2',
+         'reservedCpu': 2},
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'MISSING',
+         'reservedCpu': 2},
+    ]))
+    try:
+        with patch('builtins.print') as mock_print, LogCapture():
+            exit_val = update_resource_limits.command_update_resource_limits(
+                manifest_args(manifest))
+    finally:
+        remove(manifest)
+
+    updates = [call for call in mock_post.call_args_list
+               if call[0][0] == 'update']
+    assert len(updates) == 1
+    assert updates[0][1]['params'].endswith('partId=PART_1')
+    assert updates[0][1]['json'] == {
+        'reservedCpu': 2048, 'reservedMemory': 8192, 'wallClockTimeout': None}
+    summary = [line.split(None, 3)[2:] for line in
+               mock_print.call_args_list[-1][0][0].splitlines()]
+    assert summary == [['PART', 'RESULT'],
+                       ['PART_1', 'updated'],
+                       ['PART_2', 'unchanged'],
+                       ['MISSING', 'failed to read']]
+    assert exit_val == 1
+
+
+@patch('coursera_autograder.commands.update_resource_limits.oauth2')
+@patch.object(requests.Session, 'post', side_effect=mock_limits_post)
+def test_update_from_manifest_dry_run(mock_post, mock_oauth):
+    manifest = write_manifest('.json', json.dumps([
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'PART_1',
+         'wallClockTimeout': 600},
+    ]))
+    try:
+        with patch('builtins.print') as mock_print:
+            exit_val = update_resource_limits.command_update_resource_limits(
+                manifest_args(manifest, dry_run=True))
+    finally:
+        remove(manifest)
+
+    assert exit_val == 0
+    assert [call[0][0] for call in mock_post.call_args_list] == ['get']
+    plan = ''.join(call[0][0] for call in mock_print.call_args_list)
+    assert 'Plan: 1 to update, 0 unchanged, 0 could not be read.' in plan
+    assert ['PART_1', 'wallClockTimeout', 'None', '600'] in [
+        line.split()[2:] for line in plan.splitlines()]
+
+
+@patch('coursera_autograder.commands.update_resource_limits.oauth2')
+@patch.object(requests.Session, 'post')
+def test_update_from_manifest_connection_errors(mock_post, mock_oauth):
+    def post(url, params, json=None):
+        part = params.split('partId=')[-1]
+        if (url, part) in [('get', 'PART_1'), ('update', 'PART_2')]:
+            raise requests.exceptions.ConnectionError('Connection reset')
+        return mock_limits_post(url, params, json)
+    mock_post.side_effect = post
+    manifest = write_manifest('.json', json.dumps([
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'PART_1',
+         'reservedCpu': 4},
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'PART_2',
+         'reservedCpu': 4},
+    ]))
+    try:
+        with patch('builtins.print') as mock_print, LogCapture():
+            exit_val = update_resource_limits.command_update_resource_limits(
+                manifest_args(manifest))
+    finally:
+        remove(manifest)
+
+    summary = [line.split(None, 3)[2:] for line in
+               mock_print.call_args_list[-1][0][0].splitlines()]
+    assert summary == [['PART', 'RESULT'],
+                       ['PART_1', 'failed to read'],
+                       ['PART_2', 'failed to update']]
+    assert exit_val == 1
+
+
+class MalformedResponse(MockResponse):
+    def json(self):
+        raise ValueError('Expecting value: line 1 column 1 (char 0)')
+
+
+@patch('coursera_autograder.commands.update_resource_limits.oauth2')
+@patch.object(requests.Session, 'post')
+def test_update_from_manifest_malformed_responses(mock_post, mock_oauth):
+    def post(url, params, json=None):
+        part = params.split('partId=')[-1]
+        if (url, part) in [('get', 'PART_1'), ('update', 'PART_2')]:
+            return MalformedResponse(200, url, '<html>Oops</html>')
+        return mock_limits_post(url, params, json)
+    mock_post.side_effect = post
+    manifest = write_manifest('.json', json.dumps([
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'PART_1',
+         'reservedCpu': 4},
+        {'course': 'COURSE_ID', 'item': 'ITEM', 'part': 'PART_2',
+         'reservedCpu': 4},
+    ]))
+    try:
+        with patch('builtins.print') as mock_print, LogCapture():
+            exit_val = update_resource_limits.command_update_resource_limits(
+                manifest_args(manifest))
+    finally:
+        remove(manifest)
+
+    summary = [line.split(None, 3)[2:] for line in
+               mock_print.call_args_list[-1][0][0].splitlines()]
+    assert summary == [['PART', 'RESULT'],
+                       ['PART_1', 'failed to read'],
+                       ['PART_2', 'failed to update']]
+    assert exit_val == 1
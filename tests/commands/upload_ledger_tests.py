@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import upload_ledger
+from mock import MagicMock
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+DATA = os.urandom(100000)
+
+
+def test_hashing_reader_hashes_retried_chunks_once():
+    reader = upload_ledger.HashingReader(io.BytesIO(DATA))
+
+    reader.read(30000)
+    # Retrying a chunk seeks back and reads it again.
+    reader.seek(10000)
+    reader.read(30000)
+    while reader.read(30000):
+        pass
+
+    assert reader.digests() == {
+        'sha256': hashlib.sha256(DATA).hexdigest(),
+        'md5': hashlib.md5(DATA).hexdigest(),
+        'size': len(DATA),
+    }
+
+
+def test_hashing_reader_hash_to():
+    reader = upload_ledger.HashingReader(io.BytesIO(DATA))
+
+    # A resumed upload starts past the data sent before.
+    reader.hash_to(60000)
+    reader.seek(60000)
+    assert reader.read() == DATA[60000:]
+
+    assert reader.digests()['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_hashing_reader_refuses_to_skip_data():
+    reader = upload_ledger.HashingReader(io.BytesIO(DATA))
+
+    reader.seek(10)
+    try:
+        reader.read(10)
+        assert False, 'Skipped data was not detected.'
+    except ValueError:
+        pass
+
+
+def test_ledger_find_registered():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'grader.zip')
+        with open(path, 'wb') as f:
+            f.write(DATA)
+        identity = upload_ledger.file_identity(path)
+        ledger = upload_ledger.UploadLedger(
+            os.path.join(tmp_dir, 'ledger', 'uploads.jsonl'))
+        assert ledger.find_registered('COURSE_ID', identity) is None
+
+        ledger.record(dict(upload_ledger.file_digests(path),
+                           course='COURSE_ID', graderId='GRADER_ID',
+                           file=identity, imageId='sha256:image'))
+
+        assert ledger.find_registered(
+            'COURSE_ID', identity)['graderId'] == 'GRADER_ID'
+        assert ledger.find_registered(
+            'COURSE_ID', image_id='sha256:image')['graderId'] == 'GRADER_ID'
+        assert ledger.find_registered('OTHER_COURSE', identity) is None
+        # Registered with other settings.
+        assert ledger.find_registered(
+            'COURSE_ID', identity, settings={'reservedCpu': 2048}) is None
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_ledger_find_registered_by_checksum():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'grader.zip')
+        with open(path, 'wb') as f:
+            f.write(DATA)
+        ledger = upload_ledger.UploadLedger(
+            os.path.join(tmp_dir, 'uploads.jsonl'))
+        ledger.record(dict(upload_ledger.file_digests(path),
+                           course='COURSE_ID', graderId='GRADER_ID',
+                           file={'path': '/elsewhere/grader.zip'}))
+        ledger.record({'course': 'COURSE_ID', 'graderId': 'OTHER_GRADER',
+                       'size': 10, 'sha256': 'other'})
+        digests_of = MagicMock(
+            side_effect=lambda: upload_ledger.file_digests(path))
+
+        registered = ledger.find_registered(
+            'COURSE_ID', upload_ledger.file_identity(path),
+            digests_of=digests_of)
+
+        assert registered['graderId'] == 'GRADER_ID'
+        # Only entries of the same size are worth hashing the file for.
+        assert digests_of.call_count == 1
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_ledger_skips_bad_entries():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        ledger = upload_ledger.UploadLedger(
+            os.path.join(tmp_dir, 'uploads.jsonl'))
+        ledger.record({'course': 'COURSE_ID', 'graderId': 'GRADER_ID'})
+        with open(ledger.path, 'a') as f:
+            f.write('{"course": \n')
+
+        assert ledger.entries() == [
+            {'course': 'COURSE_ID', 'graderId': 'GRADER_ID'}]
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -17,11 +17,20 @@
 import argparse
 import docker
 from coursera_autograder import main
+from coursera_autograder.commands import upload
+from coursera_autograder.commands import upload_ledger
 from mock import MagicMock
 from mock import patch
 from nose.tools import nottest
 from testfixtures import LogCapture
 from os import remove
+import io
+import json
+import os
+import requests
+import shutil
+import tempfile
+import zipfile
 
 
 def test_upload_parsing():
@@ -140,3 +149,352 @@ def test_upload_parsing_timeout_too_high():
         assert True
     else:
         assert False, 'parser should have thrown exception'
+
+
+def test_upload_parsing_resumable():
+    parser = main.build_parser()
+
+    zip_file = './test.zip'
+    open(zip_file, 'w')
+
+    args = parser.parse_args('upload {} COURSE_ID '
+                             '--resumable --chunk-size 4 --chunk-retries 2'
+                             .format(zip_file)
+                             .split())
+    assert args.resumable
+    assert args.chunk_size == 4
+    assert args.chunk_retries == 2
+    assert args.upload_session_dir == '~/.coursera/uploads'
+
+    remove(zip_file)
+
+
+@patch('coursera_autograder.commands.upload.idle_transloadit_server')
+@patch('coursera_autograder.commands.upload.create_resumable_assembly')
+@patch('coursera_autograder.commands.upload.resumable_upload.TusClient')
+def test_upload_resumable_resumes_saved_session(
+        client_class, create_assembly, idle_server):
+    session_dir = tempfile.mkdtemp()
+    try:
+        zip_file = os.path.join(session_dir, 'test.zip')
+        with open(zip_file, 'wb') as f:
+            f.write(b'0123456789')
+        args = argparse.Namespace(
+            course='COURSE_ID', transloadit_template='TEMPLATE',
+            upload_session_dir=session_dir, chunk_size=1, chunk_retries=0,
+            quiet=2)
+        client = client_class.return_value
+        client.create.return_value = 'https://tus/files/1'
+        client.upload.side_effect = KeyboardInterrupt
+        create_assembly.return_value = (
+            'https://transloadit/assemblies/1', 'https://tus/files/')
+
+        try:
+            upload.upload_resumable(args, (zip_file, 'test.zip'))
+        except KeyboardInterrupt:
+            pass
+        assert create_assembly.call_count == 1
+
+        # Running again picks up the saved upload at the server's offset.
+        client.resume_offset.return_value = 4
+        client.upload.side_effect = None
+        session, status_url = upload.upload_resumable(
+            args, (zip_file, 'test.zip'))
+        assert status_url == 'https://transloadit/assemblies/1'
+        assert create_assembly.call_count == 1
+        assert client.upload.call_args[0][0] == 'https://tus/files/1'
+        assert client.upload.call_args[0][2:] == (10, 4)
+        session.delete()
+    finally:
+        shutil.rmtree(session_dir)
+
+
+@patch('coursera_autograder.commands.upload.time.sleep')
+@patch('coursera_autograder.commands.upload.poll_transloadit')
+def test_wait_for_assembly_backs_off(poll_transloadit, sleep):
+    poll_transloadit.side_effect = [None, None, None, None, ('bucket', 'key')]
+    args = argparse.Namespace(
+        poll_interval=0.5, poll_max_interval=2, processing_timeout=60)
+
+    assert upload.wait_for_assembly(args, 'URL') == ('bucket', 'key')
+    assert [call[0][0] for call in sleep.call_args_list] == [0.5, 1, 2, 2]
+
+
+@patch('coursera_autograder.commands.upload.time.sleep')
+@patch('coursera_autograder.commands.upload.poll_transloadit')
+def test_wait_for_assembly_times_out(poll_transloadit, sleep):
+    poll_transloadit.return_value = None
+    args = argparse.Namespace(
+        poll_interval=0.5, poll_max_interval=2, processing_timeout=0)
+
+    assert upload.wait_for_assembly(args, 'URL') is None
+    assert not sleep.called
+
+
+@patch('coursera_autograder.commands.upload.requests.post')
+def test_upload_records_bytes_sent(post):
+    def read_body(url, data, headers):
+        while data.read(4):
+            pass
+        return MagicMock()
+    post.side_effect = read_body
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        zip_file = os.path.join(tmp_dir, 'test.zip')
+        with open(zip_file, 'wb') as f:
+            f.write(b'0123456789')
+        args = argparse.Namespace(
+            transloadit_account_id='ACCOUNT', transloadit_template='TEMPLATE')
+        bytes_sent = MagicMock()
+
+        upload.upload(args, 'URL', (zip_file, 'test.zip'), bytes_sent)
+
+        assert bytes_sent.value > 10
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_upload_parsing_from_image():
+    parser = main.build_parser()
+
+    args = parser.parse_args('upload grader.zip COURSE_ID ITEM_ID PART_ID '
+                             '--from-image registry/grader:1'.split())
+    assert args.from_image == 'registry/grader:1'
+    assert args.imageZipFile.endswith('grader.zip')
+    assert args.course == 'COURSE_ID'
+
+
+def test_upload_without_zip_file():
+    args = argparse.Namespace(imageZipFile='/does/not/exist.zip',
+                              from_image=None)
+
+    with LogCapture() as logs:
+        assert upload.command_upload(args) == 1
+    assert 'not a valid file' in logs.records[0].getMessage()
+
+
+def test_stream_multipart():
+    content_type, body = upload.stream_multipart(
+        [('params', '{}')], 'file', ('grader.zip', 'application/x-zip'),
+        io.BytesIO(b'0123456789'), chunk_size=4)
+    body = b''.join(body)
+
+    boundary = content_type.split('boundary=')[1].encode('ascii')
+    parts = body.split(b'--' + boundary)
+    assert parts[0] == b''
+    assert parts[1] == (b'\r\nContent-Disposition: form-data; '
+                        b'name="params"\r\n\r\n{}\r\n')
+    assert parts[2] == (b'\r\nContent-Disposition: form-data; name="file"; '
+                        b'filename="grader.zip"\r\n'
+                        b'Content-Type: application/x-zip\r\n\r\n'
+                        b'0123456789\r\n')
+    assert parts[3] == b'--\r\n'
+
+
+@patch('coursera_autograder.commands.upload.utils.docker_client')
+@patch('coursera_autograder.commands.upload.requests.post')
+def test_upload_image_streams_the_export(post, docker_client):
+    uploaded = []
+
+    def read_body(url, data, headers):
+        uploaded.append(b''.join(data))
+        return MagicMock()
+    post.side_effect = read_body
+    image_data = b'layer' * 1000
+    docker_client.return_value.get_image.return_value = io.BytesIO(image_data)
+    args = argparse.Namespace(
+        from_image='grader', transloadit_account_id='ACCOUNT',
+        transloadit_template='TEMPLATE')
+    bytes_sent = MagicMock(value=0)
+
+    upload.upload_image(args, 'URL', 'grader.zip', bytes_sent)
+
+    assert bytes_sent.value == len(uploaded[0])
+    # The body holds the zip archive between the file's headers and the
+    # closing boundary.
+    archive = uploaded[0].split(b'\r\n\r\n', 2)[2].rsplit(b'\r\n--', 1)[0]
+    with zipfile.ZipFile(io.BytesIO(archive)) as z:
+        assert z.read('grader.tar') == image_data
+
+
+def test_update_assignments_reports_all_failures():
+    args = argparse.Namespace(
+        course='COURSE_ID', item='ITEM_1', part='PART_1',
+        additional_item_and_part=[['ITEM_2', 'PART_2'],
+                                  ['ITEM_3', 'PART_3']],
+        update_part_action='setGridExecutorId',
+        update_part_endpoint='https://example.com/update',
+        update_workers=3)
+    session = MagicMock()
+    ok = MagicMock(status_code=200)
+    failed = MagicMock(status_code=500, url='URL', text='error')
+    session.post.side_effect = lambda url, params, auth: (
+        ok if params['partId'] == 'PART_2' else failed)
+
+    with LogCapture() as logs:
+        assert upload.update_assignments(
+            'auth', 'GRADER_ID', args, session=session) == 1
+
+    assert session.post.call_count == 3
+    summary = [record.getMessage() for record in logs.records
+               if 'unable to update' in record.getMessage()]
+    assert len(summary) == 1
+    assert '2 of 3' in summary[0]
+    assert 'PART_1, PART_3' in summary[0]
+
+
+def test_update_assignments_survives_connection_errors():
+    args = argparse.Namespace(
+        course='COURSE_ID', item='ITEM_1', part='PART_1',
+        additional_item_and_part=[['ITEM_2', 'PART_2']],
+        update_part_action='setGridExecutorId',
+        update_part_endpoint='https://example.com/update',
+        update_workers=1)
+    session = MagicMock()
+
+    def post(url, params, auth):
+        if params['partId'] == 'PART_1':
+            raise requests.exceptions.ConnectionError('Connection reset')
+        return MagicMock(status_code=200)
+    session.post.side_effect = post
+
+    with LogCapture() as logs:
+        assert upload.update_assignments(
+            'auth', 'GRADER_ID', args, session=session) == 1
+
+    # The other part is still updated, and the failure reported.
+    assert session.post.call_count == 2
+    summary = [record.getMessage() for record in logs.records
+               if 'unable to update' in record.getMessage()]
+    assert '1 of 2 assignment parts (PART_1)' in summary[0]
+
+
+def test_update_assignments_succeeds():
+    args = argparse.Namespace(
+        course='COURSE_ID', item='ITEM_1', part='PART_1',
+        additional_item_and_part=None,
+        update_part_action='setGridExecutorId',
+        update_part_endpoint='https://example.com/update',
+        update_workers=2)
+    session = MagicMock()
+    session.post.return_value = MagicMock(status_code=200)
+
+    assert upload.update_assignments(
+        'auth', 'GRADER_ID', args, session=session) == 0
+    params = session.post.call_args[1]['params']
+    assert params['id'] == 'COURSE_ID~ITEM_1'
+    assert params['executorId'] == 'GRADER_ID'
+
+
+def test_register_grader_sends_checksum():
+    args = argparse.Namespace(course='COURSE_ID',
+                              register_endpoint='https://register')
+    session = MagicMock()
+    session.post.return_value = MagicMock(status_code=201, json=lambda: {
+        'elements': [{'id': 'COURSE_ID~GRADER_ID'}]})
+
+    assert upload.register_grader(
+        'auth', args, 'bucket', 'key', session=session,
+        digests={'sha256': 'abc', 'md5': 'def', 'size': 3}) == 'GRADER_ID'
+    request = json.loads(session.post.call_args[1]['data'])
+    assert request['artifactSha256'] == 'abc'
+    assert request['artifactSize'] == 3
+
+
+def test_register_grader_without_checksum_when_rejected():
+    args = argparse.Namespace(course='COURSE_ID',
+                              register_endpoint='https://register')
+    session = MagicMock()
+    session.post.side_effect = [
+        MagicMock(status_code=400, text='Unknown field artifactSha256'),
+        MagicMock(status_code=201, json=lambda: {
+            'elements': [{'id': 'COURSE_ID~GRADER_ID'}]}),
+    ]
+
+    assert upload.register_grader(
+        'auth', args, 'bucket', 'key', session=session,
+        digests={'sha256': 'abc', 'md5': 'def', 'size': 3}) == 'GRADER_ID'
+    request = json.loads(session.post.call_args[1]['data'])
+    assert 'artifactSha256' not in request
+    assert request['key'] == 'key'
+
+
+def test_register_grader_reports_other_bad_requests():
+    args = argparse.Namespace(course='COURSE_ID',
+                              register_endpoint='https://register')
+    session = MagicMock()
+    session.post.return_value = MagicMock(
+        status_code=400, text='Invalid reservedMemory')
+
+    with LogCapture():
+        try:
+            upload.register_grader(
+                'auth', args, 'bucket', 'key', session=session,
+                digests={'sha256': 'abc', 'md5': 'def', 'size': 3})
+        except Exception:
+            pass
+        else:
+            assert False, 'The bad request should have been reported'
+    # Not retried without the checksum.
+    assert session.post.call_count == 1
+
+
+def test_verify_upload():
+    digests = {'sha256': 'abc', 'md5': 'def', 'size': 3}
+
+    assert upload.verify_upload(('bucket', 'key'), digests)
+    assert upload.verify_upload(
+        ('bucket', 'key', {'md5hash': 'def', 'size': 3}), digests)
+    with LogCapture():
+        assert not upload.verify_upload(
+            ('bucket', 'key', {'md5hash': 'def', 'size': 4}), digests)
+        assert not upload.verify_upload(
+            ('bucket', 'key', {'md5hash': 'xyz', 'size': 3}), digests)
+
+
+@patch('coursera_autograder.commands.upload.send_image')
+@patch('coursera_autograder.commands.upload.oauth2')
+def test_upload_skips_registered_image(oauth2, send_image):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        zip_file = os.path.join(tmp_dir, 'grader.zip')
+        with open(zip_file, 'wb') as f:
+            f.write(b'grader')
+        ledger = upload_ledger.UploadLedger(
+            os.path.join(tmp_dir, 'uploads.jsonl'))
+        args = argparse.Namespace(
+            imageZipFile=zip_file, course='COURSE_ID', item=None, part=None,
+            update_workers=1, upload_ledger=ledger.path, force=False,
+            grader_cpu=1, grader_memory_limit=4096, grader_timeout=None)
+        ledger.record(dict(upload_ledger.file_digests(zip_file),
+                           course='COURSE_ID', graderId='GRADER_ID',
+                           file=upload_ledger.file_identity(zip_file),
+                           settings=upload.registration_settings(args)))
+
+        with LogCapture() as logs:
+            assert upload.command_upload(args) == 0
+        assert 'already registered' in logs.records[0].getMessage()
+        assert not send_image.called
+
+        # Not with other resource limits.
+        send_image.return_value = None
+        args.grader_memory_limit = 8192
+        assert upload.command_upload(args) == 1
+        assert send_image.call_count == 1
+        args.grader_memory_limit = 4096
+
+        # Unless forced to upload it again.
+        args.force = True
+        assert upload.command_upload(args) == 1
+        assert send_image.call_count == 2
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_assembly_url_follows_bored_api_scheme():
+    args = argparse.Namespace(
+        transloadit_bored_api='http://127.0.0.1:8080/instances/bored')
+    assert upload.assembly_url(args, '127.0.0.1:8080', 'ID') == \
+        'http://127.0.0.1:8080/assemblies/ID'
+    assert upload.assembly_url(argparse.Namespace(), 'host', 'ID') == \
+        'https://host/assemblies/ID'
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder import main
+from coursera_autograder.commands import validate_feedback
+from mock import patch
+from os import path
+import io
+import json
+import os
+import shutil
+import tempfile
+
+
+def write_feedback(dst_dir, name, document):
+    os.makedirs(path.join(dst_dir, name))
+    with open(path.join(dst_dir, name, 'feedback.json'), 'w') as f:
+        json.dump(document, f)
+
+
+def parse_args(argv):
+    return main.build_parser(['validate_feedback']).parse_args(
+        ['validate_feedback'] + argv)
+
+
+def test_validate_feedback_parsing():
+    args = parse_args(['out', 'feedback.json', '--max-feedback-size', '16'])
+
+    assert args.func == validate_feedback.command_validate_feedback
+    assert args.paths == ['out', 'feedback.json']
+    assert args.max_feedback_size == 16
+    assert not args.strict
+    assert parse_args(['out']).max_feedback_size is None
+
+
+def test_command_validate_feedback():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        write_feedback(dst_dir, 'good', {'fractionalScore': 1,
+                                         'feedback': 'x' * 2048})
+        write_feedback(dst_dir, 'bad', {'fractionalScore': 2})
+
+        stdout = io.StringIO()
+        with patch('sys.stdout', stdout):
+            assert validate_feedback.command_validate_feedback(
+                parse_args([dst_dir])) == 1
+
+        bad = path.join(dst_dir, 'bad', 'feedback.json')
+        assert stdout.getvalue().splitlines() == [
+            "%s: Field 'fractionalScore' must be <= 1." % bad,
+            "%s: Field 'feedback' not present in parsed output." % bad,
+            "%s: OK" % path.join(dst_dir, 'good', 'feedback.json')]
+
+        # The size of the feedback is only checked if asked to.
+        stdout = io.StringIO()
+        with patch('sys.stdout', stdout):
+            assert validate_feedback.command_validate_feedback(parse_args([
+                path.join(dst_dir, 'good'), '--max-feedback-size', '1',
+                '--format', 'jsonl'])) == 1
+        row = json.loads(stdout.getvalue())
+        assert not row['valid']
+        assert 'more than the limit of 1024' in row['errors'][0]
+
+        # As are the stricter checks.
+        write_feedback(dst_dir, 'typo', {'isCorrect': True, 'feedback': '',
+                                         'feedbackTyp': 'HTML'})
+        typo = path.join(dst_dir, 'typo')
+        with patch('sys.stdout', io.StringIO()):
+            assert validate_feedback.command_validate_feedback(
+                parse_args([typo])) == 0
+        stdout = io.StringIO()
+        with patch('sys.stdout', stdout):
+            assert validate_feedback.command_validate_feedback(
+                parse_args([typo, '--strict'])) == 1
+        assert "Unknown field 'feedbackTyp'." in stdout.getvalue()
+    finally:
+        shutil.rmtree(dst_dir)
+
+
+def test_command_validate_feedback_nothing_found():
+    dst_dir = tempfile.mkdtemp()
+    try:
+        assert validate_feedback.command_validate_feedback(
+            parse_args([dst_dir])) == 1
+
+        stdout = io.StringIO()
+        with patch('sys.stdout', stdout):
+            assert validate_feedback.command_validate_feedback(
+                parse_args([path.join(dst_dir, 'feedback.json')])) == 1
+        assert 'Could not read the feedback' in stdout.getvalue()
+    finally:
+        shutil.rmtree(dst_dir)
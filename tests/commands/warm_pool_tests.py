@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder.commands import warm_pool
+from mock import MagicMock
+from requests.exceptions import ReadTimeout
+import io
+import tarfile
+
+
+def make_docker_mock():
+    docker_mock = MagicMock()
+    docker_mock.inspect_image.return_value = {
+        'Id': 'sha256:abcdef',
+        'Config': {
+            'Entrypoint': ['/grader/run.sh'],
+            'Cmd': ['--verbose'],
+        },
+    }
+    docker_mock.exec_inspect.return_value = {'Running': False, 'ExitCode': 0}
+    docker_mock.diff.return_value = [
+        {'Path': '/tmp', 'Kind': 0},
+        {'Path': '/tmp/.coursera_autograder', 'Kind': 1},
+        {'Path': '/shared', 'Kind': 1},
+    ]
+    docker_mock.top.return_value = {'Processes': [['1', 'sh'], ['7', 'sleep']]}
+    return docker_mock
+
+
+def test_pool_key_depends_on_host_config():
+    key_1g = warm_pool.pool_key('sha256:abc', {'Memory': 1024})
+    key_2g = warm_pool.pool_key('sha256:abc', {'Memory': 2048})
+    assert key_1g != key_2g
+    assert key_1g == warm_pool.pool_key('sha256:abc', {'Memory': 1024})
+
+
+def test_acquire_claims_paused_container():
+    docker_mock = make_docker_mock()
+    docker_mock.containers.return_value = [{'Id': 'taken'}, {'Id': 'free'}]
+    docker_mock.unpause.side_effect = [Exception('not paused'), None]
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+
+    assert pool.acquire() == 'free'
+    assert not docker_mock.create_container.called
+
+
+def test_acquire_creates_container_when_none_idle():
+    docker_mock = make_docker_mock()
+    docker_mock.containers.return_value = []
+    docker_mock.create_container.return_value = {'Id': 'new'}
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {'a': 'b'})
+
+    assert pool.acquire() == 'new'
+    docker_mock.create_container.assert_called_with(
+        image='myimage',
+        entrypoint=warm_pool.IDLE_COMMAND,
+        command=[],
+        host_config={'a': 'b'},
+        labels={warm_pool.WARM_LABEL: pool.key},
+    )
+    docker_mock.start.assert_called_with('new')
+
+
+def test_run_copies_submission_and_execs_grader():
+    docker_mock = make_docker_mock()
+    docker_mock.exec_create.side_effect = [{'Id': 'reset'}, {'Id': 'grade'}]
+    docker_mock.exec_inspect.side_effect = [
+        {'Running': False, 'ExitCode': 0},
+        {'Running': False, 'ExitCode': 3},
+    ]
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+
+    exit_code = pool.run('container', '/tmp', {'partId': 'abc'}, 10)
+
+    assert exit_code == 3
+    assert docker_mock.put_archive.call_args[0][:2] == ('container', '/shared')
+    grade_command = docker_mock.exec_create.call_args_list[1][0][1]
+    assert grade_command[-3:] == [
+        'partId=abc', '/grader/run.sh', '--verbose']
+
+
+def test_run_times_out():
+    docker_mock = make_docker_mock()
+    docker_mock.exec_inspect.side_effect = [
+        {'Running': False, 'ExitCode': 0},
+        {'Running': True, 'ExitCode': None},
+    ]
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+    try:
+        pool.run('container', '/tmp', {}, 0.01)
+    except ReadTimeout:
+        pass
+    else:
+        assert False, 'run should have timed out'
+
+
+def test_logs():
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        for name, data in [('stdout', b'out'), ('stderr', b'err')]:
+            info = tarfile.TarInfo('.coursera_autograder/' + name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    archive.seek(0)
+    docker_mock = make_docker_mock()
+    docker_mock.get_archive.return_value = (archive, {})
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+
+    assert pool.logs('container') == (b'out', b'err')
+
+
+def test_refuses_images_with_volumes():
+    docker_mock = make_docker_mock()
+    docker_mock.inspect_image.return_value['Config']['Volumes'] = {
+        '/shared': {}, '/data': {}}
+    try:
+        warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+    except ValueError as e:
+        assert '/data' in str(e)
+    else:
+        assert False, 'The image should have been refused'
+
+
+def test_release_pauses_reset_container():
+    docker_mock = make_docker_mock()
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+
+    pool.release('container')
+
+    docker_mock.pause.assert_called_with('container')
+    assert not docker_mock.remove_container.called
+
+
+def test_release_discards_changed_container():
+    for (changes, processes) in [
+            ([{'Path': '/tmp/cache', 'Kind': 1}], []),
+            ([{'Path': '/root/.bashrc', 'Kind': 0}], []),
+            ([{'Path': '/grader/data', 'Kind': 2}], []),
+            ([], [['1', 'sh'], ['7', 'sleep'], ['9', 'python']])]:
+        docker_mock = make_docker_mock()
+        docker_mock.diff.return_value += changes
+        docker_mock.top.return_value['Processes'] += processes
+        pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+
+        pool.release('container')
+
+        assert not docker_mock.pause.called, changes
+        docker_mock.remove_container.assert_called_with(
+            'container', force=True)
+
+
+def test_scratch_paths():
+    docker_mock = make_docker_mock()
+    docker_mock.inspect_image.return_value['Config']['Labels'] = {
+        warm_pool.SCRATCH_LABEL: '/root/.cache, /home/jovyan/.ipython/'}
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {},
+                                       scratch_paths=['/tmp'])
+    assert pool.scratch_paths == [
+        '/root/.cache', '/home/jovyan/.ipython', '/tmp']
+    assert '/root/.cache/* /root/.cache/.[!.]* /root/.cache/..?*' in \
+        pool.reset_script
+
+    pool.run('container', '/tmp', {}, 10)
+    assert docker_mock.exec_create.call_args_list[0][0][1] == [
+        '/bin/sh', '-c', pool.reset_script]
+
+    # Caches written to the scratch paths do not prevent reuse...
+    docker_mock.diff.return_value += [
+        {'Path': '/root', 'Kind': 0},
+        {'Path': '/root/.cache', 'Kind': 1},
+        {'Path': '/home/jovyan/.ipython', 'Kind': 0},
+    ]
+    pool.release('container')
+    docker_mock.pause.assert_called_with('container')
+
+    # ...unless files of the image were removed from them.
+    docker_mock.diff.return_value += [
+        {'Path': '/home/jovyan/.ipython/profile_default', 'Kind': 2},
+        {'Path': '/home/jovyan/.bashrc', 'Kind': 1},
+    ]
+    pool.release('container')
+    docker_mock.remove_container.assert_called_with('container', force=True)
+
+    summary = pool.summary()
+    assert '1 containers were returned to the pool and 1 removed' in summary
+    assert '/home/jovyan (1)' in summary
+
+
+def test_invalid_scratch_paths():
+    for scratch_paths in [['relative'], ['/'], ['/..']]:
+        try:
+            warm_pool.WarmContainerPool(make_docker_mock(), 'myimage', {},
+                                        scratch_paths=scratch_paths)
+        except ValueError:
+            pass
+        else:
+            assert False, '%s should have been refused' % scratch_paths
+
+
+def test_summary_counts_reuse():
+    docker_mock = make_docker_mock()
+    docker_mock.containers.side_effect = [[{'Id': 'idle'}], []]
+    docker_mock.create_container.return_value = {'Id': 'new'}
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+
+    assert pool.acquire() == 'idle'
+    assert pool.acquire() == 'new'
+    pool.release('idle')
+    pool.discard('new')
+
+    assert pool.summary() == (
+        '1 runs reused a warm container and 1 created one; 1 containers were '
+        'returned to the pool and 1 removed.')
+
+
+def test_release_discards_container_that_cannot_be_reset():
+    docker_mock = make_docker_mock()
+    docker_mock.pause.side_effect = Exception('gone')
+    pool = warm_pool.WarmContainerPool(docker_mock, 'myimage', {})
+
+    pool.release('container')
+
+    docker_mock.remove_container.assert_called_with('container', force=True)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Coursera
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from coursera_autograder import main
+import json
+from mock import patch
+import subprocess
+import sys
+
+# Modules only some subcommands need, which must not be loaded to run others.
+HEAVY_MODULES = ['docker', 'requests_toolbelt', 'multiprocessing', 'tarfile',
+                 'http.server', 'pickle']
+
+
+def loaded_modules(argv):
+    "Returns the modules loaded to build argv's parser, in a new process."
+    code = ('import json, sys\n'
+            'from coursera_autograder import main\n'
+            'main.build_parser(main.requested_subcommands(%r))\n'
+            'print(json.dumps(sorted(sys.modules)))\n' % (argv, ))
+    return json.loads(subprocess.check_output([sys.executable, '-c', code]))
+
+
+def test_requested_subcommands():
+    assert main.requested_subcommands(['get_status', 'GRADER']) == \
+        ['get_status']
+    assert main.requested_subcommands(
+        ['-vvv', 'list_graders', 'COURSE']) == ['list_graders']
+    assert main.requested_subcommands(['--help']) is None
+    # Option values are not subcommands.
+    assert main.requested_subcommands(
+        ['-c', 'grade', 'get_status', 'COURSE']) == ['get_status']
+    assert main.requested_subcommands(
+        ['--docker-url', 'upload', '--timeout=5', 'grade', 'local']) == \
+        ['grade']
+    assert main.requested_subcommands(['get_status', '--help']) == \
+        ['get_status']
+    # Options that cannot be parsed are left to the full parser to report.
+    assert main.requested_subcommands(
+        ['--timeout', 'never', 'get_status']) is None
+    assert main.requested_subcommands([]) is None
+
+
+def test_commands_package_api():
+    from coursera_autograder import commands
+    assert commands.upload.command_upload
+    assert commands.validate_feedback.command_validate_feedback
+    assert all(getattr(commands, name) for name in commands.__all__)
+    try:
+        commands.missing
+    except AttributeError:
+        pass
+    else:
+        assert False, 'commands.missing should not resolve'
+
+
+def test_build_parser_for_one_subcommand():
+    parser = main.build_parser(['get_status'])
+    args = parser.parse_args('get_status COURSE_ID GRADER_ID'.split())
+    assert args.course == 'COURSE_ID'
+    assert args.graderId == 'GRADER_ID'
+    try:
+        with patch('sys.stderr'):
+            parser.parse_args('list_graders COURSE_ID'.split())
+    except SystemExit:
+        pass
+    else:
+        assert False, 'list_graders should not have been registered'
+
+
+def test_query_commands_start_without_heavy_modules():
+    for subcommand in ['configure', 'get_status', 'list_graders',
+                       'get_resource_limits']:
+        modules = loaded_modules([subcommand])
+        for module in HEAVY_MODULES:
+            assert module not in modules, \
+                '%s loaded %s' % (subcommand, module)
+        assert 'coursera_autograder.commands.upload' not in modules
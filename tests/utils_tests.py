@@ -64,3 +64,11 @@ def test_no_timeout():
     parser = main.build_parser()
     args = parser.parse_args('configure'.split())
     assert args.timeout == 60
+
+
+def test_api_session_pools_connections():
+    auth = object()
+    session = utils.api_session(auth, pool_size=4)
+    adapter = session.get_adapter('https://api.coursera.org/')
+    assert session.auth is auth
+    assert adapter._pool_maxsize == 4